@@ -0,0 +1,152 @@
+"""
+Planning for batches of AI-proposed inventory actions
+Resolves every item name through the fuzzy name index, loads the items in one
+query and validates the whole batch against simulated stock levels, so the
+batch can be applied in one transaction or returned as a dry run
+"""
+
+from item_resolver import item_resolver, normalize_name
+
+ACTION_TYPES = ('add_item', 'update_quantity', 'record_transaction', 'delete_item')
+TRANSACTION_TYPES = ('usage', 'waste', 'donation', 'purchase')
+OUTFLOW_TYPES = ('usage', 'waste', 'donation')
+MAX_ACTIONS = 100
+# Rows per IN (...) lookup, under SQLite's bound parameter limit
+LOOKUP_BATCH = 900
+
+
+class ActionError(ValueError):
+    """An action that cannot be applied"""
+
+
+def _number(data, field, default=None, minimum=0):
+    value = data.get(field, default)
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ActionError(f"{field} must be a number")
+    if value < minimum:
+        raise ActionError(f"{field} must not be below {minimum}")
+    return value
+
+
+def load_items(cursor, item_ids):
+    """Item id -> item state for the given items, in one lookup per 900 ids"""
+    item_ids = sorted(item_ids)
+    items = {}
+    for offset in range(0, len(item_ids), LOOKUP_BATCH):
+        batch = item_ids[offset:offset + LOOKUP_BATCH]
+        cursor.execute(f'''
+            SELECT id, name, current_quantity FROM inventory
+            WHERE id IN ({', '.join('?' * len(batch))})
+        ''', batch)
+        for item_id, name, quantity in cursor.fetchall():
+            items[item_id] = {'id': item_id, 'name': name, 'current_quantity': quantity or 0, 'deleted': False}
+    return items
+
+
+def plan_actions(cursor, actions):
+    """Validate a batch and simulate its effect on stock
+
+    Returns (steps, errors). Each step holds the action type, the item state
+    it applies to (shared between steps on the same item, with id None until
+    a new item is inserted), the quantity before and after, and the
+    transaction to record as (type, quantity, cost, notes) or None. errors
+    lists {'index', 'error'} for every invalid action; the batch should only
+    be applied when it is empty.
+    """
+    if not isinstance(actions, list) or not actions:
+        raise ValueError("actions must be a non-empty list")
+    if len(actions) > MAX_ACTIONS:
+        raise ValueError(f"At most {MAX_ACTIONS} actions can be applied at once")
+
+    names = {
+        str((action.get('data') or {}).get('name') or '').strip()
+        for action in actions if isinstance(action, dict)
+    }
+    matches = {name: item_resolver.resolve(cursor, name) for name in names if name}
+    items = load_items(cursor, {match['id'] for match in matches.values() if match})
+    # Normalized name -> state of the items added by this batch
+    added = {}
+    steps = []
+    errors = []
+    for index, action in enumerate(actions):
+        try:
+            if not isinstance(action, dict):
+                raise ActionError("Each action must be an object")
+            steps.append(_plan_action(cursor, items, added, matches, index, action.get('type'), action.get('data') or {}))
+        except ActionError as e:
+            errors.append({'index': index, 'error': str(e)})
+    return steps, errors
+
+
+def _not_found(cursor, name):
+    suggestions = [candidate['name'] for candidate in item_resolver.candidates(cursor, name, 3)]
+    message = f"Item '{name}' not found in inventory"
+    if suggestions:
+        message += f"; did you mean {', '.join(suggestions)}?"
+    return ActionError(message)
+
+
+def _plan_action(cursor, items, added, matches, index, action_type, data):
+    if action_type not in ACTION_TYPES:
+        raise ActionError(f"Unknown action type: {action_type}")
+    name = str(data.get('name') or '').strip()
+    if not name:
+        raise ActionError("Each action needs an item name")
+    key = normalize_name(name)
+    match = matches.get(name)
+    item = added.get(key)
+    if item is None and match:
+        # A fuzzy match is close enough to act on, but not to block adding a new item
+        if action_type != 'add_item' or match['match'] != 'fuzzy':
+            item = items.get(match['id'])
+    if item is not None and item['deleted']:
+        item = None
+
+    if action_type == 'add_item':
+        if item is not None:
+            raise ActionError(f"Item '{item['name']}' already exists; use update_quantity to change its stock")
+        quantity = _number(data, 'current_quantity', 0)
+        for field in ('min_quantity', 'max_quantity', 'cost_per_unit', 'total_cost'):
+            _number(data, field)
+        item = added[key] = {'id': None, 'name': name, 'current_quantity': quantity, 'deleted': False}
+        transaction = ('purchase', quantity, data.get('total_cost', 0), 'AI-suggested purchase') if quantity > 0 else None
+        return {'index': index, 'type': action_type, 'data': data, 'item': item,
+                'quantity_before': 0, 'quantity_after': quantity, 'transaction': transaction}
+
+    if item is None:
+        raise _not_found(cursor, name)
+    quantity_before = item['current_quantity']
+
+    if action_type == 'update_quantity':
+        quantity_after = _number(data, 'current_quantity', 0)
+        change = quantity_after - quantity_before
+        transaction = None
+        if change:
+            transaction = ('purchase' if change > 0 else 'usage', abs(change), 0, 'AI-suggested quantity update')
+    elif action_type == 'record_transaction':
+        transaction_type = data.get('transaction_type', 'usage')
+        if transaction_type not in TRANSACTION_TYPES:
+            raise ActionError(f"transaction_type must be one of {', '.join(TRANSACTION_TYPES)}")
+        quantity = _number(data, 'quantity', 0)
+        if quantity <= 0:
+            raise ActionError("quantity must be a positive number")
+        if transaction_type in OUTFLOW_TYPES:
+            if quantity > quantity_before:
+                raise ActionError(f"Only {round(quantity_before, 2)} of '{item['name']}' on hand")
+            quantity_after = quantity_before - quantity
+        else:
+            quantity_after = quantity_before + quantity
+        transaction = (transaction_type, quantity, 0, data.get('notes', 'AI-suggested action'))
+    else:
+        # Later actions in the batch can no longer find the item
+        item['deleted'] = True
+        quantity_after = 0
+        transaction = None
+
+    item['current_quantity'] = quantity_after
+    return {'index': index, 'type': action_type, 'data': data, 'item': item,
+            'quantity_before': quantity_before, 'quantity_after': quantity_after, 'transaction': transaction}
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Inventory analytics helpers
+Maintenance for the daily_item_rollup table that the analytics endpoints read,
+the time-bucketed query builder over it, the combined dashboard snapshot and
+the cache of closed-week totals behind it
+
+Usage: python analytics.py rebuild-rollup
+"""
+
+import argparse
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from inventory_context import get_table_versions
+
+SNAPSHOT_WEEKS = 10
+TRACKED_TYPES = ('usage', 'waste', 'donation', 'purchase')
+MAX_RANGE_DAYS = 3660
+
+# Bucket start date for each granularity. 'week' counts 7-day buckets back
+# from the end of the range, so the last bucket always holds the final 7 days;
+# 'isoweek' buckets are calendar weeks starting on Monday.
+BUCKETS = {
+    'day': "r.day",
+    'week': "date(:end, printf('-%d days', (CAST(julianday(:end) - julianday(r.day) AS INTEGER) / 7) * 7 + 6))",
+    'isoweek': "date(r.day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', r.day)"
+}
+
+# group-by name -> (select expressions with output names, group expression)
+DIMENSIONS = {
+    'item': ([('r.inventory_id', 'item_id'), ('i.name', 'item'), ('i.unit', 'unit')], 'r.inventory_id'),
+    'category': ([("COALESCE(i.category, 'Uncategorized')", 'category')], "COALESCE(i.category, 'Uncategorized')"),
+    'supplier': ([("COALESCE(i.supplier, 'Unknown')", 'supplier')], "COALESCE(i.supplier, 'Unknown')"),
+    'transaction_type': ([('r.transaction_type', 'transaction_type')], 'r.transaction_type')
+}
+
+MEASURES = {
+    'quantity': 'SUM(r.quantity)',
+    # Valued at each transaction's recorded unit cost, so past buckets never change
+    'cost': 'SUM(r.value)',
+    'transactions': 'SUM(r.transaction_count)'
+}
+
+# Last computed snapshot as (etag, payload)
+_snapshot_cache = {}
+
+# In-memory copy of weekly_aggregates: week_start -> (totals, money_wasted),
+# valid while the table's version counter is unchanged
+_closed_weeks = {'version': None, 'weeks': {}}
+_closed_weeks_lock = threading.Lock()
+
+
+def rebuild_daily_rollup(conn):
+    """Recompute daily_item_rollup from inventory_transactions in one transaction"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM daily_item_rollup')
+    cursor.execute('DELETE FROM weekly_aggregates')
+    cursor.execute('''
+        INSERT INTO daily_item_rollup (day, inventory_id, transaction_type, quantity, cost, value, transaction_count)
+        SELECT COALESCE(date(t.date), t.date), t.inventory_id, t.transaction_type,
+               SUM(t.quantity), SUM(COALESCE(t.cost, 0)),
+               SUM(t.quantity * COALESCE(t.unit_cost, i.cost_per_unit, 0)), COUNT(*)
+        FROM inventory_transactions t
+        LEFT JOIN inventory i ON t.inventory_id = i.id
+        WHERE t.inventory_id IS NOT NULL
+        GROUP BY COALESCE(date(t.date), t.date), t.inventory_id, t.transaction_type
+    ''')
+    rows = cursor.rowcount
+    conn.commit()
+    return rows
+
+
+def parse_day(value, default):
+    """Parse a YYYY-MM-DD query parameter"""
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def build_bucket_query(start, end, granularity='week', group_by=(), measures=('quantity',),
+                       transaction_types=None):
+    """Compile an analytics request into one SQL query over daily_item_rollup
+
+    The range filter is on the rollup's leading primary-key column, so only
+    the requested days are read however much history is stored.
+    Returns (sql, params, column_names).
+    """
+    if granularity not in BUCKETS:
+        raise ValueError(f"granularity must be one of {', '.join(BUCKETS)}")
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown group_by '{dimension}', expected one of {', '.join(DIMENSIONS)}")
+    for measure in measures:
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure '{measure}', expected one of {', '.join(MEASURES)}")
+    if not measures:
+        raise ValueError("At least one measure is required")
+    if end < start:
+        raise ValueError("end must not be before start")
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is limited to {MAX_RANGE_DAYS} days")
+
+    select = [f"{BUCKETS[granularity]} as bucket"]
+    columns = ['bucket']
+    group = ['bucket']
+    for dimension in group_by:
+        expressions, group_expression = DIMENSIONS[dimension]
+        for expression, name in expressions:
+            select.append(f"{expression} as {name}")
+            columns.append(name)
+        group.append(group_expression)
+    for measure in measures:
+        select.append(f"{MEASURES[measure]} as {measure}")
+        columns.append(measure)
+
+    params = {'start': start.isoformat(), 'end': end.isoformat()}
+    where = ['r.day >= :start', 'r.day <= :end']
+    if transaction_types:
+        placeholders = []
+        for index, transaction_type in enumerate(transaction_types):
+            params[f'type{index}'] = transaction_type
+            placeholders.append(f':type{index}')
+        where.append(f"r.transaction_type IN ({', '.join(placeholders)})")
+
+    sql = f'''
+        SELECT {', '.join(select)}
+        FROM daily_item_rollup r
+        LEFT JOIN inventory i ON r.inventory_id = i.id
+        WHERE {' AND '.join(where)}
+        GROUP BY {', '.join(group)}
+        ORDER BY {', '.join(group)}
+    '''
+    return sql, params, columns
+
+
+def run_bucket_query(cursor, start, end, granularity='week', group_by=(), measures=('quantity',),
+                     transaction_types=None, precision=2):
+    """Run a bucketed analytics query, returning one dict per bucket and group
+
+    Measures are rounded to precision decimals; pass None when the rows will
+    be summed further so rounding happens once, on the totals.
+    """
+    sql, params, columns = build_bucket_query(start, end, granularity, group_by, measures, transaction_types)
+    cursor.execute(sql, params)
+    rows = []
+    for row in cursor.fetchall():
+        entry = dict(zip(columns, row))
+        for measure in measures:
+            entry[measure] = entry[measure] or 0
+            if precision is not None:
+                entry[measure] = round(entry[measure], precision)
+        rows.append(entry)
+    return rows
+
+
+def week_label(week_number):
+    """Chart label for a week number (1 = current week)"""
+    return 'Current Week' if week_number == 1 else f'Week -{week_number - 1}'
+
+
+def week_start_of(day):
+    """Monday of the ISO week containing day"""
+    return day - timedelta(days=day.weekday())
+
+
+def reset_closed_week_cache():
+    """Drop the in-memory closed weeks, e.g. when switching databases"""
+    with _closed_weeks_lock:
+        _closed_weeks['version'] = None
+        _closed_weeks['weeks'] = {}
+
+
+def _weekly_aggregates_version(cursor):
+    cursor.execute("SELECT version FROM table_versions WHERE table_name = 'weekly_aggregates'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _sync_closed_weeks(cursor):
+    """Reload the in-memory weeks if the persisted table changed"""
+    version = _weekly_aggregates_version(cursor)
+    if version == _closed_weeks['version']:
+        return
+    cursor.execute('SELECT week_start, used, wasted, donated, purchased, money_wasted FROM weekly_aggregates')
+    _closed_weeks['weeks'] = {
+        row[0]: (dict(zip(TRACKED_TYPES, row[1:5])), row[5]) for row in cursor.fetchall()
+    }
+    _closed_weeks['version'] = version
+
+
+def closed_week_totals(cursor, week_starts):
+    """Totals for finished ISO weeks, computing and persisting any not cached
+
+    Rows of weekly_aggregates are deleted by triggers when a transaction is
+    written into their week, so only weeks touched by back-dated writes are
+    recomputed. Returns week_start -> (totals by transaction type, money wasted).
+    """
+    keys = [week_start.isoformat() for week_start in week_starts]
+    with _closed_weeks_lock:
+        _sync_closed_weeks(cursor)
+        if any(key not in _closed_weeks['weeks'] for key in keys):
+            # Hold the write lock so no back-dated write can slip in between
+            # computing a week and persisting it
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                _sync_closed_weeks(cursor)
+                missing = [week_start for week_start in week_starts
+                           if week_start.isoformat() not in _closed_weeks['weeks']]
+                if missing:
+                    _compute_closed_weeks(cursor, missing)
+                _closed_weeks['version'] = _weekly_aggregates_version(cursor)
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                _closed_weeks['version'] = None
+                raise
+        return {key: _closed_weeks['weeks'][key] for key in keys}
+
+
+def _compute_closed_weeks(cursor, week_starts):
+    computed = {week_start.isoformat(): (dict.fromkeys(TRACKED_TYPES, 0), 0) for week_start in week_starts}
+    rows = run_bucket_query(
+        cursor, min(week_starts), max(week_starts) + timedelta(days=6), granularity='isoweek',
+        group_by=('transaction_type',), measures=('quantity', 'cost'), precision=None
+    )
+    for row in rows:
+        if row['bucket'] not in computed or row['transaction_type'] not in TRACKED_TYPES:
+            continue
+        totals, money_wasted = computed[row['bucket']]
+        totals[row['transaction_type']] += row['quantity']
+        if row['transaction_type'] == 'waste':
+            computed[row['bucket']] = (totals, money_wasted + row['cost'])
+
+    cursor.executemany('''
+        INSERT OR REPLACE INTO weekly_aggregates
+        (week_start, iso_week, used, wasted, donated, purchased, money_wasted)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (key, '{}-W{:02d}'.format(*datetime.strptime(key, '%Y-%m-%d').isocalendar()[:2]),
+         *(totals[name] for name in TRACKED_TYPES), money_wasted)
+        for key, (totals, money_wasted) in computed.items()
+    ])
+    _closed_weeks['weeks'].update(computed)
+
+
+def snapshot_etag(cursor):
+    """ETag for the dashboard snapshot
+
+    Changes whenever inventory or transactions change, and at midnight UTC
+    when the current week may roll over.
+    """
+    versions = dict(get_table_versions(cursor))
+    today = datetime.utcnow().date().isoformat()
+    return f"snapshot-{versions.get('inventory', 0)}-{versions.get('inventory_transactions', 0)}-{today}"
+
+
+def build_dashboard_snapshot(cursor, weeks=SNAPSHOT_WEEKS):
+    """Compute every dashboard chart for the last `weeks` ISO weeks
+
+    Week 1 is the current week so far. Earlier weeks come from the closed-week
+    cache, so normally only the current week is aggregated.
+    """
+    today = datetime.utcnow().date()
+    current_week = week_start_of(today)
+
+    totals = {}
+    money_wasted = {}
+    closed_weeks = [current_week - timedelta(weeks=week - 1) for week in range(2, weeks + 1)]
+    closed = closed_week_totals(cursor, closed_weeks)
+    for week, week_start in enumerate(closed_weeks, start=2):
+        week_totals, week_money = closed[week_start.isoformat()]
+        totals[week] = dict(week_totals)
+        money_wasted[week] = week_money
+
+    totals[1] = dict.fromkeys(TRACKED_TYPES, 0)
+    money_wasted[1] = 0
+    wasted_items = []
+    rows = run_bucket_query(
+        cursor, current_week, today, granularity='isoweek',
+        group_by=('item', 'transaction_type'), measures=('quantity', 'cost'), precision=None
+    )
+    for row in rows:
+        transaction_type = row['transaction_type']
+        if transaction_type not in TRACKED_TYPES:
+            continue
+        totals[1][transaction_type] += row['quantity']
+        if transaction_type != 'waste':
+            continue
+        money_wasted[1] += row['cost']
+        if row['item'] is not None:
+            wasted_items.append({
+                'name': row['item'],
+                'unit': row['unit'],
+                'quantity': round(row['quantity'], 2),
+                'cost_per_unit': round(row['cost'] / row['quantity'], 2) if row['quantity'] else 0,
+                'total_cost': round(row['cost'], 2)
+            })
+
+    return format_dashboard_snapshot(totals, money_wasted, wasted_items, weeks)
+
+
+def format_dashboard_snapshot(totals, money_wasted, wasted_items, weeks=SNAPSHOT_WEEKS):
+    """Shape per-week totals into the payload the dashboard charts expect
+
+    totals maps week number -> {transaction_type: quantity}, money_wasted maps
+    week number -> cost and wasted_items are this week's wasted items.
+    """
+    # Oldest week first so the current week appears on the right of the charts
+    weekly_trends = []
+    financial_optimization = []
+    for week in range(weeks, 0, -1):
+        week_totals = totals[week]
+        weekly_trends.append({
+            'week': week_label(week),
+            'used': round(week_totals['usage'], 2),
+            'wasted': round(week_totals['waste'], 2),
+            'donated': round(week_totals['donation'], 2),
+            'purchased': round(week_totals['purchase'], 2),
+            'total': round(week_totals['usage'] + week_totals['waste'] + week_totals['donation'], 2)
+        })
+        financial_optimization.append({'week': week_label(week), 'moneyWasted': round(money_wasted[week], 2)})
+
+    raw_data = []
+    for week in range(1, weeks + 1):
+        week_totals = totals[week]
+        total_food = week_totals['usage'] + week_totals['waste'] + week_totals['donation']
+        raw_data.append({
+            'week_number': week,
+            'week': week_label(week),
+            'food_used_pct': round(week_totals['usage'] / total_food * 100, 1) if total_food > 0 else 0,
+            'food_wasted_pct': round(week_totals['waste'] / total_food * 100, 1) if total_food > 0 else 0,
+            'food_donated_pct': round(week_totals['donation'] / total_food * 100, 1) if total_food > 0 else 0,
+            'money_wasted': round(money_wasted[week], 2)
+        })
+
+    this_week = totals[1]
+    wasted_items = sorted(wasted_items, key=lambda item: item['quantity'], reverse=True)
+    return {
+        'weekly_trends': weekly_trends,
+        'financial_optimization': financial_optimization,
+        'this_week': [
+            {'name': 'Food Used', 'value': round(this_week['usage'], 2), 'color': '#10B981'},
+            {'name': 'Food Wasted', 'value': round(this_week['waste'], 2), 'color': '#EF4444'},
+            {'name': 'Food Donated', 'value': round(this_week['donation'], 2), 'color': '#3B82F6'}
+        ],
+        'most_wasted': wasted_items[:10],
+        'raw_data': raw_data,
+        'generated_at': datetime.now().isoformat()
+    }
+
+
+def get_dashboard_snapshot(cursor, etag, builder=build_dashboard_snapshot):
+    """Snapshot for an ETag, rebuilt only when the data or the day changed"""
+    cached = _snapshot_cache.get('dashboard')
+    if cached and cached[0] == etag:
+        return cached[1]
+    payload = builder(cursor)
+    _snapshot_cache['dashboard'] = (etag, payload)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inventory analytics maintenance")
+    parser.add_argument('command', choices=['rebuild-rollup'])
+    parser.add_argument('--db', default='demand_history.db', help="SQLite database path")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == 'rebuild-rollup':
+        rows = rebuild_daily_rollup(conn)
+        print(f"Rebuilt daily_item_rollup: {rows} rows")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,50 @@ import pandas as pd
 import xgboost as xgb
 import joblib
 import openai
+import io
 import os
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import wraps
 from dotenv import load_dotenv
+from werkzeug.http import is_resource_modified
+from inventory_context import build_inventory_context
+from item_resolver import item_resolver, normalize_name
+from llm_parsing import complete_json
+from lots import apply_lot_movements, expiring_lots, expiring_quantities, item_lots, reconcile_lots, seed_lots
+from llm_metrics import BUDGET_MODE, BudgetExceeded, get_metrics_summary, tracked_completion
+from food_bank_matching import find_donation_matches, format_match, get_matcher
+from analytics import (
+    MAX_RANGE_DAYS, SNAPSHOT_WEEKS, build_dashboard_snapshot, get_dashboard_snapshot, parse_day,
+    rebuild_daily_rollup, run_bucket_query, snapshot_etag
+)
+from action_batch import plan_actions
+from bulk_import import import_stream
+from change_feed import (
+    DEFAULT_LIMIT as CHANGE_FEED_DEFAULT_LIMIT, PRUNE_INTERVAL_SECONDS as CHANGE_FEED_PRUNE_INTERVAL_SECONDS,
+    change_log_triggers, current_sequence, get_changes, prune_change_log
+)
+from change_stream import change_broker, event_stream, load_item
+from exports import FORMATS as EXPORT_FORMATS, stream_export
+from fast_json import FastJSONProvider, RawJSON
+from http_cache import ENCODINGS, compress, compressible, resource_version
+from pagination import DEFAULT_PAGE_SIZE, fetch_page
+from columnar_analytics import columnar_dashboard_snapshot, columnar_enabled
+from waste_tracker import waste_tracker
+from job_queue import enqueue, get_job, register_job, schedule_job, start_workers, wait_for_job
+from reorder_optimizer import DEFAULT_REVIEW_DAYS, DEFAULT_SERVICE_LEVEL, get_reorder_plan, purchase_suggestions
+from waste_forecast import (
+    DONATION_RISK_THRESHOLD,
+    HORIZON_DAYS as WASTE_FORECAST_HORIZON_DAYS,
+    INTERVAL_SECONDS as WASTE_FORECAST_INTERVAL_SECONDS,
+    get_waste_risk,
+    run_waste_forecast
+)
 
 app = Flask(__name__)
+# orjson when installed; also lets routes return stored JSON text as RawJSON
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Load environment variables
@@ -49,6 +86,26 @@ def init_db():
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_demand_calculations_created_id ON demand_calculations (created_at, id)')
+
+    # LLM ingredient analyses, kept out of demand_calculations so listing and
+    # scanning calculations does not page through the JSON. The old
+    # ingredient_analysis column is emptied by migrate_database and no longer written.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS demand_analyses (
+            calculation_id INTEGER PRIMARY KEY,
+            analysis TEXT NOT NULL,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (calculation_id) REFERENCES demand_calculations (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS demand_analyses_cleanup
+        AFTER DELETE ON demand_calculations
+        BEGIN
+            DELETE FROM demand_analyses WHERE calculation_id = OLD.id;
+        END
+    ''')
     
     # Inventory table
     cursor.execute('''
@@ -79,13 +136,332 @@ def init_db():
             transaction_type TEXT NOT NULL, -- 'purchase', 'usage', 'waste', 'donation'
             quantity REAL NOT NULL,
             cost REAL DEFAULT 0,
+            unit_cost REAL, -- item cost per unit when the transaction was recorded
             notes TEXT,
             date TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (inventory_id) REFERENCES inventory (id)
         )
     ''')
-    
+
+    # Sort keys of the paginated inventory and transaction lists
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_name_id ON inventory (name, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_transactions_date_id ON inventory_transactions (date, id)')
+
+    # Per-day totals of inventory_transactions, kept in sync by triggers so they are
+    # updated in the same transaction as every transaction write
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_item_rollup (
+            day TEXT NOT NULL,
+            inventory_id INTEGER NOT NULL,
+            transaction_type TEXT NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            value REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, inventory_id, transaction_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_item_rollup_item ON daily_item_rollup (inventory_id, day)')
+
+    # value is quantity at the unit cost recorded with the transaction, so past
+    # weeks keep their valuation when prices change. Rows written without a
+    # unit_cost fall back to the item's current cost.
+    rollup_add = '''
+        INSERT INTO daily_item_rollup (day, inventory_id, transaction_type, quantity, cost, value, transaction_count)
+        SELECT COALESCE(date(NEW.date), NEW.date), NEW.inventory_id, NEW.transaction_type,
+               NEW.quantity, COALESCE(NEW.cost, 0),
+               NEW.quantity * COALESCE(NEW.unit_cost,
+                   (SELECT cost_per_unit FROM inventory WHERE id = NEW.inventory_id), 0),
+               1
+        WHERE NEW.inventory_id IS NOT NULL
+        ON CONFLICT (day, inventory_id, transaction_type) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            cost = cost + excluded.cost,
+            value = value + excluded.value,
+            transaction_count = transaction_count + 1;
+    '''
+    rollup_remove = '''
+        UPDATE daily_item_rollup
+        SET quantity = quantity - OLD.quantity,
+            cost = cost - COALESCE(OLD.cost, 0),
+            value = value - OLD.quantity * COALESCE(OLD.unit_cost,
+                (SELECT cost_per_unit FROM inventory WHERE id = OLD.inventory_id), 0),
+            transaction_count = transaction_count - 1
+        WHERE day = COALESCE(date(OLD.date), OLD.date)
+        AND inventory_id = OLD.inventory_id AND transaction_type = OLD.transaction_type;
+        DELETE FROM daily_item_rollup
+        WHERE day = COALESCE(date(OLD.date), OLD.date)
+        AND inventory_id = OLD.inventory_id AND transaction_type = OLD.transaction_type
+        AND transaction_count <= 0;
+    '''
+    # Recreated on every start so databases pick up changes to the definitions
+    for trigger_name in ('daily_item_rollup_insert', 'daily_item_rollup_delete', 'daily_item_rollup_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+    cursor.execute(f'''
+        CREATE TRIGGER daily_item_rollup_insert
+        AFTER INSERT ON inventory_transactions
+        BEGIN {rollup_add} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER daily_item_rollup_delete
+        AFTER DELETE ON inventory_transactions
+        BEGIN {rollup_remove} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER daily_item_rollup_update
+        AFTER UPDATE OF inventory_id, transaction_type, quantity, cost, unit_cost, date ON inventory_transactions
+        BEGIN {rollup_remove} {rollup_add} END
+    ''')
+
+    # Totals of finished ISO weeks for the dashboard. A week's row is dropped by
+    # the triggers below when a back-dated transaction lands in it, and is
+    # recomputed on the next dashboard load.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_aggregates (
+            week_start TEXT PRIMARY KEY, -- Monday of the week
+            iso_week TEXT NOT NULL, -- e.g. 2025-W07
+            used REAL NOT NULL DEFAULT 0,
+            wasted REAL NOT NULL DEFAULT 0,
+            donated REAL NOT NULL DEFAULT 0,
+            purchased REAL NOT NULL DEFAULT 0,
+            money_wasted REAL NOT NULL DEFAULT 0,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    invalidate_week = "DELETE FROM weekly_aggregates WHERE week_start = date({row}.date, '-6 days', 'weekday 1');"
+    for trigger_name in ('weekly_aggregates_invalidate_insert', 'weekly_aggregates_invalidate_delete',
+                         'weekly_aggregates_invalidate_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+    cursor.execute(f'''
+        CREATE TRIGGER weekly_aggregates_invalidate_insert
+        AFTER INSERT ON inventory_transactions
+        BEGIN {invalidate_week.format(row='NEW')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER weekly_aggregates_invalidate_delete
+        AFTER DELETE ON inventory_transactions
+        BEGIN {invalidate_week.format(row='OLD')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER weekly_aggregates_invalidate_update
+        AFTER UPDATE OF inventory_id, transaction_type, quantity, cost, unit_cost, date ON inventory_transactions
+        BEGIN {invalidate_week.format(row='OLD')} {invalidate_week.format(row='NEW')} END
+    ''')
+
+    # Expected waste per item over the next few days, rewritten by the waste_forecast job
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS waste_risk_scores (
+            inventory_id INTEGER PRIMARY KEY,
+            horizon_days INTEGER NOT NULL,
+            current_quantity REAL,
+            daily_usage REAL,
+            daily_demand REAL,
+            daily_waste REAL,
+            days_to_expiry INTEGER, -- NULL when the item has no expiration date
+            days_of_cover REAL, -- NULL when the item is not being used
+            expected_waste REAL NOT NULL DEFAULT 0,
+            expected_waste_value REAL NOT NULL DEFAULT 0,
+            risk_score REAL NOT NULL DEFAULT 0, -- share of stock expected to be wasted
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waste_risk_scores_risk ON waste_risk_scores (risk_score)')
+
+    # Supplier delivery times for the reorder-point optimizer
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS supplier_lead_times (
+            supplier TEXT PRIMARY KEY,
+            lead_time_days REAL NOT NULL,
+            lead_time_std_days REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Food banks and their open needs, used for donation matching
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS food_banks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            address TEXT,
+            city TEXT,
+            state TEXT,
+            zip_code TEXT,
+            phone TEXT,
+            email TEXT,
+            website TEXT,
+            contact_person TEXT,
+            capacity INTEGER,
+            hours_of_operation TEXT,
+            special_requirements TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS food_bank_needs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            food_bank_id INTEGER NOT NULL,
+            food_category TEXT,
+            food_type TEXT NOT NULL,
+            quantity_needed REAL DEFAULT 0,
+            quantity_fulfilled REAL DEFAULT 0,
+            unit TEXT,
+            priority_level INTEGER DEFAULT 1, -- 1 = low ... 4 = critical
+            notes TEXT,
+            expires_at TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (food_bank_id) REFERENCES food_banks (id)
+        )
+    ''')
+
+    # Background jobs for slow AI analyses
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            lane TEXT NOT NULL, -- 'interactive', 'bulk'
+            priority INTEGER DEFAULT 0,
+            status TEXT NOT NULL, -- 'queued', 'running', 'succeeded', 'failed'
+            payload TEXT,
+            result TEXT,
+            result_status INTEGER,
+            error TEXT,
+            callback_url TEXT,
+            attempts INTEGER DEFAULT 0,
+            worker_id TEXT, -- lease holder while running
+            heartbeat_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(jobs)")
+    job_columns = [column[1] for column in cursor.fetchall()]
+    # Job leases, for databases created before them
+    if 'worker_id' not in job_columns:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN worker_id TEXT')
+    if 'heartbeat_at' not in job_columns:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (lane, status, priority, id)')
+
+    # Token and latency accounting for every OpenAI call
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint TEXT NOT NULL,
+            template TEXT,
+            model TEXT,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            latency_ms REAL,
+            retries INTEGER DEFAULT 0,
+            parse_failures INTEGER DEFAULT 0,
+            success BOOLEAN,
+            error TEXT,
+            estimated_cost REAL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_metrics_endpoint_created ON llm_metrics (endpoint, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_metrics_created ON llm_metrics (created_at)')
+
+    # Latest change per inventory and transaction row under an increasing sequence,
+    # read by the delta sync endpoint. Deleted rows keep a tombstone entry.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL, -- 'upsert', 'delete'
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    for table_name in ('inventory', 'inventory_transactions'):
+        for trigger_name, trigger_sql in change_log_triggers(table_name):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+            cursor.execute(trigger_sql)
+
+    # Stock by purchase lot, each with its own expiry. Usage, waste and donations
+    # consume the oldest lots first; inventory.expiration_date follows the earliest open lot.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_lots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER NOT NULL,
+            quantity_received REAL NOT NULL,
+            quantity_remaining REAL NOT NULL,
+            received_date TEXT NOT NULL,
+            expiration_date TEXT, -- NULL when unknown
+            unit_cost REAL,
+            transaction_id INTEGER, -- the purchase that opened the lot, if recorded
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inventory_id) REFERENCES inventory (id)
+        )
+    ''')
+    # Partial indexes over open lots: expiry range scans and per-item FIFO order
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_inventory_lots_expiry
+        ON inventory_lots (expiration_date) WHERE quantity_remaining > 0
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_inventory_lots_item_fifo
+        ON inventory_lots (inventory_id, received_date, id) WHERE quantity_remaining > 0
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inventory_lots_cleanup
+        AFTER DELETE ON inventory
+        BEGIN
+            DELETE FROM inventory_lots WHERE inventory_id = OLD.id;
+        END
+    ''')
+
+    # Extra names chat requests may use for an item, e.g. "chx breast"
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_aliases (
+            alias TEXT PRIMARY KEY, -- stored normalized
+            inventory_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inventory_id) REFERENCES inventory (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS item_aliases_cleanup
+        AFTER DELETE ON inventory
+        BEGIN
+            DELETE FROM item_aliases WHERE inventory_id = OLD.id;
+        END
+    ''')
+
+    # Change counters bumped by triggers on every write, used for cache invalidation
+    # and for the ETags of read routes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table_name in ('inventory', 'inventory_transactions', 'food_banks', 'food_bank_needs', 'weekly_aggregates',
+                       'supplier_lead_times', 'item_aliases', 'inventory_lots', 'demand_calculations',
+                       'demand_analyses', 'waste_risk_scores', 'llm_metrics'):
+        cursor.execute('INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)', (table_name,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            # Recreated on every start so databases pick up changes to the definition
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table_name}_version_{event.lower()}')
+            cursor.execute(f'''
+                CREATE TRIGGER {table_name}_version_{event.lower()}
+                AFTER {event} ON {table_name}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table_name}';
+                END
+            ''')
+
     conn.commit()
     conn.close()
 
@@ -120,6 +496,68 @@ def migrate_database():
         if updated_rows > 0:
             print(f"Updated {updated_rows} existing records with total_price")
         
+        # Transaction valuation columns for databases created before cost tracking
+        cursor.execute("PRAGMA table_info(inventory_transactions)")
+        if 'unit_cost' not in [column[1] for column in cursor.fetchall()]:
+            print("Adding unit_cost column to inventory_transactions table...")
+            cursor.execute('ALTER TABLE inventory_transactions ADD COLUMN unit_cost REAL')
+        cursor.execute("PRAGMA table_info(daily_item_rollup)")
+        if 'value' not in [column[1] for column in cursor.fetchall()]:
+            print("Adding value column to daily_item_rollup table...")
+            cursor.execute('ALTER TABLE daily_item_rollup ADD COLUMN value REAL NOT NULL DEFAULT 0')
+            cursor.execute('DELETE FROM daily_item_rollup')
+        conn.commit()
+
+        # Stamp transactions written without a unit cost with the best cost we
+        # have, so their valuation stops following later price changes
+        cursor.execute('''
+            UPDATE inventory_transactions
+            SET unit_cost = COALESCE((SELECT cost_per_unit FROM inventory WHERE id = inventory_transactions.inventory_id), 0)
+            WHERE unit_cost IS NULL
+        ''')
+        stamped_rows = cursor.rowcount
+        conn.commit()
+        if stamped_rows > 0:
+            print(f"Recorded unit cost on {stamped_rows} existing transactions")
+
+        # Backfill the daily rollup for databases created before it existed, and
+        # after stamping (trigger values for unstamped rows used the then-current cost)
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM daily_item_rollup)')
+        rollup_populated = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM inventory_transactions)')
+        if (not rollup_populated or stamped_rows > 0) and cursor.fetchone()[0]:
+            print("Rebuilding daily_item_rollup from inventory_transactions...")
+            rebuild_daily_rollup(conn)
+
+        # Analyses stored inline in demand_calculations move to demand_analyses. The
+        # first move also rebuilds the file, since emptied rows stay spread over the
+        # pages the blobs used to fill until the table is rewritten.
+        cursor.execute('''
+            INSERT OR IGNORE INTO demand_analyses (calculation_id, analysis, analyzed_at)
+            SELECT id, ingredient_analysis, updated_at FROM demand_calculations
+            WHERE ingredient_analysis IS NOT NULL
+        ''')
+        cursor.execute('UPDATE demand_calculations SET ingredient_analysis = NULL WHERE ingredient_analysis IS NOT NULL')
+        moved_analyses = cursor.rowcount
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM sync_state WHERE name = 'demand_analyses_moved')")
+        first_move = not cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('demand_analyses_moved', 1)")
+        conn.commit()
+        if moved_analyses > 0:
+            print(f"Moved {moved_analyses} ingredient analyses to demand_analyses")
+            if first_move:
+                print("Compacting the database...")
+                cursor.execute('VACUUM')
+
+        # Stock on hand before lot tracking becomes one lot per item
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM sync_state WHERE name = 'inventory_lots_seeded')")
+        if not cursor.fetchone()[0]:
+            seeded = seed_lots(cursor)
+            cursor.execute("INSERT INTO sync_state (name, value) VALUES ('inventory_lots_seeded', 1)")
+            conn.commit()
+            if seeded > 0:
+                print(f"Opened {seeded} inventory lots from current stock")
+        
         conn.close()
     except Exception as e:
         print(f"Migration error: {e}")
@@ -127,6 +565,61 @@ def migrate_database():
 # Run migration
 migrate_database()  
 
+def conditional_get(*tables, daily=False):
+    """Validate GETs of a route against the version counters of the tables it reads
+
+    A request whose If-None-Match still holds gets a 304
+    before the route runs. Pass daily=True when the response also depends on
+    today's date. The counters are read before the route runs, so a write in
+    between only costs the client one more full response, never a stale one.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                conn = sqlite3.connect('demand_history.db')
+                try:
+                    etag = resource_version(conn.cursor(), request.endpoint, tables, daily)
+                finally:
+                    conn.close()
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+
+            if is_resource_modified(request.environ, etag=etag):
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli encode large text bodies for clients that accept it"""
+    if response.status_code == 304:
+        response.vary.add('Accept-Encoding')
+        return response
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not compressible(response.mimetype, response.calculate_content_length() or 0)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if not encoding:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The encoded bytes differ from the identity body a strong ETag promises
+        response.set_etag(etag, weak=True)
+    return response
+
 
 @app.route("/api/ml", methods = ["POST", "GET"])
 def predict():
@@ -224,17 +717,126 @@ def predict():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/analyze-ingredients", methods=["POST"])
-def analyze_ingredients():
+def enqueue_job_response(kind, data):
+    """Queue a background job and return the 202 response pointing at it"""
+    data = data or {}
+    try:
+        job_id = enqueue(
+            kind,
+            data,
+            callback_url=data.get("callbackUrl") or data.get("callback_url"),
+            priority=int(data.get("priority", 0))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
+
+@app.route("/api/jobs/<int:job_id>", methods=["GET"])
+def get_job_status(job_id):
+    """Get a background job's status and result
+
+    Pass ?wait=<seconds> (max 30) to hold the request until the job finishes.
+    """
+    try:
+        wait = min(request.args.get('wait', 0, type=float), 30)
+        job = wait_for_job(job_id, wait) if wait > 0 else get_job(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def cached_ingredient_analysis(dish_name, major_ingredients, predicted_orders):
+    """Reuse the latest stored analysis of the same dish, scaled to the new order count"""
+    conn = sqlite3.connect('demand_history.db')
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT a.analysis, d.predicted_orders
+        FROM demand_calculations d
+        JOIN demand_analyses a ON a.calculation_id = d.id
+        WHERE d.predicted_orders > 0
+        AND LOWER(d.dish_name) = LOWER(?) AND LOWER(d.major_ingredients) = LOWER(?)
+        ORDER BY d.updated_at DESC
+        LIMIT 1
+    ''', (dish_name or '', major_ingredients or ''))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row:
+        return None
+    try:
+        analysis = json.loads(row[0])
+    except json.JSONDecodeError:
+        return None
+    
+    scale = (predicted_orders or 0) / row[1]
+    for ingredient in analysis.get("ingredients", []):
+        if isinstance(ingredient.get("quantity"), (int, float)):
+            ingredient["quantity"] = round(ingredient["quantity"] * scale, 1)
+    analysis["cached"] = True
+    analysis["degraded"] = True
+    return analysis
+
+def deterministic_recommendations(donation_matches):
+    """Build recommendations without the AI from local matches and stock levels"""
+    conn = sqlite3.connect('demand_history.db')
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT name, current_quantity, min_quantity, max_quantity, unit
+        FROM inventory
+        WHERE current_quantity <= min_quantity
+        OR (max_quantity > 0 AND current_quantity > max_quantity)
+        ORDER BY name
+        LIMIT 20
+    ''')
+    alerts = []
+    for name, quantity, min_quantity, max_quantity, unit in cursor.fetchall():
+        if quantity <= min_quantity:
+            alerts.append({"type": "low_stock", "item": name,
+                           "message": f"Only {quantity} {unit} left (minimum {min_quantity})"})
+        else:
+            alerts.append({"type": "overstock", "item": name,
+                           "message": f"{quantity} {unit} on hand exceeds maximum of {max_quantity}"})
+    # Exact quantities from the lots, including stock already past its date
+    for lot in expiring_lots(cursor, days=3, include_expired=True)[:20]:
+        alerts.append({"type": "expiring", "item": lot["name"],
+                       "message": f"{lot['quantity']} {lot['unit']} expires on {lot['expiration_date']}"})
+    conn.close()
+    
+    return {
+        "recommendations": [],
+        "donation_opportunities": [
+            {
+                "item": match["item"],
+                "quantity": f"{match['suggested_quantity']} {match['item_unit'] or ''}".strip(),
+                "reason": f"{match['food_bank']} needs {match['remaining_need']} {match['need_unit']} of {match['need']}",
+                "suggested_recipient": match["food_bank"],
+                "food_bank_match": match["food_bank"],
+                "priority_level": match["priority"],
+                "contact_info": f"{match['contact_phone']} | {match['contact_email']}",
+                "match_reasoning": f"{match['match_type'].title()} match on {match['need_category']}"
+            } for match in donation_matches
+        ],
+        "alerts": alerts,
+        "donation_matches": donation_matches,
+        "degraded": True
+    }
+
+@register_job("analyze_ingredients", lane="interactive")
+def run_ingredient_analysis(data):
     """Analyze ingredients needed for predicted orders using OpenAI"""
     try:
-        data = request.get_json()
         predicted_orders = data.get("predictedOrders", 0)
         dish_name = data.get("dishName", "")
         major_ingredients = data.get("majorIngredients", "")
         
         if not openai.api_key:
-            return jsonify({"error": "OpenAI API key not configured"}), 500
+            return {"error": "OpenAI API key not configured"}, 500
         
         # Create a smart prompt based on available information
         if dish_name and dish_name.strip():
@@ -346,60 +948,64 @@ def analyze_ingredients():
             """
         
         client = openai.OpenAI(api_key=openai.api_key)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional restaurant inventory management expert with deep knowledge of food preparation, ingredient quantities, and cost estimation. You always provide realistic, consistent ingredient amounts based on standard restaurant serving sizes. You never make up unrealistic quantities and always follow the provided serving size guidelines."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.1
-        )
-        
-        # Parse the response
-        analysis_text = response.choices[0].message.content
-        
-        # Try to extract JSON from the response
-        import json
-        import re
-        
-        # Look for JSON in the response
-        json_match = re.search(r'\{.*\}', analysis_text, re.DOTALL)
-        if json_match:
-            try:
-                analysis_data = json.loads(json_match.group())
-                
-                # Save ingredient analysis to database
-                calculation_id = data.get("calculationId")
-                if calculation_id:
-                    conn = sqlite3.connect('demand_history.db')
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE demand_calculations 
-                        SET ingredient_analysis = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (json.dumps(analysis_data), calculation_id))
-                    conn.commit()
-                    conn.close()
-                
-                return jsonify(analysis_data)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return the raw text
-                return jsonify({
-                    "raw_analysis": analysis_text,
-                    "ingredients": [],
-                    "error": "Could not parse structured response"
-                })
-        else:
-            return jsonify({
+        try:
+            analysis_data, analysis_text, parse_errors = complete_json(
+                client,
+                "ingredients",
+                endpoint="analyze_ingredients",
+                template="dish" if dish_name and dish_name.strip() else "ingredient_list",
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a professional restaurant inventory management expert with deep knowledge of food preparation, ingredient quantities, and cost estimation. You always provide realistic, consistent ingredient amounts based on standard restaurant serving sizes. You never make up unrealistic quantities and always follow the provided serving size guidelines. You always respond with a JSON object."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=1000,
+                temperature=0.1
+            )
+        except BudgetExceeded as e:
+            cached = cached_ingredient_analysis(dish_name, major_ingredients, predicted_orders)
+            if BUDGET_MODE == 'fail' or cached is None:
+                return {"error": str(e)}, 429
+            return cached, 200
+        
+        if analysis_data is None:
+            # If no valid structured data came back even after repair, return the raw text
+            return {
                 "raw_analysis": analysis_text,
                 "ingredients": [],
-                "error": "No structured data found in response"
-            })
+                "error": "Could not parse structured response",
+                "parse_errors": parse_errors
+            }, 200
+        
+        # Save ingredient analysis to database
+        calculation_id = data.get("calculationId")
+        if calculation_id:
+            conn = sqlite3.connect('demand_history.db')
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE demand_calculations 
+                SET updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (calculation_id,))
+            if cursor.rowcount:
+                cursor.execute('''
+                    INSERT INTO demand_analyses (calculation_id, analysis) VALUES (?, ?)
+                    ON CONFLICT (calculation_id) DO UPDATE
+                    SET analysis = excluded.analysis, analyzed_at = CURRENT_TIMESTAMP
+                ''', (calculation_id, json.dumps(analysis_data)))
+            conn.commit()
+            conn.close()
+        
+        return analysis_data, 200
 
     except Exception as e:
         print(f"Error in analyze_ingredients: {e}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+@app.route("/api/analyze-ingredients", methods=["POST"])
+def analyze_ingredients():
+    """Queue an ingredient analysis and return its job id"""
+    return enqueue_job_response("analyze_ingredients", request.get_json())
 
 @app.route("/api/chat", methods=["POST"])
 def chat_with_ai():
@@ -412,37 +1018,12 @@ def chat_with_ai():
         if not openai.api_key:
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
-        # Get current inventory data for context
+        # Get current inventory data for context, ranked and trimmed to the token budget
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT name, current_quantity, min_quantity, unit, expiration_date, 
-                   cost_per_unit, storage_location, category
-            FROM inventory 
-            WHERE current_quantity > 0
-            ORDER BY expiration_date ASC
-        ''')
-        inventory_data = cursor.fetchall()
-        
-        cursor.execute('''
-            SELECT it.transaction_type, it.quantity, it.date, i.name
-            FROM inventory_transactions it
-            JOIN inventory i ON it.inventory_id = i.id
-            WHERE it.date >= date('now', '-3 days')
-            ORDER BY it.date DESC
-        ''')
-        recent_transactions = cursor.fetchall()
+        inventory_context, transaction_context = build_inventory_context(cursor, days=3)
         conn.close()
-        
-        # Build context-aware prompt
-        inventory_context = "Current Inventory:\n"
-        for item in inventory_data:
-            inventory_context += f"- {item[0]}: {item[1]} {item[2]} (min: {item[3]}, expires: {item[4]})\n"
-        
-        transaction_context = "Recent Transactions (last 3 days):\n"
-        for trans in recent_transactions:
-            transaction_context += f"- {trans[3]}: {trans[0]} {trans[1]} on {trans[2]}\n"
-        
+
         system_prompt = f"""You are an expert restaurant inventory management assistant with the ability to automatically perform inventory actions. You help restaurant owners and managers with:
 
         - Inventory tracking and management
@@ -559,55 +1140,68 @@ def chat_with_ai():
         user_message = f"{message}{context_info}"
         
         client = openai.OpenAI(api_key=openai.api_key)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=800,
-            temperature=0.3
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Try to parse JSON from AI response
+        # Plain prose is a valid chat reply, so JSON mode stays off here
         try:
-            # Extract JSON from response if it exists
-            import re
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                parsed_response = json.loads(json_match.group())
-                
-                # Check if AI is asking for missing information
-                if "missing_info" in parsed_response or "questions" in parsed_response:
-                    return jsonify({
-                        "response": parsed_response.get("response", ai_response),
-                        "missing_info": parsed_response.get("missing_info", []),
-                        "questions": parsed_response.get("questions", []),
-                        "pending_action": parsed_response.get("pending_action"),
-                        "has_actions": False,
-                        "needs_info": True
-                    })
+            parsed_response, ai_response, parse_errors = complete_json(
+                client,
+                "actions",
+                endpoint="chat",
+                template="inventory_assistant",
+                json_mode=False,
+                allow_plain_text=True,
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message}
+                ],
+                max_tokens=800,
+                temperature=0.3
+            )
+        except BudgetExceeded as e:
+            if BUDGET_MODE == 'fail':
+                return jsonify({"error": str(e)}), 429
+            # Answer with the inventory summary we already built instead of the AI
+            return jsonify({
+                "response": "The AI assistant has reached its daily usage budget, so I can't act on "
+                            "requests right now. Here is your current inventory status:\n\n"
+                            f"{inventory_context}\n\n{transaction_context}",
+                "has_actions": False,
+                "degraded": True
+            })
+        
+        if parsed_response is not None:
+            # Check if AI is asking for missing information
+            if "missing_info" in parsed_response or "questions" in parsed_response:
+                return jsonify({
+                    "response": parsed_response.get("response", ai_response),
+                    "missing_info": parsed_response.get("missing_info", []),
+                    "questions": parsed_response.get("questions", []),
+                    "pending_action": parsed_response.get("pending_action"),
+                    "has_actions": False,
+                    "needs_info": True
+                })
+            
+            # Execute actions if they exist, all or nothing
+            if parsed_response.get("actions"):
+                try:
+                    executed_actions = execute_inventory_actions(parsed_response["actions"])["results"]
+                except Exception as e:
+                    print(f"Error executing actions: {e}")
+                    executed_actions = [{"success": False, "message": f"Error executing actions: {str(e)}"}]
                 
-                # Execute actions if they exist
-                if "actions" in parsed_response:
-                    executed_actions = []
-                    for action in parsed_response["actions"]:
-                        try:
-                            result = execute_inventory_action(action)
-                            executed_actions.append(result)
-                        except Exception as e:
-                            print(f"Error executing action: {e}")
-                            executed_actions.append({"error": str(e)})
-                    
-                    return jsonify({
-                        "response": parsed_response.get("response", ai_response),
-                        "actions_executed": executed_actions,
-                        "has_actions": True
-                    })
-        except json.JSONDecodeError:
-            pass
+                return jsonify({
+                    "response": parsed_response.get("response", ai_response),
+                    "actions_executed": executed_actions,
+                    "has_actions": True
+                })
+            
+            return jsonify({
+                "response": parsed_response["response"],
+                "has_actions": False
+            })
+        
+        if parse_errors:
+            print(f"Chat response could not be parsed: {parse_errors}")
         
         # If no JSON found, return regular response
         return jsonify({
@@ -666,6 +1260,67 @@ def complete_action_with_info():
         print(f"Error completing action: {e}")
         return jsonify({"error": str(e)}), 500
 
+def weighted_average_cost(on_hand, average_cost, quantity, unit_cost):
+    """Average unit cost after receiving quantity at unit_cost"""
+    on_hand = max(on_hand or 0, 0)
+    if on_hand + quantity <= 0:
+        return unit_cost
+    return (on_hand * (average_cost or 0) + quantity * unit_cost) / (on_hand + quantity)
+
+def record_transaction(cursor, inventory_id, transaction_type, quantity, cost=0, notes='', date=None,
+                       unit_cost=None, expiration_date=None):
+    """Insert an inventory transaction and keep lots current
+
+    The item's cost per unit at this moment is stored with the transaction
+    (unless unit_cost is given), so its valuation never changes afterwards.
+    Purchases open a lot expiring on expiration_date; usage, waste and
+    donations consume the oldest lots.
+
+    Returns (transaction_id, waste_change). Pass waste_change to
+    waste_tracker.apply() once the transaction is committed, so a rollback
+    never leaves the in-memory waste totals ahead of the database.
+    """
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    item = None
+    if inventory_id is not None:
+        cursor.execute('SELECT name, unit, cost_per_unit FROM inventory WHERE id = ?', (inventory_id,))
+        item = cursor.fetchone()
+    if unit_cost is None:
+        unit_cost = (item[2] if item else 0) or 0
+
+    cursor.execute('''
+        INSERT INTO inventory_transactions 
+        (inventory_id, transaction_type, quantity, cost, unit_cost, notes, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (inventory_id, transaction_type, quantity, cost, unit_cost, notes, date))
+    transaction_id = cursor.lastrowid
+    if item:
+        apply_lot_movements(cursor, [
+            (inventory_id, transaction_type, quantity, date, expiration_date, unit_cost, transaction_id)
+        ])
+
+    waste_change = None
+    if transaction_type == 'waste' and item:
+        waste_change = (inventory_id, item[0], item[1], date, quantity, quantity * unit_cost)
+    return transaction_id, waste_change
+
+def transaction_event(transaction_id, inventory_id, transaction_type, quantity, cost=0, notes='', date=None):
+    """The transaction part of a change stream event"""
+    return {
+        'id': transaction_id,
+        'inventory_id': inventory_id,
+        'transaction_type': transaction_type,
+        'quantity': quantity,
+        'cost': cost,
+        'notes': notes,
+        'date': date or datetime.now().strftime('%Y-%m-%d')
+    }
+
+def publish_item_write(cursor, item_id, before, transaction=None):
+    """Push a committed write of one item to live change stream subscribers"""
+    if change_broker.has_subscribers():
+        change_broker.publish_item_write(before, load_item(cursor, item_id), current_sequence(cursor), transaction)
+
 def execute_inventory_action(action):
     """Execute an inventory action parsed from AI response"""
     try:
@@ -698,22 +1353,26 @@ def execute_inventory_action(action):
             ))
             
             item_id = cursor.lastrowid
+            transaction = None
             
             # Add purchase transaction if quantity > 0
             if action_data.get('current_quantity', 0) > 0:
-                cursor.execute('''
-                    INSERT INTO inventory_transactions 
-                    (inventory_id, transaction_type, quantity, cost, notes, date)
-                    VALUES (?, 'purchase', ?, ?, ?, ?)
-                ''', (
-                    item_id,
+                transaction_id, waste_change = record_transaction(
+                    cursor, item_id, 'purchase',
                     action_data.get('current_quantity', 0),
                     action_data.get('total_cost', 0),
                     'AI-suggested purchase',
-                    datetime.now().strftime('%Y-%m-%d')
-                ))
+                    expiration_date=action_data.get('expiration_date')
+                )
+                transaction = transaction_event(
+                    transaction_id, item_id, 'purchase', action_data.get('current_quantity', 0),
+                    action_data.get('total_cost', 0), 'AI-suggested purchase'
+                )
             
             conn.commit()
+            if transaction:
+                waste_tracker.apply(waste_change)
+            publish_item_write(cursor, item_id, None, transaction)
             conn.close()
             
             return {
@@ -728,12 +1387,15 @@ def execute_inventory_action(action):
             item_name = action_data.get('name')
             new_quantity = action_data.get('current_quantity', 0)
             
-            cursor.execute('SELECT id, current_quantity FROM inventory WHERE name = ?', (item_name,))
+            match = item_resolver.resolve(cursor, item_name)
+            cursor.execute('SELECT id, current_quantity FROM inventory WHERE id = ?', (match and match['id'],))
             item = cursor.fetchone()
             
             if item:
+                before = load_item(cursor, item[0])
                 old_quantity = item[1]
                 quantity_change = new_quantity - old_quantity
+                transaction = None
                 
                 cursor.execute('''
                     UPDATE inventory 
@@ -744,20 +1406,19 @@ def execute_inventory_action(action):
                 # Record transaction for quantity change
                 if quantity_change != 0:
                     transaction_type = 'purchase' if quantity_change > 0 else 'usage'
-                    cursor.execute('''
-                        INSERT INTO inventory_transactions 
-                        (inventory_id, transaction_type, quantity, cost, notes, date)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        item[0],
-                        transaction_type,
-                        abs(quantity_change),
-                        0,
-                        f'AI-suggested quantity update',
-                        datetime.now().strftime('%Y-%m-%d')
-                    ))
+                    transaction_id, waste_change = record_transaction(
+                        cursor, item[0], transaction_type, abs(quantity_change), 0,
+                        'AI-suggested quantity update'
+                    )
+                    transaction = transaction_event(
+                        transaction_id, item[0], transaction_type, abs(quantity_change), 0,
+                        'AI-suggested quantity update'
+                    )
                 
                 conn.commit()
+                if transaction:
+                    waste_tracker.apply(waste_change)
+                publish_item_write(cursor, item[0], before, transaction)
                 conn.close()
                 
                 return {
@@ -781,16 +1442,14 @@ def execute_inventory_action(action):
             quantity = action_data.get('quantity', 0)
             notes = action_data.get('notes', 'AI-suggested action')
             
-            cursor.execute('SELECT id FROM inventory WHERE name = ?', (item_name,))
+            match = item_resolver.resolve(cursor, item_name)
+            cursor.execute('SELECT id FROM inventory WHERE id = ?', (match and match['id'],))
             item = cursor.fetchone()
             
             if item:
+                before = load_item(cursor, item[0])
                 # Add transaction
-                cursor.execute('''
-                    INSERT INTO inventory_transactions 
-                    (inventory_id, transaction_type, quantity, cost, notes, date)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (item[0], transaction_type, quantity, 0, notes, datetime.now().strftime('%Y-%m-%d')))
+                transaction_id, waste_change = record_transaction(cursor, item[0], transaction_type, quantity, 0, notes)
                 
                 # Update inventory quantity (subtract for usage/waste/donation)
                 if transaction_type in ['usage', 'waste', 'donation']:
@@ -801,6 +1460,10 @@ def execute_inventory_action(action):
                     ''', (quantity, item[0]))
                 
                 conn.commit()
+                waste_tracker.apply(waste_change)
+                publish_item_write(cursor, item[0], before, transaction_event(
+                    transaction_id, item[0], transaction_type, quantity, 0, notes
+                ))
                 conn.close()
                 
                 return {
@@ -821,15 +1484,19 @@ def execute_inventory_action(action):
             # Remove item from inventory
             item_name = action_data.get('name')
             
-            cursor.execute('SELECT id FROM inventory WHERE name = ?', (item_name,))
+            match = item_resolver.resolve(cursor, item_name)
+            cursor.execute('SELECT id FROM inventory WHERE id = ?', (match and match['id'],))
             item = cursor.fetchone()
             
             if item:
+                before = load_item(cursor, item[0])
                 cursor.execute('DELETE FROM inventory WHERE id = ?', (item[0],))
                 cursor.execute('DELETE FROM inventory_transactions WHERE inventory_id = ?', (item[0],))
                 
                 conn.commit()
+                publish_item_write(cursor, item[0], before)
                 conn.close()
+                waste_tracker.invalidate()
                 
                 return {
                     "success": True,
@@ -861,23 +1528,172 @@ def execute_inventory_action(action):
             "message": f"Error executing action: {str(e)}"
         }
 
-@app.route("/api/inventory/ai-action", methods=["POST"])
-def ai_inventory_action():
-    """Perform AI-suggested inventory actions"""
+def batch_action_message(step):
+    """Result message for one applied or previewed batch step"""
+    name = step['item']['name']
+    if step['type'] == 'add_item':
+        return f"Added {name} to inventory"
+    if step['type'] == 'update_quantity':
+        return f"Updated {name} quantity from {step['quantity_before']} to {step['quantity_after']}"
+    if step['type'] == 'record_transaction':
+        transaction_type, quantity, _, _ = step['transaction']
+        return f"Recorded {transaction_type} of {quantity} {name}"
+    return f"Removed {name} from inventory"
+
+def apply_batch_step(cursor, step):
+    """Write one planned step inside the batch's transaction
+
+    Returns (transaction event, waste change) for steps that record a
+    transaction, None otherwise.
+    """
+    item = step['item']
+    data = step['data']
+    if step['type'] == 'add_item':
+        cursor.execute('''
+            INSERT INTO inventory 
+            (name, category, unit, current_quantity, min_quantity, max_quantity, 
+             cost_per_unit, total_cost, supplier, expiration_date, storage_location, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            item['name'],
+            data.get('category', 'General'),
+            data.get('unit', 'units'),
+            step['quantity_after'],
+            data.get('min_quantity', 0),
+            data.get('max_quantity', 100),
+            data.get('cost_per_unit', 0),
+            data.get('total_cost', 0),
+            data.get('supplier', 'Unknown'),
+            data.get('expiration_date'),
+            data.get('storage_location', 'Storage'),
+            data.get('notes', 'Added by AI assistant')
+        ))
+        item['id'] = cursor.lastrowid
+    elif step['type'] == 'delete_item':
+        cursor.execute('DELETE FROM inventory_transactions WHERE inventory_id = ?', (item['id'],))
+        cursor.execute('DELETE FROM inventory WHERE id = ?', (item['id'],))
+    else:
+        cursor.execute('''
+            UPDATE inventory 
+            SET current_quantity = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (step['quantity_after'], item['id']))
+
+    if step['transaction']:
+        transaction_type, quantity, cost, notes = step['transaction']
+        # A new item's stock is its first lot, expiring when the item does
+        expiration_date = data.get('expiration_date') if step['type'] == 'add_item' else None
+        transaction_id, waste_change = record_transaction(cursor, item['id'], transaction_type, quantity, cost,
+                                                          notes, expiration_date=expiration_date)
+        return transaction_event(transaction_id, item['id'], transaction_type, quantity, cost, notes), waste_change
+    return None
+
+def execute_inventory_actions(actions, dry_run=False):
+    """Apply a batch of AI-proposed actions in one transaction
+
+    Each distinct item name is resolved once through the item resolver, the
+    matched items are loaded in one lookup, and the whole batch is validated
+    first; if any action is invalid nothing is written. With dry_run the
+    resulting quantities are returned without writing anything.
+    """
+    conn = sqlite3.connect('demand_history.db', timeout=30)
     try:
-        data = request.get_json()
-        action_type = data.get("action_type")  # 'add_item', 'record_transaction', 'suggest_donation'
-        action_data = data.get("action_data", {})
-        
-        if not openai.api_key:
-            return jsonify({"error": "OpenAI API key not configured"}), 500
-        
-        conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        
-        if action_type == "add_item":
-            # Add new inventory item
-            cursor.execute('''
+        # Hold the write lock from planning to commit so the plan can't go stale
+        if not dry_run:
+            cursor.execute('BEGIN IMMEDIATE')
+        steps, errors = plan_actions(cursor, actions)
+        if errors:
+            conn.rollback()
+            failed = {error['index']: error['error'] for error in errors}
+            return {
+                "applied": False,
+                "dry_run": dry_run,
+                "errors": errors,
+                "results": [
+                    {
+                        "success": False,
+                        "action": action.get("type") if isinstance(action, dict) else None,
+                        "message": failed.get(index, "Not applied because another action in the batch is invalid")
+                    }
+                    for index, action in enumerate(actions)
+                ]
+            }
+
+        results = [
+            {
+                "success": True,
+                "action": step['type'],
+                "message": batch_action_message(step),
+                "item_id": step['item']['id'],
+                "quantity_before": step['quantity_before'],
+                "resulting_quantity": step['quantity_after']
+            }
+            for step in steps
+        ]
+        if dry_run:
+            return {"applied": False, "dry_run": True, "errors": [], "results": results}
+
+        existing_ids = {step['item']['id'] for step in steps if step['item']['id'] is not None}
+        before = {item_id: load_item(cursor, item_id) for item_id in existing_ids}
+        transactions = []
+        waste_changes = []
+        try:
+            for step, result in zip(steps, results):
+                written = apply_batch_step(cursor, step)
+                if written:
+                    transactions.append(written[0])
+                    waste_changes.append(written[1])
+                result["item_id"] = step['item']['id']
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if any(step['type'] == 'delete_item' for step in steps):
+            waste_tracker.invalidate()
+        else:
+            for waste_change in waste_changes:
+                waste_tracker.apply(waste_change)
+        if change_broker.has_subscribers():
+            seq = current_sequence(cursor)
+            for transaction in transactions:
+                change_broker.publish('transaction', {'seq': seq, 'transaction': transaction})
+            for item_id in dict.fromkeys(step['item']['id'] for step in steps):
+                change_broker.publish_item_write(before.get(item_id), load_item(cursor, item_id), seq)
+        return {"applied": True, "dry_run": False, "errors": [], "results": results}
+    finally:
+        conn.close()
+
+@app.route("/api/inventory/actions/batch", methods=["POST"])
+def execute_inventory_action_batch():
+    """Validate and apply a list of inventory actions atomically; dry_run previews the result"""
+    try:
+        data = request.get_json() or {}
+        result = execute_inventory_actions(data.get("actions"), bool(data.get("dry_run")))
+        return jsonify(result), 200 if result["applied"] or result["dry_run"] else 422
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/ai-action", methods=["POST"])
+def ai_inventory_action():
+    """Perform AI-suggested inventory actions"""
+    try:
+        data = request.get_json()
+        action_type = data.get("action_type")  # 'add_item', 'record_transaction', 'suggest_donation'
+        action_data = data.get("action_data", {})
+        
+        if not openai.api_key:
+            return jsonify({"error": "OpenAI API key not configured"}), 500
+        
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        
+        if action_type == "add_item":
+            # Add new inventory item
+            cursor.execute('''
                 INSERT INTO inventory 
                 (name, category, unit, current_quantity, min_quantity, max_quantity, 
                  cost_per_unit, total_cost, supplier, expiration_date, storage_location, notes)
@@ -898,22 +1714,26 @@ def ai_inventory_action():
             ))
             
             item_id = cursor.lastrowid
+            transaction = None
             
             # Add purchase transaction if quantity > 0
             if action_data.get('current_quantity', 0) > 0:
-                cursor.execute('''
-                    INSERT INTO inventory_transactions 
-                    (inventory_id, transaction_type, quantity, cost, notes, date)
-                    VALUES (?, 'purchase', ?, ?, ?, ?)
-                ''', (
-                    item_id,
+                transaction_id, waste_change = record_transaction(
+                    cursor, item_id, 'purchase',
                     action_data.get('current_quantity', 0),
                     action_data.get('total_cost', 0),
                     'AI-suggested purchase',
-                    datetime.now().strftime('%Y-%m-%d')
-                ))
+                    expiration_date=action_data.get('expiration_date')
+                )
+                transaction = transaction_event(
+                    transaction_id, item_id, 'purchase', action_data.get('current_quantity', 0),
+                    action_data.get('total_cost', 0), 'AI-suggested purchase'
+                )
             
             conn.commit()
+            if transaction:
+                waste_tracker.apply(waste_change)
+            publish_item_write(cursor, item_id, None, transaction)
             conn.close()
             
             return jsonify({
@@ -929,12 +1749,9 @@ def ai_inventory_action():
             quantity = action_data.get('quantity', 0)
             notes = action_data.get('notes', 'AI-suggested action')
             
+            before = load_item(cursor, inventory_id)
             # Add transaction
-            cursor.execute('''
-                INSERT INTO inventory_transactions 
-                (inventory_id, transaction_type, quantity, cost, notes, date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (inventory_id, transaction_type, quantity, 0, notes, datetime.now().strftime('%Y-%m-%d')))
+            transaction_id, waste_change = record_transaction(cursor, inventory_id, transaction_type, quantity, 0, notes)
             
             # Update inventory quantity
             cursor.execute('''
@@ -944,6 +1761,10 @@ def ai_inventory_action():
             ''', (quantity, inventory_id))
             
             conn.commit()
+            waste_tracker.apply(waste_change)
+            publish_item_write(cursor, inventory_id, before, transaction_event(
+                transaction_id, inventory_id, transaction_type, quantity, 0, notes
+            ))
             conn.close()
             
             return jsonify({
@@ -953,67 +1774,116 @@ def ai_inventory_action():
             
         elif action_type == "suggest_donation":
             # Get items suitable for donation
+            # Lots expiring soon (not yet expired), overstock, or stock forecast to go to waste
+            today = datetime.now().date()
+            expiring = expiring_quantities(cursor, days=5, today=today)
             cursor.execute('''
-                SELECT id, name, current_quantity, unit, expiration_date
-                FROM inventory 
-                WHERE current_quantity > 0 
-                AND (expiration_date <= date('now', '+5 days') OR current_quantity > max_quantity)
-                ORDER BY expiration_date ASC
-            ''')
-            donation_candidates = cursor.fetchall()
-            conn.close()
+                SELECT i.id, i.name, i.current_quantity, i.unit, i.expiration_date, i.category,
+                       i.max_quantity, w.expected_waste, w.risk_score
+                FROM inventory i
+                LEFT JOIN waste_risk_scores w ON w.inventory_id = i.id
+                WHERE i.current_quantity > 0 
+                AND (i.id IN (
+                        SELECT inventory_id FROM inventory_lots
+                        WHERE quantity_remaining > 0
+                        AND expiration_date >= ? AND expiration_date <= ?
+                     )
+                     OR i.current_quantity > i.max_quantity OR w.risk_score >= ?)
+                ORDER BY COALESCE(w.risk_score, 0) DESC, i.expiration_date ASC
+            ''', (today.isoformat(), (today + timedelta(days=5)).isoformat(), DONATION_RISK_THRESHOLD))
+            donation_candidates = []
+            for item_id, name, on_hand, unit, expiration_date, category, max_quantity, expected_waste, risk in cursor.fetchall():
+                expiring_quantity, expiring_date = expiring.get(item_id, (0, None))
+                overstock = on_hand - max_quantity if max_quantity and on_hand > max_quantity else 0
+                # Donate what would otherwise expire, sit above max, or be wasted, never more than on hand
+                quantity = min(on_hand, max(expiring_quantity, overstock, expected_waste or 0))
+                if quantity <= 0:
+                    continue
+                donation_candidates.append({
+                    "id": item_id,
+                    "name": name,
+                    "quantity": round(quantity, 2),
+                    "current_quantity": on_hand,
+                    "expiring_quantity": round(expiring_quantity, 2),
+                    "unit": unit,
+                    "expiration_date": expiring_date or expiration_date,
+                    "category": category,
+                    "expected_waste": expected_waste,
+                    "waste_risk": risk
+                })
             
             if not donation_candidates:
+                conn.close()
                 return jsonify({
                     "success": True,
                     "message": "No items currently suitable for donation",
                     "donation_candidates": []
                 })
             
-            # Use AI to analyze donation opportunities
-            candidates_text = "Items suitable for donation:\n"
-            for item in donation_candidates:
-                candidates_text += f"- {item[1]}: {item[2]} {item[3]} (expires: {item[4]})\n"
+            # Match candidates to food bank needs locally
+            matcher = get_matcher(cursor)
+            conn.close()
+            for candidate in donation_candidates:
+                candidate["matches"] = matcher.match_item({
+                    "name": candidate["name"],
+                    "category": candidate["category"],
+                    "unit": candidate["unit"],
+                    "current_quantity": candidate["quantity"],
+                    "expiration_date": candidate["expiration_date"]
+                })
+            
+            # Use AI only to explain the matches
+            candidates_text = "\n".join(
+                [f"- {candidate['name']}: {candidate['quantity']} {candidate['unit']} (expires: {candidate['expiration_date']})"
+                 + (f", {candidate['expected_waste']} {candidate['unit']} forecast to go to waste"
+                    if candidate['expected_waste'] else "")
+                 + ("\n  " + "\n  ".join(format_match(match) for match in candidate["matches"])
+                    if candidate["matches"] else "\n  No matching food bank need")
+                 for candidate in donation_candidates]
+            )
             
             prompt = f"""
-            Based on the following inventory items that are expiring soon or overstocked, provide donation recommendations:
+            The following inventory items are expiring soon or overstocked. Each one is listed with the food bank needs it has already been matched to, best match first:
             
             {candidates_text}
             
-            For each item, suggest:
-            1. Recommended donation quantity
-            2. Best recipient organization (food bank, shelter, etc.)
-            3. Reason for donation
-            4. Urgency level
-            
-            Format as JSON with donation recommendations.
+            Write short, practical donation recommendations for the restaurant manager. For each item, explain
+            why the top match is a good fit, the suggested quantity, and how urgent the donation is.
+            Do not invent food banks or contacts that are not listed above.
             """
             
             client = openai.OpenAI(api_key=openai.api_key)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an expert in food donation and waste reduction. Provide practical donation recommendations."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=800,
-                temperature=0.3
-            )
+            try:
+                response = tracked_completion(
+                    client,
+                    "suggest_donation",
+                    "donation_explanation",
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are an expert in food donation and waste reduction. Provide practical donation recommendations."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=800,
+                    temperature=0.3
+                )
+            except BudgetExceeded as e:
+                if BUDGET_MODE == 'fail':
+                    return jsonify({"error": str(e)}), 429
+                # The matches are computed locally, so they are still useful without the prose
+                return jsonify({
+                    "success": True,
+                    "message": "Donation matches found (AI explanation unavailable: daily budget reached)",
+                    "donation_candidates": donation_candidates,
+                    "ai_analysis": None,
+                    "degraded": True
+                })
             
             donation_analysis = response.choices[0].message.content
             
             return jsonify({
                 "success": True,
                 "message": "Donation recommendations generated",
-                "donation_candidates": [
-                    {
-                        "id": item[0],
-                        "name": item[1],
-                        "quantity": item[2],
-                        "unit": item[3],
-                        "expiration_date": item[4]
-                    } for item in donation_candidates
-                ],
+                "donation_candidates": donation_candidates,
                 "ai_analysis": donation_analysis
             })
         
@@ -1025,36 +1895,110 @@ def ai_inventory_action():
         print(f"Error in ai_inventory_action: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Columns the demand history listing shows; analyses are fetched per calculation
+DEMAND_SUMMARY_FIELDS = [
+    'id', 'dish_name', 'major_ingredients', 'category', 'cuisine', 'dish_price', 'final_price',
+    'discount_applied', 'discount_percentage', 'discount_amount', 'predicted_orders', 'total_price',
+    'created_at', 'updated_at', 'has_analysis'
+]
+
+def load_demand_calculations(cursor, calculation_id=None):
+    """Demand calculations with their ingredient analysis, newest first"""
+    # SQLite checks the stored analysis parses, so it can be spliced into
+    # the response as it is instead of being decoded and encoded again
+    cursor.execute(f'''
+        SELECT d.*, a.analysis AS analysis_text, json_valid(a.analysis) AS analysis_valid
+        FROM demand_calculations d
+        LEFT JOIN demand_analyses a ON a.calculation_id = d.id
+        {'WHERE d.id = ?' if calculation_id is not None else ''}
+        ORDER BY d.created_at DESC
+    ''', () if calculation_id is None else (calculation_id,))
+    columns = [description[0] for description in cursor.description]
+    
+    # Convert to list of dictionaries
+    history = []
+    for row in cursor.fetchall():
+        item = dict(zip(columns, row))
+        analysis = item.pop('analysis_text')
+        valid = item.pop('analysis_valid')
+        item['ingredient_analysis'] = RawJSON(analysis) if analysis and valid else None
+        history.append(item)
+    return history
+
 @app.route("/api/demand-history", methods=["GET"])
+@conditional_get('demand_calculations', 'demand_analyses')
 def get_demand_history():
-    """Get all past demand calculations"""
+    """Get past demand calculations, newest first
+
+    Returns every calculation with its ingredient analysis by default. Pass
+    view=summary for {"items", "next_cursor"} pages of the listing columns
+    only, with has_analysis in place of the analysis (fetch it from
+    /api/demand-history/<id>). Summary pages take limit, cursor, fields,
+    dish and category (comma separated) and start/end (YYYY-MM-DD).
+    """
     try:
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM demand_calculations 
-            ORDER BY created_at DESC
-        ''')
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
+        try:
+            if request.args.get('view') == 'summary':
+                fields, filters = list_args('dish', 'category')
+                items, next_cursor = fetch_page(
+                    cursor, 'demand-history', request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+                    request.args.get('cursor'), fields or DEMAND_SUMMARY_FIELDS, filters,
+                    parse_day(request.args.get('start'), None), parse_day(request.args.get('end'), None)
+                )
+                return jsonify({"items": items, "next_cursor": next_cursor})
+
+            return jsonify(load_demand_calculations(cursor))
+        finally:
+            conn.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/demand-history/<int:calculation_id>", methods=["GET"])
+@conditional_get('demand_calculations', 'demand_analyses')
+def get_demand_calculation(calculation_id):
+    """Get one demand calculation with its ingredient analysis"""
+    try:
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        calculations = load_demand_calculations(cursor, calculation_id)
         conn.close()
-        
-        # Convert to list of dictionaries
-        history = []
-        for row in rows:
-            item = dict(zip(columns, row))
-            # Parse ingredient analysis if it exists
-            if item['ingredient_analysis']:
-                try:
-                    item['ingredient_analysis'] = json.loads(item['ingredient_analysis'])
-                except:
-                    item['ingredient_analysis'] = None
-            history.append(item)
-        
-        return jsonify(history)
+
+        if not calculations:
+            return jsonify({"error": "Calculation not found"}), 404
+        return jsonify(calculations[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def export_response(name):
+    """Stream an export as a file download
+
+    Query parameters: format (csv, ndjson, parquet), start and end
+    (YYYY-MM-DD, inclusive) and types (comma separated).
+    """
+    try:
+        export_format = request.args.get('format', 'csv')
+        start = parse_day(request.args.get('start'), None)
+        end = parse_day(request.args.get('end'), None)
+        types = [value for value in request.args.get('types', '').split(',') if value]
+        chunks = stream_export(name, export_format, start, end, types)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = app.response_class(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
+
+@app.route("/api/demand-history/export", methods=["GET"])
+@conditional_get('demand_calculations', 'demand_analyses')
+def export_demand_history():
+    """Stream demand calculations as CSV, NDJSON or Parquet; types filters by category"""
+    return export_response('demand-history')
+
 @app.route("/api/recalculate/<int:calculation_id>", methods=["POST"])
 def recalculate_demand(calculation_id):
     """Recalculate demand for a specific dish"""
@@ -1170,26 +2114,49 @@ def delete_demand_calculation(calculation_id):
 
 # Inventory Management API Endpoints
 
+def list_args(*filter_names):
+    """Parse fields= and comma separated filter query parameters"""
+    fields = [value for value in request.args.get('fields', '').split(',') if value]
+    filters = {
+        name: [value for value in request.args.get(name, '').split(',') if value]
+        for name in filter_names
+    }
+    return fields, filters
+
 @app.route("/api/inventory", methods=["GET"])
+@conditional_get('inventory')
 def get_inventory():
-    """Get all inventory items"""
+    """Get inventory items ordered by name
+
+    Returns every item as a list by default. Pass limit (and cursor for the
+    following pages) to get {"items", "next_cursor"} pages instead. fields and
+    category/supplier filters work either way.
+    """
     try:
+        fields, filters = list_args('category', 'supplier')
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM inventory 
-            ORDER BY name ASC
-        ''')
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-        conn.close()
-        
-        inventory = []
-        for row in rows:
-            item = dict(zip(columns, row))
-            inventory.append(item)
-        
-        return jsonify(inventory)
+        try:
+            if paginated:
+                items, next_cursor = fetch_page(
+                    cursor, 'inventory', limit, request.args.get('cursor'), fields, filters
+                )
+                return jsonify({"items": items, "next_cursor": next_cursor})
+
+            inventory = []
+            next_cursor = None
+            while True:
+                items, next_cursor = fetch_page(cursor, 'inventory', 1000, next_cursor, fields, filters)
+                inventory.extend(items)
+                if not next_cursor:
+                    return jsonify(inventory)
+        finally:
+            conn.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1222,22 +2189,27 @@ def add_inventory():
         ))
         
         item_id = cursor.lastrowid
+        transaction = None
         
         # Add purchase transaction if quantity > 0
         if data.get('current_quantity', 0) > 0:
-            cursor.execute('''
-                INSERT INTO inventory_transactions 
-                (inventory_id, transaction_type, quantity, cost, notes, date)
-                VALUES (?, 'purchase', ?, ?, ?, ?)
-            ''', (
-                item_id,
+            transaction_id, waste_change = record_transaction(
+                cursor, item_id, 'purchase',
                 data.get('current_quantity', 0),
                 data.get('total_cost', 0),
                 'Initial purchase',
-                data.get('purchase_date', datetime.now().strftime('%Y-%m-%d'))
-            ))
+                data.get('purchase_date'),
+                expiration_date=data.get('expiration_date')
+            )
+            transaction = transaction_event(
+                transaction_id, item_id, 'purchase', data.get('current_quantity', 0),
+                data.get('total_cost', 0), 'Initial purchase', data.get('purchase_date')
+            )
         
         conn.commit()
+        if transaction:
+            waste_tracker.apply(waste_change)
+        publish_item_write(cursor, item_id, None, transaction)
         conn.close()
         
         return jsonify({"id": item_id, "message": "Inventory item added successfully"})
@@ -1252,6 +2224,7 @@ def update_inventory(item_id):
         
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
+        before = load_item(cursor, item_id)
         cursor.execute('''
             UPDATE inventory 
             SET name = ?, category = ?, unit = ?, current_quantity = ?, 
@@ -1274,9 +2247,17 @@ def update_inventory(item_id):
             data.get('notes'),
             item_id
         ))
+        if before:
+            # Only an edited expiry is pushed down to the lots; an unchanged one is their earliest
+            expiration_date = data.get('expiration_date')
+            reconcile_lots(cursor, item_id, data.get('current_quantity'),
+                           expiration_date if expiration_date != before['expiration_date'] else None)
         
         conn.commit()
+        publish_item_write(cursor, item_id, before)
         conn.close()
+        # Names and units shown in the most-wasted list may have changed
+        waste_tracker.invalidate()
         
         return jsonify({"message": "Inventory item updated successfully"})
     except Exception as e:
@@ -1290,8 +2271,8 @@ def delete_inventory_item(item_id):
         cursor = conn.cursor()
         
         # Check if item exists
-        cursor.execute('SELECT id FROM inventory WHERE id = ?', (item_id,))
-        if not cursor.fetchone():
+        before = load_item(cursor, item_id)
+        if not before:
             conn.close()
             return jsonify({"error": "Item not found"}), 404
         
@@ -1302,7 +2283,9 @@ def delete_inventory_item(item_id):
         cursor.execute('DELETE FROM inventory WHERE id = ?', (item_id,))
         
         conn.commit()
+        publish_item_write(cursor, item_id, before)
         conn.close()
+        waste_tracker.invalidate()
         
         return jsonify({"message": "Item deleted successfully"})
         
@@ -1329,13 +2312,15 @@ def add_inventory_transaction(item_id):
         cursor = conn.cursor()
         
         print(f"DEBUG: Adding transaction for item_id: {item_id}")
+        before = load_item(cursor, item_id)
+        
+        # Purchases are valued at their own price; everything else at the item's average cost
+        unit_cost = cost / quantity if transaction_type == 'purchase' and cost and quantity > 0 else None
         
         # Add transaction
-        cursor.execute('''
-            INSERT INTO inventory_transactions 
-            (inventory_id, transaction_type, quantity, cost, notes, date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (item_id, transaction_type, quantity, cost, notes, date))
+        transaction_id, waste_change = record_transaction(cursor, item_id, transaction_type, quantity, cost, notes,
+                                                          date, unit_cost=unit_cost,
+                                                          expiration_date=data.get('expiration_date'))
         
         print(f"DEBUG: Transaction inserted successfully")
         
@@ -1351,17 +2336,25 @@ def add_inventory_transaction(item_id):
             print(f"DEBUG: Inventory updated - subtracted {quantity}")
         elif transaction_type == 'purchase':
             print(f"DEBUG: Updating inventory - adding {quantity} to item {item_id}")
-            # Add to current quantity
+            # Add to current quantity, blending the purchase price into the average cost
+            cursor.execute('SELECT current_quantity, cost_per_unit FROM inventory WHERE id = ?', (item_id,))
+            on_hand, average_cost = cursor.fetchone() or (0, 0)
+            if unit_cost is not None:
+                average_cost = weighted_average_cost(on_hand, average_cost, quantity, unit_cost)
             cursor.execute('''
                 UPDATE inventory 
                 SET current_quantity = current_quantity + ?, 
                     cost_per_unit = ?, total_cost = total_cost + ?,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
-            ''', (quantity, cost/quantity if quantity > 0 else 0, cost, item_id))
+            ''', (quantity, average_cost, cost, item_id))
             print(f"DEBUG: Inventory updated - added {quantity}")
         
         conn.commit()
+        waste_tracker.apply(waste_change)
+        publish_item_write(cursor, item_id, before, transaction_event(
+            transaction_id, item_id, transaction_type, quantity, cost, notes, date
+        ))
         conn.close()
         
         print(f"DEBUG: Transaction completed successfully")
@@ -1372,6 +2365,271 @@ def add_inventory_transaction(item_id):
         print(f"DEBUG: Full traceback: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/inventory/bulk", methods=["POST"])
+def bulk_import_inventory():
+    """Import a CSV or NDJSON body of transactions and new items
+
+    The format comes from ?format= or the Content-Type. Valid lines are
+    imported and invalid ones are reported with their line numbers.
+    """
+    try:
+        import_format = request.args.get('format') or (
+            'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+        )
+        conn = sqlite3.connect('demand_history.db', timeout=30)
+        try:
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            report = import_stream(conn, stream, import_format)
+        finally:
+            conn.close()
+            waste_tracker.invalidate()
+        if report['transactions'] or report['items_created']:
+            # Too many rows to push one by one; clients catch up through the change feed
+            change_broker.publish('resync', {'reason': 'bulk_import', 'transactions': report['transactions'],
+                                             'items_created': report['items_created']})
+
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def reorder_plan_args():
+    """Parse the optimizer's service_level and review_days query parameters"""
+    service_level = request.args.get('service_level', DEFAULT_SERVICE_LEVEL, type=float)
+    review_days = request.args.get('review_days', DEFAULT_REVIEW_DAYS, type=int)
+    return service_level, review_days
+
+@app.route("/api/inventory/reorder-points", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', 'supplier_lead_times', daily=True)
+def get_reorder_points():
+    """Safety stock, reorder point and order-up-to level for every item"""
+    try:
+        service_level, review_days = reorder_plan_args()
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        plan = get_reorder_plan(cursor, service_level, review_days)
+        conn.close()
+
+        return jsonify(plan)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/purchase-suggestions", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', 'supplier_lead_times', daily=True)
+def get_purchase_suggestions():
+    """Items at or below their reorder point with order quantities, grouped by supplier"""
+    try:
+        service_level, review_days = reorder_plan_args()
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        suppliers = purchase_suggestions(get_reorder_plan(cursor, service_level, review_days))
+        conn.close()
+
+        return jsonify({
+            "service_level": service_level,
+            "review_days": review_days,
+            "suppliers": suppliers,
+            "items_to_order": sum(len(supplier['items']) for supplier in suppliers),
+            "estimated_cost": round(sum(supplier['estimated_cost'] for supplier in suppliers), 2)
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/suppliers/<path:supplier>/lead-time", methods=["PUT"])
+def set_supplier_lead_time(supplier):
+    """Set a supplier's delivery lead time in days (mean and standard deviation)"""
+    try:
+        data = request.get_json() or {}
+        lead_time_days = float(data.get('lead_time_days'))
+        lead_time_std_days = float(data.get('lead_time_std_days', 0))
+        if lead_time_days < 0 or lead_time_std_days < 0:
+            return jsonify({"error": "Lead times cannot be negative"}), 400
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO supplier_lead_times (supplier, lead_time_days, lead_time_std_days)
+            VALUES (?, ?, ?)
+            ON CONFLICT (supplier) DO UPDATE SET
+                lead_time_days = excluded.lead_time_days,
+                lead_time_std_days = excluded.lead_time_std_days,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (supplier, lead_time_days, lead_time_std_days))
+        conn.commit()
+        conn.close()
+
+        return jsonify({
+            "supplier": supplier,
+            "lead_time_days": lead_time_days,
+            "lead_time_std_days": lead_time_std_days
+        })
+    except (TypeError, ValueError):
+        return jsonify({"error": "lead_time_days must be a number"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/expiring", methods=["GET"])
+@conditional_get('inventory', 'inventory_lots', daily=True)
+def get_expiring_lots():
+    """Open lots expiring within ?days= days, soonest first, with totals per item"""
+    try:
+        days = request.args.get('days', 7, type=int)
+        include_expired = request.args.get('include_expired', 'false').lower() == 'true'
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        lots = expiring_lots(cursor, days, include_expired)
+        conn.close()
+
+        items = {}
+        for lot in lots:
+            item = items.setdefault(lot['inventory_id'], {
+                "inventory_id": lot['inventory_id'],
+                "name": lot['name'],
+                "unit": lot['unit'],
+                "quantity": 0,
+                "earliest_expiration": lot['expiration_date']
+            })
+            item["quantity"] = round(item["quantity"] + lot['quantity'], 2)
+        return jsonify({"days": days, "lots": lots, "items": list(items.values())})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/<int:item_id>/lots", methods=["GET"])
+@conditional_get('inventory', 'inventory_lots')
+def get_inventory_lots(item_id):
+    """Open lots of an item in the order they will be consumed"""
+    try:
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        cursor.execute('SELECT current_quantity FROM inventory WHERE id = ?', (item_id,))
+        item = cursor.fetchone()
+        if not item:
+            conn.close()
+            return jsonify({"error": "Item not found"}), 404
+        lots = item_lots(cursor, item_id)
+        conn.close()
+
+        tracked = sum(lot['quantity_remaining'] for lot in lots)
+        return jsonify({
+            "inventory_id": item_id,
+            "current_quantity": item[0],
+            "untracked_quantity": round(max((item[0] or 0) - tracked, 0), 2),
+            "lots": lots
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/resolve", methods=["GET"])
+@conditional_get('inventory', 'item_aliases')
+def resolve_item_name():
+    """Resolve a free-text item name to an inventory item, with the closest candidates"""
+    try:
+        name = request.args.get('name', '')
+        limit = request.args.get('limit', 5, type=int)
+        if not name.strip():
+            return jsonify({"error": "name is required"}), 400
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        try:
+            match = item_resolver.resolve(cursor, name)
+            candidates = item_resolver.candidates(cursor, name, max(1, min(limit, 20)))
+        finally:
+            conn.close()
+        return jsonify({"name": name, "match": match, "candidates": candidates})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/aliases", methods=["GET"])
+@conditional_get('inventory', 'item_aliases')
+def get_item_aliases():
+    """List item name aliases"""
+    try:
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT a.alias, a.inventory_id, i.name
+            FROM item_aliases a
+            JOIN inventory i ON a.inventory_id = i.id
+            ORDER BY a.alias
+        ''')
+        aliases = [{"alias": alias, "inventory_id": inventory_id, "name": name}
+                   for alias, inventory_id, name in cursor.fetchall()]
+        conn.close()
+        return jsonify(aliases)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/aliases", methods=["PUT"])
+def set_item_alias():
+    """Point an alias at an inventory item, replacing any previous target"""
+    try:
+        data = request.get_json() or {}
+        alias = normalize_name(data.get('alias'))
+        if not alias:
+            return jsonify({"error": "alias is required"}), 400
+        try:
+            inventory_id = int(data.get('inventory_id'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "inventory_id must be an integer"}), 400
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        cursor.execute('SELECT name FROM inventory WHERE id = ?', (inventory_id,))
+        item = cursor.fetchone()
+        if not item:
+            conn.close()
+            return jsonify({"error": "Item not found"}), 404
+        cursor.execute('''
+            INSERT INTO item_aliases (alias, inventory_id) VALUES (?, ?)
+            ON CONFLICT (alias) DO UPDATE SET inventory_id = excluded.inventory_id, created_at = CURRENT_TIMESTAMP
+        ''', (alias, inventory_id))
+        conn.commit()
+        conn.close()
+        return jsonify({"alias": alias, "inventory_id": inventory_id, "name": item[0]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/aliases/<path:alias>", methods=["DELETE"])
+def delete_item_alias(alias):
+    """Remove an item name alias"""
+    try:
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM item_aliases WHERE alias = ?', (normalize_name(alias),))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        if not deleted:
+            return jsonify({"error": "Alias not found"}), 404
+        return jsonify({"message": "Alias deleted successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/admin/llm-metrics", methods=["GET"])
+@conditional_get('llm_metrics', daily=True)
+def get_llm_metrics():
+    """Get AI latency percentiles, token usage and spend per endpoint and per day"""
+    try:
+        days = request.args.get('days', 7, type=int)
+        
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        summary = get_metrics_summary(cursor, days=days)
+        conn.close()
+        
+        return jsonify(summary)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/debug/transaction", methods=["POST"])
 def debug_transaction():
     """Debug endpoint to test transaction data"""
@@ -1442,230 +2700,221 @@ def debug_database():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/inventory/transactions", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions')
 def get_inventory_transactions():
-    """Get all inventory transactions with comprehensive data"""
+    """Get one page of inventory transactions, newest first
+
+    Query parameters: limit (default 100), cursor (next_cursor of the previous
+    page), fields, types, category and start/end (YYYY-MM-DD). The first page
+    also carries per-type summary totals for the same filters.
+    """
     try:
+        fields, filters = list_args('types', 'category')
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        after = request.args.get('cursor')
+        start = parse_day(request.args.get('start'), None)
+        end = parse_day(request.args.get('end'), None)
+
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT it.*, i.name as inventory_name, i.unit, i.category, i.cost_per_unit
-            FROM inventory_transactions it
-            JOIN inventory i ON it.inventory_id = i.id
-            ORDER BY it.date DESC, it.created_at DESC
-        ''')
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-        
-        # Get summary statistics
-        cursor.execute('''
-            SELECT 
-                transaction_type,
-                COUNT(*) as count,
-                SUM(quantity) as total_quantity,
-                SUM(cost) as total_cost,
-                AVG(quantity) as avg_quantity
-            FROM inventory_transactions
-            GROUP BY transaction_type
-        ''')
-        summary_stats = cursor.fetchall()
-        
-        conn.close()
-        
-        transactions = []
-        for row in rows:
-            transaction = dict(zip(columns, row))
-            # Add calculated total value
-            if transaction.get('cost_per_unit'):
-                transaction['total_value'] = transaction['quantity'] * transaction['cost_per_unit']
-            else:
-                transaction['total_value'] = 0
-            transactions.append(transaction)
-        
-        # Convert summary stats
-        summary = {}
-        for stat in summary_stats:
-            summary[stat[0]] = {
-                'count': stat[1],
-                'total_quantity': stat[2],
-                'total_cost': stat[3],
-                'avg_quantity': stat[4]
+        try:
+            transactions, next_cursor = fetch_page(
+                cursor, 'transactions', limit, after, fields, filters, start, end
+            )
+            response = {
+                'transactions': transactions,
+                'next_cursor': next_cursor
             }
-        
+            if not after:
+                response['summary'] = transaction_summary(cursor, filters, start, end)
+        finally:
+            conn.close()
+
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def transaction_summary(cursor, filters, start, end):
+    """Per-type totals from the daily rollup instead of every transaction row"""
+    conditions = []
+    params = []
+    if filters.get('types'):
+        conditions.append(f"r.transaction_type IN ({', '.join('?' * len(filters['types']))})")
+        params.extend(filters['types'])
+    if filters.get('category'):
+        conditions.append(f"i.category IN ({', '.join('?' * len(filters['category']))})")
+        params.extend(filters['category'])
+    if start:
+        conditions.append('r.day >= ?')
+        params.append(start.isoformat())
+    if end:
+        conditions.append('r.day <= ?')
+        params.append(end.isoformat())
+
+    cursor.execute(f'''
+        SELECT r.transaction_type, SUM(r.transaction_count), SUM(r.quantity), SUM(r.cost)
+        FROM daily_item_rollup r
+        JOIN inventory i ON r.inventory_id = i.id
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        GROUP BY r.transaction_type
+    ''', params)
+
+    summary = {}
+    for transaction_type, count, total_quantity, total_cost in cursor.fetchall():
+        summary[transaction_type] = {
+            'count': count,
+            'total_quantity': total_quantity,
+            'total_cost': total_cost,
+            'avg_quantity': total_quantity / count if count else 0
+        }
+    return summary
+
+@app.route("/api/inventory/transactions/export", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions')
+def export_inventory_transactions():
+    """Stream inventory transactions as CSV, NDJSON or Parquet; types filters by transaction type"""
+    return export_response('transactions')
+
+@app.route("/api/inventory/changes", methods=["GET"])
+def get_inventory_changes():
+    """Inventory and transaction changes after a sequence number, for delta sync"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', CHANGE_FEED_DEFAULT_LIMIT, type=int)
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        try:
+            changes = get_changes(cursor, since, limit)
+        finally:
+            conn.close()
+        return jsonify(changes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/inventory/stream", methods=["GET"])
+def stream_inventory_changes():
+    """Server-Sent Events of inventory, transaction, low-stock and expiry changes
+
+    The hello event carries the change feed sequence at connect time; after a
+    resync event, clients catch up with /api/inventory/changes.
+    """
+    try:
+        subscription = change_broker.subscribe()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    try:
+        # Read after subscribing, so a write committed in between is either
+        # covered by the sequence or delivered as an event, never missed
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        seq = current_sequence(cursor)
+        conn.close()
+    except Exception as e:
+        change_broker.unsubscribe(subscription)
+        return jsonify({"error": str(e)}), 500
+
+    response = app.response_class(event_stream(change_broker, subscription, {'seq': seq}),
+                                  mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ANALYTICS_ENGINE=columnar serves the dashboard from in-memory NumPy columns
+SNAPSHOT_BUILDER = columnar_dashboard_snapshot if columnar_enabled() else build_dashboard_snapshot
+
+@app.route("/api/analytics/snapshot", methods=["GET"])
+def get_analytics_snapshot():
+    """Get every dashboard chart in one payload, with ETag revalidation"""
+    try:
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        etag = snapshot_etag(cursor)
+
+        # Unchanged data: answer from the version counters alone
+        if request.if_none_match.contains_weak(etag):
+            conn.close()
+            response = app.response_class(status=304)
+        else:
+            snapshot = get_dashboard_snapshot(cursor, etag, SNAPSHOT_BUILDER)
+            conn.close()
+            response = jsonify(snapshot)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def load_analytics_snapshot():
+    """Current dashboard snapshot, recomputed only when its ETag changes"""
+    conn = sqlite3.connect('demand_history.db')
+    cursor = conn.cursor()
+    try:
+        return get_dashboard_snapshot(cursor, snapshot_etag(cursor), SNAPSHOT_BUILDER)
+    finally:
+        conn.close()
+
+@app.route("/api/analytics/query", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
+def query_analytics():
+    """Aggregate transactions into day/week/month buckets over any date range
+
+    Query parameters: start, end (YYYY-MM-DD), granularity (day, week, month),
+    group_by and measures (comma separated) and optional transaction types.
+    """
+    try:
+        end = parse_day(request.args.get('end'), datetime.utcnow().date())
+        start = parse_day(request.args.get('start'), end - timedelta(days=SNAPSHOT_WEEKS * 7 - 1))
+        granularity = request.args.get('granularity', 'week')
+        group_by = [value for value in request.args.get('group_by', 'transaction_type').split(',') if value]
+        measures = [value for value in request.args.get('measures', 'quantity').split(',') if value]
+        transaction_types = [value for value in request.args.get('types', '').split(',') if value]
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        try:
+            rows = run_bucket_query(cursor, start, end, granularity, group_by, measures, transaction_types)
+        finally:
+            conn.close()
+
         return jsonify({
-            'transactions': transactions,
-            'summary': summary
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "granularity": granularity,
+            "group_by": group_by,
+            "measures": measures,
+            "rows": rows
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/weekly-trends", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
 def get_weekly_trends():
     """Get weekly trends data for the last 10 weeks"""
     try:
-        conn = sqlite3.connect('demand_history.db')
-        cursor = conn.cursor()
-        
-        print("DEBUG: Starting weekly trends query")
-        
-        # Get data for the last 10 weeks using a simpler approach
-        cursor.execute('''
-            SELECT 
-                CASE 
-                    WHEN julianday('now') - julianday(date) <= 7 THEN 1
-                    WHEN julianday('now') - julianday(date) <= 14 THEN 2
-                    WHEN julianday('now') - julianday(date) <= 21 THEN 3
-                    WHEN julianday('now') - julianday(date) <= 28 THEN 4
-                    WHEN julianday('now') - julianday(date) <= 35 THEN 5
-                    WHEN julianday('now') - julianday(date) <= 42 THEN 6
-                    WHEN julianday('now') - julianday(date) <= 49 THEN 7
-                    WHEN julianday('now') - julianday(date) <= 56 THEN 8
-                    WHEN julianday('now') - julianday(date) <= 63 THEN 9
-                    WHEN julianday('now') - julianday(date) <= 70 THEN 10
-                    ELSE 0
-                END as week_number,
-                transaction_type,
-                SUM(quantity) as total_quantity
-            FROM inventory_transactions it
-            LEFT JOIN inventory i ON it.inventory_id = i.id
-            WHERE date >= date('now', '-70 days')
-            AND julianday('now') - julianday(date) <= 70
-            GROUP BY week_number, transaction_type
-            HAVING week_number > 0
-            ORDER BY week_number ASC
-        ''')
-        
-        weekly_data = cursor.fetchall()
-        print(f"DEBUG: Weekly trends query returned {len(weekly_data)} rows")
-        print(f"DEBUG: Raw weekly data: {weekly_data}")
-        conn.close()
-        
-        # Format data for charts - create a dictionary to aggregate by week
-        week_data = {}
-        for row in weekly_data:
-            week_num = row[0]
-            transaction_type = row[1]
-            quantity = row[2]
-            
-            if week_num not in week_data:
-                week_data[week_num] = {
-                    'used': 0,
-                    'wasted': 0,
-                    'donated': 0,
-                    'purchased': 0
-                }
-            
-            if transaction_type == 'usage':
-                week_data[week_num]['used'] += quantity
-            elif transaction_type == 'waste':
-                week_data[week_num]['wasted'] += quantity
-            elif transaction_type == 'donation':
-                week_data[week_num]['donated'] += quantity
-            elif transaction_type == 'purchase':
-                week_data[week_num]['purchased'] += quantity
-        
-        # Convert to chart format, ensuring all 10 weeks are represented
-        # Week 1 = Current Week, Week 2 = Week -1, etc.
-        # Reverse order so Current Week appears on the right
-        chart_data = []
-        for week_num in range(10, 0, -1):  # Count backwards from 10 to 1
-            week_info = week_data.get(week_num, {'used': 0, 'wasted': 0, 'donated': 0, 'purchased': 0})
-            if week_num == 1:
-                week_label = 'Current Week'
-            else:
-                week_label = f'Week -{week_num - 1}'
-            
-            chart_data.append({
-                'week': week_label,
-                'used': round(week_info['used'], 2),
-                'wasted': round(week_info['wasted'], 2),
-                'donated': round(week_info['donated'], 2),
-                'purchased': round(week_info['purchased'], 2),
-                'total': round(week_info['used'] + week_info['wasted'] + week_info['donated'], 2)
-            })
-        
-        print(f"DEBUG: Final weekly chart data: {chart_data}")
-        return jsonify(chart_data)
+        return jsonify(load_analytics_snapshot()['weekly_trends'])
     except Exception as e:
-        print(f"DEBUG: Error in weekly trends: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/financial-optimization", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
 def get_financial_optimization():
     """Get financial optimization data (money wasted per week) for the last 10 weeks"""
     try:
-        conn = sqlite3.connect('demand_history.db')
-        cursor = conn.cursor()
-        
-        print("DEBUG: Starting financial optimization query")
-        
-        # First, let's check if we have any waste transactions
-        cursor.execute('SELECT COUNT(*) FROM inventory_transactions WHERE transaction_type = "waste"')
-        waste_count = cursor.fetchone()[0]
-        print(f"DEBUG: Found {waste_count} waste transactions")
-        
-        # Get waste data with costs for the last 10 weeks using the same week calculation
-        cursor.execute('''
-            SELECT 
-                CASE 
-                    WHEN julianday('now') - julianday(date) <= 7 THEN 1
-                    WHEN julianday('now') - julianday(date) <= 14 THEN 2
-                    WHEN julianday('now') - julianday(date) <= 21 THEN 3
-                    WHEN julianday('now') - julianday(date) <= 28 THEN 4
-                    WHEN julianday('now') - julianday(date) <= 35 THEN 5
-                    WHEN julianday('now') - julianday(date) <= 42 THEN 6
-                    WHEN julianday('now') - julianday(date) <= 49 THEN 7
-                    WHEN julianday('now') - julianday(date) <= 56 THEN 8
-                    WHEN julianday('now') - julianday(date) <= 63 THEN 9
-                    WHEN julianday('now') - julianday(date) <= 70 THEN 10
-                    ELSE 0
-                END as week_number,
-                SUM(it.quantity * COALESCE(i.cost_per_unit, 0)) as money_wasted
-            FROM inventory_transactions it
-            LEFT JOIN inventory i ON it.inventory_id = i.id
-            WHERE it.transaction_type = 'waste' 
-            AND it.date >= date('now', '-70 days')
-            AND julianday('now') - julianday(date) <= 70
-            GROUP BY week_number
-            HAVING week_number > 0
-            ORDER BY week_number ASC
-        ''')
-        
-        financial_data = cursor.fetchall()
-        print(f"DEBUG: Query returned {len(financial_data)} rows")
-        print(f"DEBUG: Raw data: {financial_data}")
-        
-        conn.close()
-        
-        # Format data for line chart - create a dictionary to aggregate by week
-        week_financial_data = {}
-        for row in financial_data:
-            week_num = row[0]
-            money_wasted = row[1]
-            week_financial_data[week_num] = money_wasted
-        
-        # Convert to chart format, ensuring all 10 weeks are represented
-        # Week 1 = Current Week, Week 2 = Week -1, etc.
-        # Reverse order so Current Week appears on the right
-        chart_data = []
-        for week_num in range(10, 0, -1):  # Count backwards from 10 to 1
-            money_wasted = week_financial_data.get(week_num, 0)
-            if week_num == 1:
-                week_label = 'Current Week'
-            else:
-                week_label = f'Week -{week_num - 1}'
-            
-            chart_data.append({
-                'week': week_label,
-                'moneyWasted': round(money_wasted, 2)
-            })
-        
-        print(f"DEBUG: Final chart data: {chart_data}")
-        return jsonify(chart_data)
+        return jsonify(load_analytics_snapshot()['financial_optimization'])
     except Exception as e:
-        print(f"DEBUG: Error in financial optimization: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/test", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions')
 def test_analytics():
     """Test endpoint to check database connectivity and basic queries"""
     try:
@@ -1694,208 +2943,105 @@ def test_analytics():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/this-week", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
 def get_this_week_data():
     """Get this week's data for pie chart (food used, wasted, donated)"""
     try:
-        conn = sqlite3.connect('demand_history.db')
-        cursor = conn.cursor()
-        
-        print("DEBUG: Starting this week's data query")
-        
-        # Get data for this week (last 7 days)
-        cursor.execute('''
-            SELECT 
-                transaction_type,
-                SUM(quantity) as total_quantity
-            FROM inventory_transactions it
-            LEFT JOIN inventory i ON it.inventory_id = i.id
-            WHERE julianday('now') - julianday(it.date) <= 7
-            AND transaction_type IN ('usage', 'waste', 'donation')
-            GROUP BY transaction_type
-        ''')
-        
-        week_data = cursor.fetchall()
-        print(f"DEBUG: This week query returned {len(week_data)} rows")
-        print(f"DEBUG: Raw this week data: {week_data}")
-        
-        conn.close()
-        
-        # Format data for pie chart
-        pie_data = []
-        total_quantity = 0
-        
-        # Create a dictionary to store the data
-        week_totals = {'usage': 0, 'waste': 0, 'donation': 0}
-        
-        for row in week_data:
-            transaction_type = row[0]
-            quantity = row[1]
-            week_totals[transaction_type] = quantity
-            total_quantity += quantity
-        
-        # Convert to pie chart format
-        if total_quantity > 0:
-            pie_data = [
-                {
-                    'name': 'Food Used',
-                    'value': round(week_totals['usage'], 2),
-                    'color': '#10B981'
-                },
-                {
-                    'name': 'Food Wasted', 
-                    'value': round(week_totals['waste'], 2),
-                    'color': '#EF4444'
-                },
-                {
-                    'name': 'Food Donated',
-                    'value': round(week_totals['donation'], 2),
-                    'color': '#3B82F6'
-                }
-            ]
-        else:
-            # If no data, show empty state
-            pie_data = [
-                {
-                    'name': 'Food Used',
-                    'value': 0,
-                    'color': '#10B981'
-                },
-                {
-                    'name': 'Food Wasted',
-                    'value': 0, 
-                    'color': '#EF4444'
-                },
-                {
-                    'name': 'Food Donated',
-                    'value': 0,
-                    'color': '#3B82F6'
-                }
-            ]
-        
-        print(f"DEBUG: Final pie chart data: {pie_data}")
-        return jsonify(pie_data)
+        return jsonify(load_analytics_snapshot()['this_week'])
     except Exception as e:
-        print(f"DEBUG: Error in this week's data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/most-wasted", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
 def get_most_wasted_food():
-    """Get the most wasted food items this week"""
+    """Get the most wasted food items this week
+
+    Optional query parameters: limit (default 10), days (window length,
+    default 7) and by (quantity or cost).
+    """
     try:
-        conn = sqlite3.connect('demand_history.db')
-        cursor = conn.cursor()
-        
-        print("DEBUG: Starting most wasted food query")
-        
-        # Get most wasted food items this week (last 7 days)
-        cursor.execute('''
-            SELECT 
-                i.name,
-                i.unit,
-                SUM(it.quantity) as total_wasted,
-                i.cost_per_unit,
-                SUM(it.quantity * COALESCE(i.cost_per_unit, 0)) as total_cost_wasted
-            FROM inventory_transactions it
-            JOIN inventory i ON it.inventory_id = i.id
-            WHERE it.transaction_type = 'waste'
-            AND julianday('now') - julianday(it.date) <= 7
-            GROUP BY i.id, i.name, i.unit, i.cost_per_unit
-            ORDER BY total_wasted DESC
-            LIMIT 10
-        ''')
-        
-        wasted_data = cursor.fetchall()
-        print(f"DEBUG: Most wasted query returned {len(wasted_data)} rows")
-        print(f"DEBUG: Raw most wasted data: {wasted_data}")
-        
-        conn.close()
-        
-        # Format data for display
-        most_wasted = []
-        for row in wasted_data:
-            most_wasted.append({
-                'name': row[0],
-                'unit': row[1],
-                'quantity': round(row[2], 2),
-                'cost_per_unit': row[3] or 0,
-                'total_cost': round(row[4], 2)
-            })
-        
-        print(f"DEBUG: Final most wasted data: {most_wasted}")
+        most_wasted = waste_tracker.most_wasted(
+            days=request.args.get('days', 7, type=int),
+            limit=request.args.get('limit', 10, type=int),
+            ranking=request.args.get('by', 'quantity')
+        )
         return jsonify(most_wasted)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"DEBUG: Error in most wasted food: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analytics/raw-data/<int:week_number>", methods=["GET"])
+@conditional_get('inventory', 'inventory_transactions', daily=True)
 def get_raw_data_for_week(week_number):
     """Get raw data for a specific week"""
     try:
+        if week_number < 1:
+            return jsonify({"error": "week_number must be at least 1"}), 400
+        if week_number * 7 > MAX_RANGE_DAYS:
+            return jsonify({"error": f"week_number must be at most {MAX_RANGE_DAYS // 7}"}), 400
+        if week_number <= SNAPSHOT_WEEKS:
+            return jsonify(load_analytics_snapshot()['raw_data'][week_number - 1])
+
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        
-        print(f"DEBUG: Starting raw data query for week {week_number}")
-        
-        # Use the same week calculation method as other endpoints
-        # Week 1 = Current Week (0-7 days ago), Week 2 = Week -1 (8-14 days ago), etc.
-        days_ago_start = (week_number - 1) * 7
-        days_ago_end = week_number * 7
-        
-        # Get transaction data for the week using julianday calculation
-        cursor.execute('''
-            SELECT 
-                transaction_type,
-                SUM(quantity) as total_quantity,
-                SUM(quantity * COALESCE(i.cost_per_unit, 0)) as total_cost
-            FROM inventory_transactions it
-            LEFT JOIN inventory i ON it.inventory_id = i.id
-            WHERE julianday('now') - julianday(it.date) >= ?
-            AND julianday('now') - julianday(it.date) < ?
-            AND transaction_type IN ('usage', 'waste', 'donation')
-            GROUP BY transaction_type
-        ''', (days_ago_start, days_ago_end))
-        
-        week_data = cursor.fetchall()
-        print(f"DEBUG: Raw data query returned {len(week_data)} rows")
-        print(f"DEBUG: Raw week data: {week_data}")
-        
+        try:
+            snapshot = SNAPSHOT_BUILDER(cursor, weeks=week_number)
+        finally:
+            conn.close()
+        return jsonify(snapshot['raw_data'][week_number - 1])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@register_job("prune_change_log", lane="bulk")
+def run_prune_change_log_job(data):
+    """Drop old tombstones from the change feed"""
+    conn = sqlite3.connect('demand_history.db', timeout=30)
+    try:
+        removed = prune_change_log(conn)
+    finally:
         conn.close()
-        
-        # Process the data
-        week_totals = {'usage': 0, 'waste': 0, 'donation': 0, 'money_wasted': 0}
-        
-        for row in week_data:
-            transaction_type = row[0]
-            quantity = row[1]
-            cost = row[2]
-            
-            week_totals[transaction_type] = quantity
-            if transaction_type == 'waste':
-                week_totals['money_wasted'] = cost
-        
-        # Calculate percentages
-        total_food = week_totals['usage'] + week_totals['waste'] + week_totals['donation']
-        
-        if total_food > 0:
-            food_used_pct = round((week_totals['usage'] / total_food) * 100, 1)
-            food_wasted_pct = round((week_totals['waste'] / total_food) * 100, 1)
-            food_donated_pct = round((week_totals['donation'] / total_food) * 100, 1)
-        else:
-            food_used_pct = food_wasted_pct = food_donated_pct = 0
-        
-        raw_data = {
-            'food_used_pct': food_used_pct,
-            'food_wasted_pct': food_wasted_pct,
-            'food_donated_pct': food_donated_pct,
-            'money_wasted': round(week_totals['money_wasted'], 2)
-        }
-        
-        print(f"DEBUG: Final raw data: {raw_data}")
-        return jsonify(raw_data)
+    return {"tombstones_removed": removed}, 200
+
+@register_job("waste_forecast", lane="bulk")
+def run_waste_forecast_job(data):
+    """Rescore every item for expected waste"""
+    horizon_days = int(data.get("horizonDays", WASTE_FORECAST_HORIZON_DAYS))
+    if not 1 <= horizon_days <= 90:
+        return {"error": "horizonDays must be between 1 and 90"}, 400
+    conn = sqlite3.connect('demand_history.db', timeout=30)
+    try:
+        scored = run_waste_forecast(conn, horizon_days)
+    finally:
+        conn.close()
+    return {"items_scored": scored, "horizon_days": horizon_days}, 200
+
+@app.route("/api/analytics/waste-risk", methods=["GET"])
+@conditional_get('inventory', 'waste_risk_scores')
+def get_waste_risk_scores():
+    """Items most likely to be wasted, from the last waste_forecast run"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        min_score = request.args.get('min_score', 0, type=float)
+        if limit < 1:
+            return jsonify({"error": "limit must be at least 1"}), 400
+
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        items = get_waste_risk(cursor, limit, min_score)
+        conn.close()
+
+        return jsonify(items)
     except Exception as e:
-        print(f"DEBUG: Error in raw data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/analytics/waste-risk/refresh", methods=["POST"])
+def refresh_waste_risk_scores():
+    """Queue a waste_forecast run now instead of waiting for the schedule"""
+    return enqueue_job_response("waste_forecast", request.get_json(silent=True))
+
 @app.route("/api/analytics/populate-sample-data", methods=["POST"])
 def populate_sample_data():
     """Populate database with sample transaction data for testing charts"""
@@ -1935,7 +3081,7 @@ def populate_sample_data():
                 
                 # Usage transaction
                 sample_transactions.append((
-                    item_id, 'usage', usage_qty, 0, 
+                    item_id, 'usage', usage_qty, 0, cost_per_unit,
                     f'Used in {item_name} preparation', 
                     transaction_date.strftime('%Y-%m-%d')
                 ))
@@ -1943,7 +3089,7 @@ def populate_sample_data():
                 # Waste transaction (less frequent)
                 if random.random() < 0.7:  # 70% chance of waste
                     sample_transactions.append((
-                        item_id, 'waste', waste_qty, 0,
+                        item_id, 'waste', waste_qty, 0, cost_per_unit,
                         f'Wasted {item_name} - expired/damaged',
                         transaction_date.strftime('%Y-%m-%d')
                     ))
@@ -1951,7 +3097,7 @@ def populate_sample_data():
                 # Donation transaction (less frequent)
                 if random.random() < 0.4:  # 40% chance of donation
                     sample_transactions.append((
-                        item_id, 'donation', donation_qty, 0,
+                        item_id, 'donation', donation_qty, 0, cost_per_unit,
                         f'Donated {item_name} to local food bank',
                         transaction_date.strftime('%Y-%m-%d')
                     ))
@@ -1959,12 +3105,13 @@ def populate_sample_data():
         # Insert sample transactions
         cursor.executemany('''
             INSERT INTO inventory_transactions 
-            (inventory_id, transaction_type, quantity, cost, notes, date)
-            VALUES (?, ?, ?, ?, ?, ?)
+            (inventory_id, transaction_type, quantity, cost, unit_cost, notes, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', sample_transactions)
         
         conn.commit()
         conn.close()
+        waste_tracker.invalidate()
         
         return jsonify({
             "message": f"Successfully added {len(sample_transactions)} sample transactions",
@@ -1974,73 +3121,81 @@ def populate_sample_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/inventory/ai-recommendations", methods=["POST"])
-def get_ai_recommendations():
-    """Get AI recommendations for inventory management"""
+@app.route("/api/food-banks", methods=["GET"])
+@conditional_get('food_banks', 'food_bank_needs', daily=True)
+def get_food_banks():
+    """Get food banks with their open needs"""
     try:
-        data = request.get_json()
-        query = data.get('query', '')
-        print(f"DEBUG: Received query: {query}")  # Debug line
-        
-        # Get current inventory data
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT name, current_quantity, min_quantity, unit, expiration_date, 
-                   cost_per_unit, storage_location
-            FROM inventory 
-            WHERE current_quantity > 0
-            ORDER BY expiration_date ASC
-        ''')
-        inventory_data = cursor.fetchall()
+        cursor.execute('SELECT * FROM food_banks ORDER BY name ASC')
+        columns = [description[0] for description in cursor.description]
+        food_banks = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
         cursor.execute('''
-            SELECT it.transaction_type, it.quantity, it.date, i.name
-            FROM inventory_transactions it
-            JOIN inventory i ON it.inventory_id = i.id
-            WHERE it.date >= date('now', '-7 days')
-            ORDER BY it.date DESC
+            SELECT * FROM food_bank_needs
+            WHERE quantity_needed - COALESCE(quantity_fulfilled, 0) > 0
+            AND (expires_at IS NULL OR expires_at >= date('now'))
+            ORDER BY priority_level DESC
         ''')
-        recent_transactions = cursor.fetchall()
+        columns = [description[0] for description in cursor.description]
+        needs = [dict(zip(columns, row)) for row in cursor.fetchall()]
         conn.close()
         
-        if not openai.api_key:
-            return jsonify({"error": "OpenAI API key not configured"}), 500
+        needs_by_bank = {}
+        for need in needs:
+            needs_by_bank.setdefault(need['food_bank_id'], []).append(need)
+        for food_bank in food_banks:
+            food_bank['needs'] = needs_by_bank.get(food_bank['id'], [])
         
-        # Create context for AI
-        inventory_context = "Current Inventory:\n"
-        for item in inventory_data:
-            inventory_context += f"- {item[0]}: {item[1]} {item[2]} (min: {item[3]}, expires: {item[4]})\n"
-        
-        transaction_context = "Recent Transactions (last 7 days):\n"
-        for trans in recent_transactions:
-            transaction_context += f"- {trans[3]}: {trans[0]} {trans[1]} on {trans[2]}\n"
-        
-        # Hardcoded food bank needs with contact information
-        food_bank_needs = [
-            ('Atlanta Community Food Bank', 'Atlanta', 'GA', 'Protein', 'Chicken Breast', 100, 'lbs', 3, 'High demand for protein items', '404-892-9822', 'info@acfb.org'),
-            ('Atlanta Community Food Bank', 'Atlanta', 'GA', 'Vegetables', 'Fresh Vegetables', 200, 'lbs', 2, 'Need fresh produce for families', '404-892-9822', 'info@acfb.org'),
-            ('Atlanta Community Food Bank', 'Atlanta', 'GA', 'Dairy', 'Milk', 50, 'gallons', 4, 'Critical need for dairy products', '404-892-9822', 'info@acfb.org'),
-            ('Atlanta Community Food Bank', 'Atlanta', 'GA', 'Grains', 'Bread', 30, 'loaves', 2, 'Daily bread distribution', '404-892-9822', 'info@acfb.org'),
-            ('Atlanta Community Food Bank', 'Atlanta', 'GA', 'Protein', 'Ground Turkey', 60, 'lbs', 3, 'Alternative protein source', '404-892-9822', 'info@acfb.org'),
-            ('Second Harvest Food Bank', 'Atlanta', 'GA', 'Protein', 'Ground Beef', 75, 'lbs', 2, 'Regular protein need', '404-555-0123', 'contact@secondharvest.org'),
-            ('Second Harvest Food Bank', 'Atlanta', 'GA', 'Grains', 'Rice', 150, 'lbs', 1, 'Staple food item', '404-555-0123', 'contact@secondharvest.org'),
-            ('Second Harvest Food Bank', 'Atlanta', 'GA', 'Vegetables', 'Canned Vegetables', 100, 'cans', 2, 'Non-perishable vegetables', '404-555-0123', 'contact@secondharvest.org'),
-            ('Second Harvest Food Bank', 'Atlanta', 'GA', 'Dairy', 'Yogurt', 40, 'containers', 3, 'Healthy dairy option', '404-555-0123', 'contact@secondharvest.org'),
-            ('Metro Atlanta Food Bank', 'Atlanta', 'GA', 'Vegetables', 'Leafy Greens', 80, 'lbs', 3, 'Fresh vegetables for nutrition programs', '404-555-0456', 'help@metrofoodbank.org'),
-            ('Metro Atlanta Food Bank', 'Atlanta', 'GA', 'Dairy', 'Cheese', 30, 'lbs', 2, 'Dairy products for meal programs', '404-555-0456', 'help@metrofoodbank.org'),
-            ('Metro Atlanta Food Bank', 'Atlanta', 'GA', 'Protein', 'Eggs', 20, 'dozen', 4, 'Critical need for protein', '404-555-0456', 'help@metrofoodbank.org'),
-            ('Metro Atlanta Food Bank', 'Atlanta', 'GA', 'Fruits', 'Fresh Fruits', 120, 'lbs', 2, 'Fresh fruit for families', '404-555-0456', 'help@metrofoodbank.org'),
-            ('Community Kitchen Atlanta', 'Atlanta', 'GA', 'Protein', 'Fish', 40, 'lbs', 2, 'Healthy protein option', '404-555-0789', 'info@communitykitchen.org'),
-            ('Community Kitchen Atlanta', 'Atlanta', 'GA', 'Vegetables', 'Root Vegetables', 60, 'lbs', 1, 'Long-lasting vegetables', '404-555-0789', 'info@communitykitchen.org'),
-            ('Community Kitchen Atlanta', 'Atlanta', 'GA', 'Grains', 'Pasta', 50, 'lbs', 2, 'Staple grain product', '404-555-0789', 'info@communitykitchen.org'),
-            ('Community Kitchen Atlanta', 'Atlanta', 'GA', 'Dairy', 'Butter', 15, 'lbs', 1, 'Cooking ingredient', '404-555-0789', 'info@communitykitchen.org')
-        ]
+        return jsonify(food_banks)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/food-banks/matches", methods=["GET"])
+@conditional_get('inventory', 'food_banks', 'food_bank_needs', daily=True)
+def get_food_bank_matches():
+    """Get ranked food bank matches for current inventory without calling the AI"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        per_item = request.args.get('per_item', 3, type=int)
+        
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        matches = find_donation_matches(cursor, limit=limit, per_item=per_item)
+        conn.close()
+        
+        return jsonify(matches)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@register_job("ai_recommendations", lane="bulk")
+def run_ai_recommendations(data):
+    """Get AI recommendations for inventory management"""
+    try:
+        query = data.get('query', '')
+        print(f"DEBUG: Received query: {query}")  # Debug line
+        
+        if not openai.api_key:
+            return {"error": "OpenAI API key not configured"}, 500
+
+        # Create context for AI, ranked and trimmed to the token budget
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        inventory_context, transaction_context = build_inventory_context(cursor, days=7)
+        conn.close()
+
+        # Donation matching is done locally; the AI only explains the matches
+        conn = sqlite3.connect('demand_history.db')
+        cursor = conn.cursor()
+        donation_matches = find_donation_matches(cursor, limit=20)
+        conn.close()
         
-        food_bank_context = "Active Food Bank Needs:\n"
-        for need in food_bank_needs:
-            priority_text = {4: "CRITICAL", 3: "HIGH", 2: "MEDIUM", 1: "LOW"}.get(need[7], "UNKNOWN")
-            food_bank_context += f"- {need[0]} ({need[1]}, {need[2]}): {need[3]} {need[4]} - {need[5]} {need[6]} (Priority: {priority_text}) | Contact: {need[9]} | Email: {need[10]}\n"
+        food_bank_context = "\n".join(
+            ["Pre-matched Donation Options (best first):"]
+            + [format_match(match) for match in donation_matches]
+            + ([] if donation_matches else ["- No open food bank needs match the current inventory"])
+        )
         
         prompt = f"""
         You are an expert inventory management assistant specializing in food donation matching. Analyze the following data and provide specific recommendations:
@@ -2054,13 +3209,9 @@ def get_ai_recommendations():
         User Query: {query}
         
         IMPORTANT INSTRUCTIONS:
-        1. When the user asks about donating specific items (like "who do I donate chicken to?"), provide EXACT food bank matches from the needs list above
+        1. When the user asks about donating specific items (like "who do I donate chicken to?"), use ONLY the pre-matched donation options above
         2. Always mention the specific food bank name, their need details, and priority level
-        3. For donation recommendations, prioritize by:
-           - Exact item matches (e.g., "Chicken Breast" matches "Chicken Breast")
-           - Category matches (e.g., "Chicken" matches "Protein" category)
-           - Priority level (Critical=4, High=3, Medium=2, Low=1)
-           - Quantity needed vs available
+        3. The donation options are already ranked by match quality, priority, expiry urgency and remaining need - keep that order and the suggested quantities
         
         RESPONSE FORMAT:
         - For specific donation queries: "For [ITEM], I recommend donating to [FOOD_BANK_NAME] because they need [SPECIFIC_NEED] (Priority: [LEVEL])"
@@ -2113,43 +3264,45 @@ def get_ai_recommendations():
         """
         
         client = openai.OpenAI(api_key=openai.api_key)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert inventory management assistant specializing in food donation matching. You have access to real-time food bank needs data and can provide specific, actionable donation recommendations with exact food bank matches, contact information, and priority levels."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.2
-        )
-        
-        analysis_text = response.choices[0].message.content
-        print(f"DEBUG: Raw AI response: {analysis_text}")  # Debug line
+        try:
+            analysis_data, analysis_text, parse_errors = complete_json(
+                client,
+                "recommendations",
+                endpoint="ai_recommendations",
+                template="donation_matching",
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are an expert inventory management assistant specializing in food donation matching. You have access to real-time food bank needs data and can provide specific, actionable donation recommendations with exact food bank matches, contact information, and priority levels."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=1500,
+                temperature=0.2
+            )
+        except BudgetExceeded as e:
+            if BUDGET_MODE == 'fail':
+                return {"error": str(e)}, 429
+            return deterministic_recommendations(donation_matches), 200
         
-        # Try to parse JSON response
-        import re
-        json_match = re.search(r'\{.*\}', analysis_text, re.DOTALL)
-        if json_match:
-            try:
-                analysis_data = json.loads(json_match.group())
-                return jsonify(analysis_data)
-            except json.JSONDecodeError:
-                return jsonify({
-                    "raw_analysis": analysis_text,
-                    "recommendations": [],
-                    "donation_opportunities": [],
-                    "alerts": []
-                })
-        else:
-            return jsonify({
+        if analysis_data is None:
+            print(f"Recommendations response could not be parsed: {parse_errors}")
+            return {
                 "raw_analysis": analysis_text,
                 "recommendations": [],
                 "donation_opportunities": [],
-                "alerts": []
-            })
+                "alerts": [],
+                "donation_matches": donation_matches
+            }, 200
+        
+        analysis_data["donation_matches"] = donation_matches
+        return analysis_data, 200
             
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+@app.route("/api/inventory/ai-recommendations", methods=["POST"])
+def get_ai_recommendations():
+    """Queue an AI recommendations run and return its job id"""
+    return enqueue_job_response("ai_recommendations", request.get_json())
 
 # Add sample food bank data
 def add_sample_food_banks():
@@ -2158,6 +3311,30 @@ def add_sample_food_banks():
         conn = sqlite3.connect('demand_history.db')
         cursor = conn.cursor()
         
+        # Sample needs stay open for one to two months from when they are added or renewed
+        def need_deadline(days):
+            return (datetime.now() + timedelta(days=30 + days)).strftime('%Y-%m-%d')
+        
+        sample_needs = [
+            (1, 'Protein', 'Chicken Breast', 100, 'lbs', 3, 'High demand for protein items', need_deadline(7)),
+            (1, 'Vegetables', 'Fresh Vegetables', 200, 'lbs', 2, 'Need fresh produce for families', need_deadline(12)),
+            (1, 'Dairy', 'Milk', 50, 'gallons', 4, 'Critical need for dairy products', need_deadline(2)),
+            (1, 'Grains', 'Bread', 30, 'loaves', 2, 'Daily bread distribution', need_deadline(17)),
+            (1, 'Protein', 'Ground Turkey', 60, 'lbs', 3, 'Alternative protein source', need_deadline(10)),
+            (2, 'Protein', 'Ground Beef', 75, 'lbs', 2, 'Regular protein need', need_deadline(17)),
+            (2, 'Grains', 'Rice', 150, 'lbs', 1, 'Staple food item', need_deadline(22)),
+            (2, 'Vegetables', 'Canned Vegetables', 100, 'cans', 2, 'Non-perishable vegetables', need_deadline(31)),
+            (2, 'Dairy', 'Yogurt', 40, 'containers', 3, 'Healthy dairy option', need_deadline(14)),
+            (3, 'Vegetables', 'Leafy Greens', 80, 'lbs', 3, 'Fresh vegetables for nutrition programs', need_deadline(10)),
+            (3, 'Dairy', 'Cheese', 30, 'lbs', 2, 'Dairy products for meal programs', need_deadline(14)),
+            (3, 'Protein', 'Eggs', 20, 'dozen', 4, 'Critical need for protein', need_deadline(4)),
+            (3, 'Fruits', 'Fresh Fruits', 120, 'lbs', 2, 'Fresh fruit for families', need_deadline(20)),
+            (4, 'Protein', 'Fish', 40, 'lbs', 2, 'Healthy protein option', need_deadline(20)),
+            (4, 'Vegetables', 'Root Vegetables', 60, 'lbs', 1, 'Long-lasting vegetables', need_deadline(26)),
+            (4, 'Grains', 'Pasta', 50, 'lbs', 2, 'Staple grain product', need_deadline(29)),
+            (4, 'Dairy', 'Butter', 15, 'lbs', 1, 'Cooking ingredient', need_deadline(33))
+        ]
+        
         # Check if food banks already exist
         cursor.execute('SELECT COUNT(*) FROM food_banks')
         count = cursor.fetchone()[0]
@@ -2187,25 +3364,6 @@ def add_sample_food_banks():
             ''', sample_banks)
             
             # Add sample food bank needs
-            sample_needs = [
-                (1, 'Protein', 'Chicken Breast', 100, 'lbs', 3, 'High demand for protein items', '2024-02-15'),
-                (1, 'Vegetables', 'Fresh Vegetables', 200, 'lbs', 2, 'Need fresh produce for families', '2024-02-20'),
-                (1, 'Dairy', 'Milk', 50, 'gallons', 4, 'Critical need for dairy products', '2024-02-10'),
-                (1, 'Grains', 'Bread', 30, 'loaves', 2, 'Daily bread distribution', '2024-02-25'),
-                (1, 'Protein', 'Ground Turkey', 60, 'lbs', 3, 'Alternative protein source', '2024-02-18'),
-                (2, 'Protein', 'Ground Beef', 75, 'lbs', 2, 'Regular protein need', '2024-02-25'),
-                (2, 'Grains', 'Rice', 150, 'lbs', 1, 'Staple food item', '2024-03-01'),
-                (2, 'Vegetables', 'Canned Vegetables', 100, 'cans', 2, 'Non-perishable vegetables', '2024-03-10'),
-                (2, 'Dairy', 'Yogurt', 40, 'containers', 3, 'Healthy dairy option', '2024-02-22'),
-                (3, 'Vegetables', 'Leafy Greens', 80, 'lbs', 3, 'Fresh vegetables for nutrition programs', '2024-02-18'),
-                (3, 'Dairy', 'Cheese', 30, 'lbs', 2, 'Dairy products for meal programs', '2024-02-22'),
-                (3, 'Protein', 'Eggs', 20, 'dozen', 4, 'Critical need for protein', '2024-02-12'),
-                (3, 'Fruits', 'Fresh Fruits', 120, 'lbs', 2, 'Fresh fruit for families', '2024-02-28'),
-                (4, 'Protein', 'Fish', 40, 'lbs', 2, 'Healthy protein option', '2024-02-28'),
-                (4, 'Vegetables', 'Root Vegetables', 60, 'lbs', 1, 'Long-lasting vegetables', '2024-03-05'),
-                (4, 'Grains', 'Pasta', 50, 'lbs', 2, 'Staple grain product', '2024-03-08'),
-                (4, 'Dairy', 'Butter', 15, 'lbs', 1, 'Cooking ingredient', '2024-03-12')
-            ]
             
             cursor.executemany('''
                 INSERT INTO food_bank_needs 
@@ -2216,6 +3374,16 @@ def add_sample_food_banks():
             
             conn.commit()
             print("Sample food bank data added successfully")
+        else:
+            # Renew lapsed sample needs so demo databases keep matching; needs
+            # entered by users are left to expire
+            cursor.executemany('''
+                UPDATE food_bank_needs SET expires_at = ?
+                WHERE food_bank_id = ? AND food_type = ? AND notes = ? AND expires_at < date('now')
+            ''', [(need[7], need[0], need[2], need[6]) for need in sample_needs])
+            if cursor.rowcount > 0:
+                conn.commit()
+                print(f"Renewed {cursor.rowcount} lapsed sample food bank needs")
         
         conn.close()
     except Exception as e:
@@ -2224,5 +3392,16 @@ def add_sample_food_banks():
 # Add sample data on startup
 add_sample_food_banks()
 
+# Background job workers and schedules
+schedule_job("waste_forecast", WASTE_FORECAST_INTERVAL_SECONDS)
+schedule_job("prune_change_log", CHANGE_FEED_PRUNE_INTERVAL_SECONDS)
+
+# Workers are started by the first request rather than at import: under the debug reloader
+# this module also runs in the watching parent process, which never serves
+# requests and must not run jobs on code that never reloads
+@app.before_request
+def ensure_workers():
+    start_workers()
+
 if __name__ == "__main__":
     app.run(debug = True)
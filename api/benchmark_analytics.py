@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Analytics engine benchmark
+Compares the SQL rollup path with the columnar NumPy engine for the dashboard
+snapshot on synthetic transaction histories
+
+Usage: python benchmark_analytics.py [--rows 10000,1000000,10000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from analytics import build_dashboard_snapshot, rebuild_daily_rollup, reset_closed_week_cache
+from columnar_analytics import TransactionColumns, np
+
+TRANSACTION_TYPES = ['usage', 'usage', 'usage', 'waste', 'donation', 'purchase']
+HISTORY_DAYS = 365
+INSERT_BATCH_ROWS = 100000
+
+
+def create_schema(cursor):
+    """Tables the analytics paths read, matching api.py's init_db"""
+    cursor.execute('''
+        CREATE TABLE inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT,
+            unit TEXT,
+            cost_per_unit REAL DEFAULT 0,
+            supplier TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE inventory_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER,
+            transaction_type TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            cost REAL DEFAULT 0,
+            unit_cost REAL,
+            notes TEXT,
+            date TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE daily_item_rollup (
+            day TEXT NOT NULL,
+            inventory_id INTEGER NOT NULL,
+            transaction_type TEXT NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            cost REAL NOT NULL DEFAULT 0,
+            value REAL NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, inventory_id, transaction_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE weekly_aggregates (
+            week_start TEXT PRIMARY KEY,
+            iso_week TEXT NOT NULL,
+            used REAL NOT NULL DEFAULT 0,
+            wasted REAL NOT NULL DEFAULT 0,
+            donated REAL NOT NULL DEFAULT 0,
+            purchased REAL NOT NULL DEFAULT 0,
+            money_wasted REAL NOT NULL DEFAULT 0,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def generate_transactions(rows, items, seed=42):
+    """Yield synthetic transactions spread over the last year"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    for _ in range(rows):
+        date = now - timedelta(days=rng.random() * HISTORY_DAYS)
+        yield (
+            rng.randint(1, items),
+            rng.choice(TRANSACTION_TYPES),
+            round(rng.uniform(0.5, 20), 1),
+            date.strftime('%Y-%m-%d %H:%M:%S')
+        )
+
+
+def build_database(path, rows, items):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    create_schema(cursor)
+    cursor.executemany(
+        'INSERT INTO inventory (name, category, unit, cost_per_unit, supplier) VALUES (?, ?, ?, ?, ?)',
+        [(f'Item {index}', f'Category {index % 12}', 'lbs', round(1 + (index % 40) * 0.35, 2), f'Supplier {index % 7}')
+         for index in range(1, items + 1)]
+    )
+
+    generator = generate_transactions(rows, items)
+    while True:
+        batch = [row for _, row in zip(range(INSERT_BATCH_ROWS), generator)]
+        if not batch:
+            break
+        cursor.executemany('''
+            INSERT INTO inventory_transactions (inventory_id, transaction_type, quantity, date)
+            VALUES (?, ?, ?, ?)
+        ''', batch)
+    conn.commit()
+    rebuild_daily_rollup(conn)
+
+    cursor.executemany('INSERT INTO table_versions (table_name, version) VALUES (?, ?)',
+                       [('inventory', items), ('inventory_transactions', rows), ('weekly_aggregates', 0)])
+    # Same version bump the api.py triggers apply, so incremental appends are detected
+    cursor.execute('''
+        CREATE TRIGGER inventory_transactions_version_insert AFTER INSERT ON inventory_transactions
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory_transactions';
+        END
+    ''')
+    conn.commit()
+    return conn
+
+
+def best_of(repeat, function):
+    """Fastest of several runs in milliseconds, with the last result"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), result
+
+
+def snapshots_match(left, right, tolerance=0.01):
+    """Compare the chart numbers of two snapshots, allowing per-row rounding
+
+    Totals are rounded to cents, so sums that differ only in float noise can
+    land one cent apart; a difference of one rounding step still matches.
+    """
+    for key in ('weekly_trends', 'financial_optimization', 'this_week', 'raw_data'):
+        for left_row, right_row in zip(left[key], right[key]):
+            for field, value in left_row.items():
+                if isinstance(value, float) and abs(value - right_row[field]) > max(tolerance, abs(value) * 1e-6) + 1e-9:
+                    return False
+    return [item['name'] for item in left['most_wasted']] == [item['name'] for item in right['most_wasted']]
+
+
+def run(rows, items, repeat, directory):
+    path = os.path.join(directory, f'analytics_bench_{rows}.db')
+    if os.path.exists(path):
+        os.remove(path)
+    started = time.perf_counter()
+    conn = build_database(path, rows, items)
+    print(f"\n{rows:,} transactions, {items} items (database built in {time.perf_counter() - started:.1f}s)")
+    cursor = conn.cursor()
+
+    # First call fills the closed-week cache, later ones only aggregate the current week
+    reset_closed_week_cache()
+    cold_ms, _ = best_of(1, lambda: build_dashboard_snapshot(cursor))
+    sql_ms, sql_snapshot = best_of(repeat, lambda: build_dashboard_snapshot(cursor))
+
+    engine = TransactionColumns()
+    load_ms, _ = best_of(1, lambda: engine.refresh(cursor))
+    end_day = (datetime.utcnow().date() - datetime(1970, 1, 1).date()).days
+    columnar_ms, columnar_snapshot = best_of(repeat, lambda: engine.dashboard_snapshot(end_day))
+
+    cursor.executemany('''
+        INSERT INTO inventory_transactions (inventory_id, transaction_type, quantity, date)
+        VALUES (?, ?, ?, ?)
+    ''', list(generate_transactions(1000, items, seed=7)))
+    conn.commit()
+    append_ms, _ = best_of(1, lambda: engine.refresh(cursor))
+
+    print(f"  SQL snapshot, cold cache {cold_ms:10.1f} ms")
+    print(f"  SQL rollup snapshot      {sql_ms:10.1f} ms")
+    print(f"  Columnar initial load    {load_ms:10.1f} ms")
+    print(f"  Columnar snapshot        {columnar_ms:10.1f} ms")
+    print(f"  Columnar append 1,000    {append_ms:10.1f} ms")
+    print(f"  Results match: {snapshots_match(sql_snapshot, columnar_snapshot)}")
+
+    conn.close()
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQL and columnar dashboard analytics")
+    parser.add_argument('--rows', default='10000,1000000,10000000',
+                        help="Comma separated transaction counts")
+    parser.add_argument('--items', type=int, default=200, help="Number of inventory items")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per timing (best is reported)")
+    parser.add_argument('--dir', default=tempfile.gettempdir(), help="Directory for the benchmark databases")
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error("NumPy is required for the columnar engine")
+
+    for rows in [int(value) for value in args.rows.split(',')]:
+        run(rows, args.items, args.repeat, args.dir)
+
+
+if __name__ == "__main__":
+    main()
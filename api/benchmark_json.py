@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Demand history serialization benchmark
+Times GET /api/demand-history's query-to-bytes path on synthetic
+demand_calculations and demand_analyses tables, decoding and re-encoding
+each stored analysis against splicing it as RawJSON, with the stdlib encoder
+and with orjson when it is installed
+
+Usage: python benchmark_json.py [--rows 50000]
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+import fast_json
+from fast_json import RawJSON
+
+DISHES = {
+    'Mushroom Risotto': [('Arborio Rice', 0.25, 'lbs'), ('Mushrooms', 0.3, 'lbs'), ('White Wine', 0.1, 'bottles'),
+                         ('Parmesan', 0.08, 'lbs')],
+    'Bruschetta': [('Bread', 0.2, 'loaves'), ('Roma Tomatoes', 0.15, 'lbs'), ('Fresh Basil', 0.03, 'bunches'),
+                   ('Garlic', 0.05, 'lbs')],
+    'Eggplant Parmesan': [('Eggplant', 0.5, 'lbs'), ('Marinara Sauce', 0.18, 'lbs'), ('Mozzarella', 0.1, 'lbs'),
+                          ('Breadcrumbs', 0.06, 'lbs')]
+}
+
+
+def build_database(rows, seed=42):
+    """In-memory demand_calculations and demand_analyses tables shaped like the demo data"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE demand_calculations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dish_name TEXT NOT NULL,
+            dish_price REAL NOT NULL,
+            major_ingredients TEXT,
+            category TEXT,
+            cuisine TEXT,
+            emailed_in_promotions BOOLEAN,
+            featured_on_homepage BOOLEAN,
+            discount_applied BOOLEAN,
+            discount_percentage REAL,
+            city_name TEXT,
+            center_type TEXT,
+            predicted_orders INTEGER,
+            final_price REAL,
+            total_price REAL,
+            discount_amount REAL,
+            ingredient_analysis TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE demand_analyses (
+            calculation_id INTEGER PRIMARY KEY,
+            analysis TEXT NOT NULL,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    records = []
+    analyses = []
+    for _ in range(rows):
+        dish_name, ingredients = rng.choice(list(DISHES.items()))
+        orders = rng.randint(20, 400)
+        price = round(rng.uniform(8, 30), 2)
+        analysis = {
+            'ingredients': [
+                {'name': name, 'quantity': orders * per_order, 'unit': unit, 'storage': 'Refrigerated',
+                 'notes': f'Fresh {name.lower()}'}
+                for name, per_order, unit in ingredients
+            ],
+            'raw_analysis': f"Based on {orders} orders, you'll need approximately "
+                            + ', '.join(f'{orders * per_order:.1f} {unit} of {name.lower()}'
+                                        for name, per_order, unit in ingredients) + '.'
+        }
+        records.append((dish_name, price, ', '.join(name for name, _, _ in ingredients), 'Main', 'Italian',
+                        rng.random() < 0.5, rng.random() < 0.5, False, 0, 'New York',
+                        rng.choice(['TYPE_A', 'TYPE_B', 'TYPE_C']), orders, price, price * orders, 0))
+        analyses.append((len(records), json.dumps(analysis)))
+    conn.executemany('''
+        INSERT INTO demand_calculations
+        (dish_name, dish_price, major_ingredients, category, cuisine, emailed_in_promotions, featured_on_homepage,
+         discount_applied, discount_percentage, city_name, center_type, predicted_orders, final_price,
+         total_price, discount_amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+    conn.executemany('INSERT INTO demand_analyses (calculation_id, analysis) VALUES (?, ?)', analyses)
+    conn.commit()
+    return conn
+
+
+HISTORY_QUERY = '''
+    SELECT d.*, a.analysis AS analysis_text, json_valid(a.analysis) AS analysis_valid
+    FROM demand_calculations d
+    LEFT JOIN demand_analyses a ON a.calculation_id = d.id
+    ORDER BY d.created_at DESC
+'''
+
+
+def decoded_history(cursor, loads):
+    """Rows with the analysis decoded into ingredient_analysis, to be encoded again"""
+    cursor.execute(HISTORY_QUERY)
+    columns = [description[0] for description in cursor.description]
+    history = []
+    for row in cursor.fetchall():
+        item = dict(zip(columns, row))
+        analysis = item.pop('analysis_text')
+        item.pop('analysis_valid')
+        try:
+            item['ingredient_analysis'] = loads(analysis) if analysis else None
+        except ValueError:
+            item['ingredient_analysis'] = None
+        history.append(item)
+    return history
+
+
+def spliced_history(cursor):
+    """Rows with the analysis left as RawJSON, as load_demand_calculations builds them"""
+    cursor.execute(HISTORY_QUERY)
+    columns = [description[0] for description in cursor.description]
+    history = []
+    for row in cursor.fetchall():
+        item = dict(zip(columns, row))
+        analysis = item.pop('analysis_text')
+        valid = item.pop('analysis_valid')
+        item['ingredient_analysis'] = RawJSON(analysis) if analysis and valid else None
+        history.append(item)
+    return history
+
+
+def best_of(repeat, function):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark demand history JSON serialization")
+    parser.add_argument('--rows', type=int, default=50000, help="Number of demand calculations")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per timing (best is reported)")
+    args = parser.parse_args()
+
+    conn = build_database(args.rows)
+    cursor = conn.cursor()
+
+    # Flask's default provider: sorted keys, compact separators, ASCII only
+    def stdlib_before():
+        return json.dumps(decoded_history(cursor, json.loads), sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    cases = [
+        ('stdlib, decode + encode', stdlib_before),
+        ('stdlib, spliced', lambda: fast_json._dumps_stdlib(spliced_history(cursor), None, True, False))
+    ]
+    if fast_json.orjson is not None:
+        cases += [
+            ('orjson, decode + encode',
+             lambda: fast_json._dumps_orjson(decoded_history(cursor, fast_json.orjson.loads), None, True, False)),
+            ('orjson, spliced', lambda: fast_json._dumps_orjson(spliced_history(cursor), None, True, False))
+        ]
+    else:
+        print("orjson is not installed; timing the stdlib encoder only")
+
+    query_ms, _ = best_of(args.repeat, lambda: cursor.execute(HISTORY_QUERY).fetchall())
+    print(f"\n{args.rows:,} demand calculations (query alone {query_ms:.1f} ms)")
+    expected = None
+    for label, function in cases:
+        elapsed, body = best_of(args.repeat, function)
+        decoded = json.loads(body)
+        expected = decoded if expected is None else expected
+        print(f"  {label:26} {elapsed:10.1f} ms  {len(body) / 1e6:6.1f} MB  same data: {decoded == expected}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Bulk ingestion of inventory transactions and new items
+Reads CSV or NDJSON lines in chunks; each chunk is validated up front, inserted
+with executemany in one transaction and applied to inventory as one quantity
+update per item, with purchase lots opened and consumed in the same pass
+
+Usage: python bulk_import.py FILE [--format csv|ndjson]
+"""
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+from lots import apply_lot_movements
+
+DB_PATH = 'demand_history.db'
+
+CHUNK_LINES = 10000
+MAX_REPORTED_ERRORS = 1000
+# Rows per IN (...) lookup, under SQLite's bound parameter limit
+LOOKUP_BATCH = 900
+
+TRANSACTION_TYPES = ('usage', 'waste', 'donation', 'purchase')
+OUTFLOW_TYPES = ('usage', 'waste', 'donation')
+ITEM_FIELDS = (
+    'name', 'category', 'unit', 'current_quantity', 'min_quantity', 'max_quantity',
+    'cost_per_unit', 'total_cost', 'supplier', 'expiration_date', 'storage_location', 'notes'
+)
+ITEM_NUMBER_FIELDS = ('current_quantity', 'min_quantity', 'max_quantity', 'cost_per_unit', 'total_cost')
+
+
+class LineError(ValueError):
+    """A single input line that cannot be imported"""
+
+
+def read_csv(stream):
+    """Yield (line_number, record) from a CSV text stream with a header row"""
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, {key: value for key, value in record.items() if value not in (None, '')}
+
+
+def read_ndjson(stream):
+    """Yield (line_number, record) from an NDJSON text stream"""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            record = LineError(f"Invalid JSON: {e.msg}")
+        if not isinstance(record, (dict, LineError)):
+            record = LineError("Each line must be a JSON object")
+        yield line_number, record
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _number(record, field, default=None):
+    value = record.get(field, default)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise LineError(f"{field} must be a number")
+
+
+@lru_cache(maxsize=4096)
+def _is_day(value):
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _date(record, field='date', default_today=True):
+    value = record.get(field) or (datetime.now().strftime('%Y-%m-%d') if default_today else None)
+    if value is None:
+        return None
+    value = str(value)
+    # A shift's lines share a handful of dates, so validation is cached
+    if not _is_day(value[:10]):
+        raise LineError(f"Invalid {field} '{value}', expected YYYY-MM-DD")
+    return value
+
+
+class BulkImporter:
+    """Imports record streams into one database connection
+
+    Records are transactions by default; records with "record": "item" create
+    inventory items. Item names are resolved from one lookup of the whole
+    inventory, kept current as items are created.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.item_ids = {}
+        self.lines = 0
+        self.transactions = 0
+        self.items_created = 0
+        self.error_count = 0
+        self.errors = []
+
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name FROM inventory ORDER BY id')
+        for item_id, name in cursor.fetchall():
+            self.item_ids.setdefault((name or '').strip().lower(), item_id)
+
+    def _error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def _resolve(self, record):
+        if record.get('inventory_id') is not None:
+            try:
+                return int(record['inventory_id'])
+            except (TypeError, ValueError):
+                raise LineError("inventory_id must be an integer")
+        name = str(record.get('item') or record.get('name') or '').strip().lower()
+        if not name:
+            raise LineError("Each transaction needs an item name or inventory_id")
+        if name not in self.item_ids:
+            raise LineError(f"Unknown item '{record.get('item') or record.get('name')}'")
+        return self.item_ids[name]
+
+    def _create_items(self, cursor, records):
+        """Insert new items, returning their initial purchases as transaction records"""
+        purchases = []
+        for line_number, record in records:
+            try:
+                name = str(record.get('name') or '').strip()
+                if not name:
+                    raise LineError("Each item needs a name")
+                if name.lower() in self.item_ids:
+                    raise LineError(f"Item '{name}' already exists")
+                values = {field: record.get(field) for field in ITEM_FIELDS}
+                for field in ITEM_NUMBER_FIELDS:
+                    values[field] = _number(record, field, 0)
+                values['name'] = name
+                values['expiration_date'] = _date(record, 'expiration_date', False)
+            except LineError as e:
+                self._error(line_number, str(e))
+                continue
+
+            cursor.execute(f'''
+                INSERT INTO inventory ({', '.join(ITEM_FIELDS)})
+                VALUES ({', '.join('?' * len(ITEM_FIELDS))})
+            ''', [values[field] for field in ITEM_FIELDS])
+            item_id = cursor.lastrowid
+            self.item_ids[name.lower()] = item_id
+            self.items_created += 1
+            # Stock the item starts with is recorded as its initial purchase
+            if values['current_quantity'] > 0:
+                purchases.append((line_number, {
+                    'inventory_id': item_id,
+                    'type': 'purchase',
+                    'quantity': values['current_quantity'],
+                    'cost': values['total_cost'],
+                    'notes': 'Initial purchase',
+                    'date': record.get('purchase_date'),
+                    'expiration_date': values['expiration_date'],
+                    'initial': True
+                }))
+        return purchases
+
+    def _parse_transaction(self, record):
+        transaction_type = str(record.get('transaction_type') or record.get('type') or '').strip().lower()
+        if transaction_type not in TRANSACTION_TYPES:
+            raise LineError(f"type must be one of {', '.join(TRANSACTION_TYPES)}")
+        quantity = _number(record, 'quantity')
+        if quantity is None or quantity <= 0:
+            raise LineError("quantity must be a positive number")
+        return (
+            self._resolve(record), transaction_type, quantity, _number(record, 'cost', 0),
+            record.get('notes') or '', _date(record), _date(record, 'expiration_date', False),
+            bool(record.get('initial'))
+        )
+
+    def _load_stock(self, cursor, item_ids):
+        """Current (quantity, cost per unit) of the items a chunk touches"""
+        stock = {}
+        item_ids = sorted(item_ids)
+        for offset in range(0, len(item_ids), LOOKUP_BATCH):
+            batch = item_ids[offset:offset + LOOKUP_BATCH]
+            cursor.execute(f'''
+                SELECT id, current_quantity, cost_per_unit FROM inventory
+                WHERE id IN ({', '.join('?' * len(batch))})
+            ''', batch)
+            for item_id, quantity, cost_per_unit in cursor.fetchall():
+                stock[item_id] = [quantity or 0, cost_per_unit or 0, 0, 0]
+        return stock
+
+    def import_chunk(self, records):
+        """Import one chunk of (line_number, record) in a single transaction"""
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            items = []
+            transactions = []
+            for line_number, record in records:
+                self.lines += 1
+                if isinstance(record, LineError):
+                    self._error(line_number, str(record))
+                elif record.get('record', 'transaction') == 'item':
+                    items.append((line_number, record))
+                else:
+                    transactions.append((line_number, record))
+            transactions = self._create_items(cursor, items) + transactions
+
+            parsed = []
+            for line_number, record in transactions:
+                try:
+                    parsed.append((line_number, self._parse_transaction(record)))
+                except LineError as e:
+                    self._error(line_number, str(e))
+
+            # item id -> [on hand, average cost, quantity delta, total cost added],
+            # applied line by line exactly as single transactions would be
+            stock = self._load_stock(cursor, {transaction[0] for _, transaction in parsed})
+            rows = []
+            movements = []
+            for line_number, (item_id, transaction_type, quantity, cost, notes, day, expiry, initial) in parsed:
+                item = stock.get(item_id)
+                if item is None:
+                    self._error(line_number, f"Inventory item {item_id} not found")
+                    continue
+                unit_cost = item[1]
+                if transaction_type == 'purchase':
+                    if cost and not initial:
+                        unit_cost = cost / quantity
+                        on_hand = max(item[0], 0)
+                        item[1] = (on_hand * item[1] + quantity * unit_cost) / (on_hand + quantity)
+                    if not initial:
+                        item[0] += quantity
+                        item[2] += quantity
+                        item[3] += cost
+                elif transaction_type in OUTFLOW_TYPES:
+                    item[0] -= quantity
+                    item[2] -= quantity
+                rows.append((item_id, transaction_type, quantity, cost, unit_cost, notes, day))
+                movements.append((item_id, transaction_type, quantity, day, expiry, unit_cost, None))
+
+            cursor.executemany('''
+                INSERT INTO inventory_transactions
+                (inventory_id, transaction_type, quantity, cost, unit_cost, notes, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            apply_lot_movements(cursor, movements)
+            cursor.executemany('''
+                UPDATE inventory
+                SET current_quantity = current_quantity + ?, cost_per_unit = ?,
+                    total_cost = total_cost + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(delta, average_cost, cost_added, item_id)
+                  for item_id, (_, average_cost, delta, cost_added) in stock.items()
+                  if delta or cost_added])
+            self.conn.commit()
+            self.transactions += len(rows)
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def import_records(self, records, chunk_lines=CHUNK_LINES):
+        """Import an iterable of (line_number, record) chunk by chunk"""
+        chunk = []
+        for entry in records:
+            chunk.append(entry)
+            if len(chunk) >= chunk_lines:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+
+    def report(self):
+        self.errors.sort(key=lambda error: error['line'])
+        return {
+            'lines': self.lines,
+            'transactions': self.transactions,
+            'items_created': self.items_created,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+
+def import_stream(conn, stream, import_format):
+    """Import a text stream of CSV or NDJSON lines, returning the report"""
+    if import_format not in READERS:
+        raise ValueError(f"format must be one of {', '.join(READERS)}")
+    started = time.perf_counter()
+    importer = BulkImporter(conn)
+    importer.import_records(READERS[import_format](stream))
+    report = importer.report()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import inventory transactions and items")
+    parser.add_argument('file', help="CSV or NDJSON file, - for stdin")
+    parser.add_argument('--format', choices=list(READERS), help="Defaults to the file extension")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database path")
+    args = parser.parse_args()
+
+    import_format = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    conn = sqlite3.connect(args.db, timeout=30)
+    if args.file == '-':
+        report = import_stream(conn, io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'), import_format)
+    else:
+        with open(args.file, newline='', encoding='utf-8') as stream:
+            report = import_stream(conn, stream, import_format)
+    conn.close()
+
+    print(f"Imported {report['transactions']} transactions and {report['items_created']} items "
+          f"from {report['lines']} lines in {report['seconds']}s")
+    for error in report['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+    if report['error_count'] > len(report['errors']):
+        print(f"  ... {report['error_count'] - len(report['errors'])} more errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Change feed for delta sync
+Triggers append every write to inventory and inventory_transactions to
+change_log under a monotonically increasing sequence; clients ask for the
+changes after the last sequence they saw instead of re-downloading the list
+"""
+
+import os
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+# Tombstones older than this are pruned; clients further behind must resync
+TOMBSTONE_DAYS = int(os.getenv('CHANGE_FEED_TOMBSTONE_DAYS', '30'))
+PRUNE_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Feed name of each tracked table
+FEED_TABLES = {
+    'inventory': 'inventory',
+    'inventory_transactions': 'transactions'
+}
+
+
+def change_log_triggers(table_name):
+    """Trigger statements that log every insert, update and delete of a table
+
+    Each row keeps only its latest entry, so the log grows with the number of
+    changed rows rather than the number of writes.
+    """
+    log_row = '''
+        DELETE FROM change_log WHERE table_name = '{table}' AND row_id = {row}.id;
+        INSERT INTO change_log (table_name, row_id, operation) VALUES ('{table}', {row}.id, '{operation}');
+    '''
+    return [
+        (f'{table_name}_change_log_{event.lower()}',
+         f'''
+         CREATE TRIGGER {table_name}_change_log_{event.lower()}
+         AFTER {event} ON {table_name}
+         BEGIN {log_row.format(table=table_name, row=row, operation=operation)} END
+         ''')
+        for event, row, operation in (('INSERT', 'NEW', 'upsert'), ('UPDATE', 'NEW', 'upsert'),
+                                      ('DELETE', 'OLD', 'delete'))
+    ]
+
+
+def current_sequence(cursor):
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _pruned_through(cursor):
+    cursor.execute("SELECT value FROM sync_state WHERE name = 'change_log_pruned_through'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _load_rows(cursor, table_name, row_ids):
+    rows = {}
+    row_ids = list(row_ids)
+    for offset in range(0, len(row_ids), 900):
+        batch = row_ids[offset:offset + 900]
+        cursor.execute(f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' * len(batch))})", batch)
+        columns = [description[0] for description in cursor.description]
+        for row in cursor.fetchall():
+            rows[row[0]] = dict(zip(columns, row))
+    return rows
+
+
+def get_changes(cursor, since=0, limit=DEFAULT_LIMIT):
+    """Changes after sequence `since`, oldest first
+
+    Upserts carry the full current row and deletes are tombstones with just
+    the id. When since is 0 or older than the pruned history, the response is
+    a reset holding the whole inventory; transactions are only fed from then on.
+    """
+    if since < 0:
+        raise ValueError("since must not be negative")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    # One read transaction, so the rows match the sequence they are reported at
+    cursor.execute('BEGIN')
+    try:
+        sequence = current_sequence(cursor)
+        if since == 0 or since < _pruned_through(cursor) or since > sequence:
+            cursor.execute('SELECT * FROM inventory ORDER BY id')
+            columns = [description[0] for description in cursor.description]
+            return {
+                'reset': True,
+                'seq': sequence,
+                'has_more': False,
+                'inventory': [dict(zip(columns, row)) for row in cursor.fetchall()],
+                'changes': []
+            }
+
+        cursor.execute('''
+            SELECT seq, table_name, row_id, operation FROM change_log
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (since, limit + 1))
+        entries = cursor.fetchall()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        rows = {
+            table_name: _load_rows(cursor, table_name, {
+                row_id for _, entry_table, row_id, operation in entries
+                if entry_table == table_name and operation == 'upsert'
+            })
+            for table_name in FEED_TABLES
+        }
+        changes = []
+        for seq, table_name, row_id, operation in entries:
+            row = rows[table_name].get(row_id) if operation == 'upsert' else None
+            change = {'seq': seq, 'table': FEED_TABLES[table_name], 'id': row_id,
+                      'op': operation if row is not None or operation == 'delete' else 'delete'}
+            if row is not None:
+                change['row'] = row
+            changes.append(change)
+
+        return {
+            'reset': False,
+            'seq': entries[-1][0] if entries else since,
+            'has_more': has_more,
+            'changes': changes
+        }
+    finally:
+        cursor.execute('COMMIT')
+
+
+def prune_change_log(conn, days=TOMBSTONE_DAYS):
+    """Drop tombstones older than `days`, returning how many were removed"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            SELECT MAX(seq) FROM change_log
+            WHERE operation = 'delete' AND changed_at < datetime('now', ?)
+        ''', (f'-{days} days',))
+        pruned_through = cursor.fetchone()[0]
+        if pruned_through is None:
+            conn.commit()
+            return 0
+        cursor.execute("DELETE FROM change_log WHERE operation = 'delete' AND seq <= ?", (pruned_through,))
+        removed = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO sync_state (name, value) VALUES ('change_log_pruned_through', ?)
+            ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)
+        ''', (pruned_through,))
+        conn.commit()
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
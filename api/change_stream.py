@@ -0,0 +1,176 @@
+"""
+In-process pub/sub for live inventory changes
+Writes publish item, transaction, low-stock and expiry events after they
+commit; each Server-Sent Events subscriber reads from its own bounded buffer,
+so a slow client loses its backlog (and is told to resync) instead of growing
+memory
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from inventory_context import EXPIRING_SOON_DAYS
+
+# Events held per subscriber before it is cut back to a single resync event
+BUFFER_EVENTS = int(os.getenv('CHANGE_STREAM_BUFFER_EVENTS', '256'))
+MAX_SUBSCRIBERS = int(os.getenv('CHANGE_STREAM_MAX_SUBSCRIBERS', '100'))
+# Comment lines sent while idle so proxies keep the connection open and
+# disconnected clients are noticed
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+ITEM_FIELDS = ('id', 'name', 'unit', 'category', 'current_quantity', 'min_quantity', 'expiration_date')
+
+
+class Subscription:
+    """One subscriber's bounded event buffer"""
+
+    def __init__(self, buffer_events=BUFFER_EVENTS):
+        self.buffer_events = buffer_events
+        self.events = deque()
+        self.overflowed = False
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def put(self, event):
+        with self._condition:
+            if len(self.events) >= self.buffer_events:
+                # The client is behind; drop its backlog rather than queue without bound
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=HEARTBEAT_SECONDS):
+        """Events buffered so far, waiting up to timeout; empty on timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.events or self.overflowed or self.closed, timeout)
+            events = []
+            if self.overflowed:
+                # Comes before anything buffered since the backlog was dropped
+                self.overflowed = False
+                events.append({'event': 'resync', 'data': {'reason': 'buffer_overflow'}})
+            events.extend(self.events)
+            self.events.clear()
+            return events
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class ChangeBroker:
+    """Fans published events out to every subscription"""
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscriptions = set()
+        self.event_id = 0
+        self._lock = threading.Lock()
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self):
+        with self._lock:
+            if len(self.subscriptions) >= self.max_subscribers:
+                raise RuntimeError("Too many change stream subscribers")
+            subscription = Subscription()
+            self.subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, event_type, data):
+        with self._lock:
+            if not self.subscriptions:
+                return
+            self.event_id += 1
+            event = {'id': self.event_id, 'event': event_type, 'data': data}
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def publish_item_write(self, before, after, seq=None, transaction=None):
+        """Publish one committed item write and any thresholds it crossed
+
+        before and after are item dicts (None for a created or deleted item);
+        seq is the change feed sequence after the write, so a client can
+        catch up through the delta sync endpoint after a resync.
+        """
+        if not self.subscriptions or (before is None and after is None):
+            return
+        if transaction is not None:
+            self.publish('transaction', {'seq': seq, 'transaction': transaction})
+        if after is None:
+            self.publish('inventory', {'seq': seq, 'op': 'delete', 'id': before['id']})
+            return
+        self.publish('inventory', {'seq': seq, 'op': 'upsert', 'item': after})
+
+        if is_low_stock(after) and not is_low_stock(before):
+            self.publish('low_stock', {'seq': seq, 'item': after})
+        if is_expiring(after) and not is_expiring(before):
+            self.publish('expiring', {'seq': seq, 'item': after, 'days_left': days_until_expiry(after)})
+
+
+def days_until_expiry(item, today=None):
+    if not item or not item.get('expiration_date'):
+        return None
+    try:
+        expires = datetime.strptime(str(item['expiration_date'])[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return (expires - (today or datetime.now().date())).days
+
+
+def is_low_stock(item):
+    return bool(item) and item.get('min_quantity') is not None and (item.get('current_quantity') or 0) <= item['min_quantity']
+
+
+def is_expiring(item):
+    """Stock on hand that expires within EXPIRING_SOON_DAYS"""
+    days_left = days_until_expiry(item)
+    return days_left is not None and days_left <= EXPIRING_SOON_DAYS and (item.get('current_quantity') or 0) > 0
+
+
+def load_item(cursor, item_id):
+    """The fields events carry for one item, or None if it does not exist"""
+    cursor.execute(f"SELECT {', '.join(ITEM_FIELDS)} FROM inventory WHERE id = ?", (item_id,))
+    row = cursor.fetchone()
+    return dict(zip(ITEM_FIELDS, row)) if row else None
+
+
+def format_event(event):
+    """Serialize an event in the text/event-stream wire format"""
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'])}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def event_stream(broker, subscription, hello=None):
+    """Generator of text/event-stream chunks for one subscription"""
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        yield format_event({'event': 'hello', 'data': hello or {}})
+        while not subscription.closed:
+            events = subscription.get()
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            yield ''.join(format_event(event) for event in events)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+change_broker = ChangeBroker()
@@ -0,0 +1,245 @@
+"""
+Columnar in-memory analytics engine
+Keeps inventory_transactions as typed NumPy column arrays, appends new rows
+incrementally and answers the dashboard aggregations with vectorized group-bys
+
+Optional: enable with ANALYTICS_ENGINE=columnar (requires NumPy)
+"""
+
+import os
+import threading
+from datetime import date, datetime
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from analytics import SNAPSHOT_WEEKS, TRACKED_TYPES, format_dashboard_snapshot
+from inventory_context import get_table_versions
+
+ENGINE = os.getenv('ANALYTICS_ENGINE', 'sql')
+LOAD_BATCH_ROWS = 200000
+MOST_WASTED_LIMIT = 10
+
+EPOCH = date(1970, 1, 1)
+# 1970-01-01 was a Thursday, so day + 3 is a multiple of 7 on Mondays
+EPOCH_WEEKDAY = 3
+# Transaction types outside TRACKED_TYPES share the last code and are ignored
+OTHER_TYPE = len(TRACKED_TYPES)
+WASTE = TRACKED_TYPES.index('waste')
+
+_TYPE_CASE = ' '.join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(TRACKED_TYPES))
+_COLUMNS = 6
+# Every column numeric so a batch converts to one float array; NULLs become -1.
+# value uses the unit cost recorded with each transaction, like the rollup.
+_LOAD_SQL = f'''
+    SELECT t.id,
+           COALESCE(CAST(julianday(date(t.date)) - 2440587.5 AS INTEGER), -1),
+           COALESCE(t.inventory_id, -1),
+           CASE t.transaction_type {_TYPE_CASE} ELSE {OTHER_TYPE} END,
+           COALESCE(t.quantity, 0),
+           COALESCE(t.quantity * COALESCE(t.unit_cost, i.cost_per_unit, 0), 0)
+    FROM inventory_transactions t
+    LEFT JOIN inventory i ON t.inventory_id = i.id
+    WHERE t.id > ?
+    ORDER BY t.id
+'''
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def columnar_enabled():
+    """Whether the dashboard should be served by the columnar engine"""
+    if ENGINE != 'columnar':
+        return False
+    if np is None:
+        print("ANALYTICS_ENGINE=columnar needs NumPy, falling back to SQL analytics")
+        return False
+    return True
+
+
+class TransactionColumns:
+    """Transaction history as growable typed column arrays
+
+    Days are stored as days since 1970-01-01 and rows are kept sorted by day,
+    so a date window is two binary searches and a slice. Item names and units
+    live in small per-item lists, so renaming an item only rebuilds those.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.last_id = 0
+        self.is_sorted = True
+        self.transactions_version = None
+        self.inventory_version = None
+        self._allocate(0)
+        self._set_items([])
+
+    def _allocate(self, capacity):
+        self.day = np.empty(capacity, dtype=np.int32)
+        self.inventory_id = np.empty(capacity, dtype=np.int64)
+        self.type_code = np.empty(capacity, dtype=np.int8)
+        self.quantity = np.empty(capacity, dtype=np.float64)
+        self.value = np.empty(capacity, dtype=np.float64)
+
+    def _columns(self):
+        return (self.day, self.inventory_id, self.type_code, self.quantity, self.value)
+
+    def _append(self, block):
+        """Append an (n, 6) float block of id, day, inventory_id, type, quantity, value"""
+        count = len(block)
+        if not count:
+            return
+        needed = self.size + count
+        if needed > len(self.day):
+            # Grow geometrically so repeated small appends stay amortized O(1)
+            old = self._columns()
+            self._allocate(max(needed, 2 * len(self.day), 1024))
+            for new_column, old_column in zip(self._columns(), old):
+                new_column[:self.size] = old_column[:self.size]
+
+        # Rows normally arrive in date order; back-dated ones force a re-sort
+        days = block[:, 1]
+        if (self.size and days[0] < self.day[self.size - 1]) or (count > 1 and (days[1:] < days[:-1]).any()):
+            self.is_sorted = False
+
+        end = self.size + count
+        self.day[self.size:end] = days
+        self.inventory_id[self.size:end] = block[:, 2]
+        self.type_code[self.size:end] = block[:, 3]
+        self.quantity[self.size:end] = block[:, 4]
+        self.value[self.size:end] = block[:, 5]
+        self.size = end
+        self.last_id = int(block[-1, 0])
+
+    def _load_since(self, cursor, last_id):
+        """Read transactions with id > last_id as float blocks"""
+        cursor.execute(_LOAD_SQL, (last_id,))
+        blocks = []
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_ROWS)
+            if not rows:
+                break
+            flat = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * _COLUMNS)
+            blocks.append(flat.reshape(len(rows), _COLUMNS))
+        return blocks
+
+    def _set_items(self, rows):
+        """Index inventory rows of (id, name, unit)"""
+        self.item_names = [row[1] for row in rows] + [None]
+        self.item_units = [row[2] for row in rows] + [None]
+        # inventory id -> dense item index; unknown or deleted items map to the last slot
+        max_id = max((row[0] for row in rows), default=0)
+        self.item_lookup = np.full(max_id + 2, len(rows), dtype=np.int64)
+        if rows:
+            self.item_lookup[np.array([row[0] for row in rows], dtype=np.int64)] = np.arange(len(rows))
+
+    def _sort_by_day(self):
+        if self.is_sorted:
+            return
+        order = np.argsort(self.day[:self.size], kind='stable')
+        for column in self._columns():
+            column[:self.size] = column[:self.size][order]
+        self.is_sorted = True
+
+    def refresh(self, cursor):
+        """Bring the columns up to date with the database
+
+        Triggers bump the transactions version once per inserted, updated or
+        deleted row. When the bump equals the number of new rows, only inserts
+        happened and they are appended; otherwise the history is reloaded.
+        """
+        cursor.execute('BEGIN')
+        try:
+            versions = dict(get_table_versions(cursor))
+            transactions_version = versions.get('inventory_transactions', 0)
+            inventory_version = versions.get('inventory', 0)
+
+            if inventory_version != self.inventory_version:
+                cursor.execute('SELECT id, name, unit FROM inventory ORDER BY id')
+                self._set_items(cursor.fetchall())
+                self.inventory_version = inventory_version
+
+            if transactions_version != self.transactions_version:
+                blocks = self._load_since(cursor, self.last_id)
+                new_rows = sum(len(block) for block in blocks)
+                if (self.transactions_version is not None
+                        and transactions_version - self.transactions_version != new_rows):
+                    self.size = 0
+                    self.last_id = 0
+                    self.is_sorted = True
+                    blocks = self._load_since(cursor, 0)
+                for block in blocks:
+                    self._append(block)
+                self._sort_by_day()
+                self.transactions_version = transactions_version
+        finally:
+            cursor.execute('COMMIT')
+
+    def dashboard_snapshot(self, end_day, weeks=SNAPSHOT_WEEKS):
+        """Dashboard payload for the ISO weeks up to end_day (days since epoch)
+
+        Week 1 runs from the Monday of end_day's week to end_day, matching the
+        SQL snapshot.
+        """
+        type_count = OTHER_TYPE + 1
+        current_week = end_day - (end_day + EPOCH_WEEKDAY) % 7
+        start = np.searchsorted(self.day[:self.size], current_week - (weeks - 1) * 7, side='left')
+        end = np.searchsorted(self.day[:self.size], end_day, side='right')
+        inventory_id = self.inventory_id[start:end]
+        known = inventory_id >= 0
+
+        week_index = (current_week + 6 - self.day[start:end][known]) // 7
+        types = self.type_code[start:end][known].astype(np.int64)
+        quantity = self.quantity[start:end][known]
+        value = self.value[start:end][known]
+        items = self.item_lookup[np.minimum(inventory_id[known], len(self.item_lookup) - 1)]
+
+        totals = np.bincount(
+            week_index * type_count + types, weights=quantity, minlength=weeks * type_count
+        ).reshape(weeks, type_count)
+
+        waste = types == WASTE
+        waste_cost = value[waste]
+        money_wasted = np.bincount(week_index[waste], weights=waste_cost, minlength=weeks)
+
+        item_slots = len(self.item_names)
+        current = week_index[waste] == 0
+        current_items = items[waste][current]
+        item_quantity = np.bincount(current_items, weights=quantity[waste][current], minlength=item_slots)
+        item_total_cost = np.bincount(current_items, weights=waste_cost[current], minlength=item_slots)
+        item_rows = np.bincount(current_items, minlength=item_slots)
+        # The last slot collects unknown items, which have no name to show
+        item_rows[-1] = 0
+
+        wasted_items = []
+        candidates = np.flatnonzero(item_rows)
+        for index in candidates[np.argsort(-item_quantity[candidates], kind='stable')][:MOST_WASTED_LIMIT]:
+            wasted_items.append({
+                'name': self.item_names[index],
+                'unit': self.item_units[index],
+                'quantity': round(float(item_quantity[index]), 2),
+                'cost_per_unit': round(float(item_total_cost[index] / item_quantity[index]), 2) if item_quantity[index] else 0,
+                'total_cost': round(float(item_total_cost[index]), 2)
+            })
+
+        week_totals = {
+            week + 1: {name: float(totals[week, code]) for code, name in enumerate(TRACKED_TYPES)}
+            for week in range(weeks)
+        }
+        week_money = {week + 1: float(money_wasted[week]) for week in range(weeks)}
+        return format_dashboard_snapshot(week_totals, week_money, wasted_items, weeks)
+
+
+def columnar_dashboard_snapshot(cursor, weeks=SNAPSHOT_WEEKS):
+    """Dashboard snapshot from the shared columnar engine, refreshed first"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TransactionColumns()
+        _engine.refresh(cursor)
+        end_day = (datetime.utcnow().date() - EPOCH).days
+        return _engine.dashboard_snapshot(end_day, weeks)
@@ -9,6 +9,8 @@ import random
 from datetime import datetime, timedelta
 import json
 
+from lots import seed_lots
+
 def init_database():
     """Initialize the database with tables"""
     conn = sqlite3.connect('demand_history.db')
@@ -42,12 +44,38 @@ def init_database():
             transaction_type TEXT NOT NULL,
             quantity REAL NOT NULL,
             cost REAL DEFAULT 0,
+            unit_cost REAL,
             notes TEXT,
             date TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (inventory_id) REFERENCES inventory (id)
         )
     ''')
+    cursor.execute("PRAGMA table_info(inventory_transactions)")
+    if 'unit_cost' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE inventory_transactions ADD COLUMN unit_cost REAL')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_lots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inventory_id INTEGER NOT NULL,
+            quantity_received REAL NOT NULL,
+            quantity_remaining REAL NOT NULL,
+            received_date TEXT NOT NULL,
+            expiration_date TEXT,
+            unit_cost REAL,
+            transaction_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inventory_id) REFERENCES inventory (id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS demand_calculations (
@@ -73,6 +101,15 @@ def init_database():
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS demand_analyses (
+            calculation_id INTEGER PRIMARY KEY,
+            analysis TEXT NOT NULL,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (calculation_id) REFERENCES demand_calculations (id)
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -201,7 +238,7 @@ def generate_transaction_history():
     cursor = conn.cursor()
     
     # Get all inventory items
-    cursor.execute('SELECT id, name, category, unit FROM inventory')
+    cursor.execute('SELECT id, name, category, unit, cost_per_unit FROM inventory')
     items = cursor.fetchall()
     
     # Generate transactions for the past 30 days
@@ -213,7 +250,7 @@ def generate_transaction_history():
         
         for _ in range(num_transactions):
             item = random.choice(items)
-            item_id, name, category, unit = item
+            item_id, name, category, unit, cost_per_unit = item
             
             # Transaction types with realistic probabilities
             transaction_type = random.choices(
@@ -255,15 +292,31 @@ def generate_transaction_history():
                 cost = quantity * random.uniform(0.8, 1.2) * 4.50  # Approximate cost
                 notes = f"Restocked from {random.choice(['Local Poultry Co.', 'Premium Meats', 'Garden Fresh Produce', 'Italian Import Co.'])}"
             
+            # Purchases are valued at their own price, everything else at the item's cost
+            unit_cost = cost / quantity if transaction_type == 'purchase' else cost_per_unit
+            
             # Insert transaction
             cursor.execute('''
                 INSERT INTO inventory_transactions 
-                (inventory_id, transaction_type, quantity, cost, notes, date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (item_id, transaction_type, quantity, cost, notes, transaction_date))
+                (inventory_id, transaction_type, quantity, cost, unit_cost, notes, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (item_id, transaction_type, quantity, cost, unit_cost, notes, transaction_date))
+    
+    conn.commit()
+    conn.close()
+
+def open_inventory_lots():
+    """Open one lot per stocked item from its current quantity and expiration date"""
+    conn = sqlite3.connect('demand_history.db')
+    cursor = conn.cursor()
+    
+    opened = seed_lots(cursor)
+    # The lots already match current stock, so the API must not seed them again
+    cursor.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('inventory_lots_seeded', 1)")
     
     conn.commit()
     conn.close()
+    return opened
 
 def generate_demand_calculations():
     """Generate sample demand calculations for Italian dishes"""
@@ -389,8 +442,8 @@ def generate_demand_calculations():
             (dish_name, dish_price, major_ingredients, category, cuisine, 
              emailed_in_promotions, featured_on_homepage, discount_applied, 
              discount_percentage, city_name, center_type, predicted_orders, 
-             final_price, total_price, discount_amount, ingredient_analysis)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             final_price, total_price, discount_amount)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             dish["dish_name"],
             dish["dish_price"],
@@ -406,9 +459,11 @@ def generate_demand_calculations():
             dish["predicted_orders"],
             final_price,
             total_price,
-            discount_amount,
-            json.dumps(ingredient_analysis)
+            discount_amount
         ))
+        cursor.execute('''
+            INSERT INTO demand_analyses (calculation_id, analysis) VALUES (?, ?)
+        ''', (cursor.lastrowid, json.dumps(ingredient_analysis)))
     
     conn.commit()
     conn.close()
@@ -419,6 +474,8 @@ def clear_existing_data():
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM inventory_transactions')
+    cursor.execute('DELETE FROM inventory_lots')
+    cursor.execute('DELETE FROM demand_analyses')
     cursor.execute('DELETE FROM demand_calculations')
     cursor.execute('DELETE FROM inventory')
     
@@ -430,13 +487,13 @@ def main():
     """Main function to generate all demo data"""
     print("🍝 Generating Italian Restaurant Demo Data...")
     
-    # Clear existing data
-    clear_existing_data()
-    
     # Initialize database
     init_database()
     print("✅ Database initialized")
     
+    # Clear existing data
+    clear_existing_data()
+    
     # Generate inventory items
     conn = sqlite3.connect('demand_history.db')
     cursor = conn.cursor()
@@ -465,6 +522,10 @@ def main():
     generate_realistic_quantities_and_dates()
     print("✅ Generated realistic quantities and expiration dates")
     
+    # Stock on hand becomes lots, so expiring stock and FIFO usage work
+    lots_opened = open_inventory_lots()
+    print(f"✅ Opened {lots_opened} inventory lots")
+    
     # Generate transaction history
     generate_transaction_history()
     print("✅ Generated 30 days of transaction history")
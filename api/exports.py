@@ -0,0 +1,226 @@
+"""
+Streaming exports of transactions and demand history
+Rows are read in keyset-paginated batches and written out as CSV, NDJSON or
+Parquet chunks, so memory stays flat and no read lock is held between batches
+
+Optional: Parquet needs pyarrow
+"""
+
+import csv
+import io
+import json
+import sqlite3
+from datetime import timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DB_PATH = 'demand_history.db'
+
+BATCH_ROWS = 5000
+# Parquet row groups should be large for compression and scan speed
+PARQUET_BATCH_ROWS = 20000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+# name -> columns as (name, select expression, type), the table's id and date
+# expressions, the column the types filter applies to, and columns holding JSON
+EXPORTS = {
+    'transactions': {
+        'columns': [
+            ('id', 't.id', 'int'),
+            ('date', 't.date', 'str'),
+            ('inventory_id', 't.inventory_id', 'int'),
+            ('inventory_name', 'i.name', 'str'),
+            ('unit', 'i.unit', 'str'),
+            ('category', 'i.category', 'str'),
+            ('transaction_type', 't.transaction_type', 'str'),
+            ('quantity', 't.quantity', 'float'),
+            ('unit_cost', 't.unit_cost', 'float'),
+            ('cost', 't.cost', 'float'),
+            ('value', 't.quantity * COALESCE(t.unit_cost, i.cost_per_unit, 0)', 'float'),
+            ('notes', 't.notes', 'str'),
+            ('created_at', 't.created_at', 'str')
+        ],
+        'source': 'inventory_transactions t LEFT JOIN inventory i ON t.inventory_id = i.id',
+        'id': 't.id',
+        'date': 't.date',
+        'type': 't.transaction_type',
+        'json_columns': ()
+    },
+    'demand-history': {
+        'columns': [
+            ('id', 'd.id', 'int'),
+            ('dish_name', 'd.dish_name', 'str'),
+            ('dish_price', 'd.dish_price', 'float'),
+            ('major_ingredients', 'd.major_ingredients', 'str'),
+            ('category', 'd.category', 'str'),
+            ('cuisine', 'd.cuisine', 'str'),
+            ('emailed_in_promotions', 'd.emailed_in_promotions', 'int'),
+            ('featured_on_homepage', 'd.featured_on_homepage', 'int'),
+            ('discount_applied', 'd.discount_applied', 'int'),
+            ('discount_percentage', 'd.discount_percentage', 'float'),
+            ('city_name', 'd.city_name', 'str'),
+            ('center_type', 'd.center_type', 'str'),
+            ('predicted_orders', 'd.predicted_orders', 'int'),
+            ('final_price', 'd.final_price', 'float'),
+            ('total_price', 'd.total_price', 'float'),
+            ('discount_amount', 'd.discount_amount', 'float'),
+            ('ingredient_analysis', 'a.analysis', 'str'),
+            ('created_at', 'd.created_at', 'str'),
+            ('updated_at', 'd.updated_at', 'str')
+        ],
+        'source': 'demand_calculations d LEFT JOIN demand_analyses a ON a.calculation_id = d.id',
+        'id': 'd.id',
+        'date': 'd.created_at',
+        'type': 'd.category',
+        'json_columns': ('ingredient_analysis',)
+    }
+}
+
+
+def build_export_query(name, start=None, end=None, types=None):
+    """SQL for one batch of an export, with :after_id and :limit left to bind
+
+    start and end are dates; end is inclusive.
+    """
+    spec = EXPORTS[name]
+    conditions = [f"{spec['id']} > :after_id"]
+    params = {}
+    if start:
+        conditions.append(f"{spec['date']} >= :start")
+        params['start'] = start.isoformat()
+    if end:
+        conditions.append(f"{spec['date']} < :end")
+        params['end'] = (end + timedelta(days=1)).isoformat()
+    if types:
+        placeholders = []
+        for index, value in enumerate(types):
+            params[f'type{index}'] = value
+            placeholders.append(f':type{index}')
+        conditions.append(f"{spec['type']} IN ({', '.join(placeholders)})")
+
+    select = ', '.join(f'{expression} AS {column}' for column, expression, _ in spec['columns'])
+    sql = f'''
+        SELECT {select}
+        FROM {spec['source']}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {spec['id']}
+        LIMIT :limit
+    '''
+    return sql, params
+
+
+def iter_batches(sql, params, batch_rows=BATCH_ROWS, db_path=DB_PATH):
+    """Yield lists of rows in id order, one short query per batch"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        after_id = 0
+        while True:
+            cursor.execute(sql, {**params, 'after_id': after_id, 'limit': batch_rows})
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_rows:
+                return
+            # The id is always the first column
+            after_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def csv_chunks(columns, batches):
+    yield ','.join(columns) + '\r\n'
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def ndjson_chunks(columns, batches, json_columns=()):
+    json_indexes = [columns.index(column) for column in json_columns]
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for index in json_indexes:
+                value = row[index]
+                if value:
+                    try:
+                        record[columns[index]] = json.loads(value)
+                    except json.JSONDecodeError:
+                        pass
+            lines.append(json.dumps(record))
+        yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last take()"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_chunks(column_specs, batches):
+    """One Parquet row group per batch, yielded as soon as it is written"""
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    schema = pa.schema([(column, types[kind]) for column, _, kind in column_specs])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in batches:
+            arrays = [pa.array([row[index] for row in rows], type=field.type) for index, field in enumerate(schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def stream_export(name, export_format, start=None, end=None, types=None):
+    """Generator of response chunks for an export"""
+    if export_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if export_format == 'parquet' and pa is None:
+        raise ValueError("Parquet export needs pyarrow installed")
+
+    spec = EXPORTS[name]
+    columns = [column for column, _, _ in spec['columns']]
+    sql, params = build_export_query(name, start, end, types)
+    if export_format == 'parquet':
+        return parquet_chunks(spec['columns'], iter_batches(sql, params, PARQUET_BATCH_ROWS))
+    batches = iter_batches(sql, params)
+    if export_format == 'csv':
+        return csv_chunks(columns, batches)
+    return ndjson_chunks(columns, batches, spec['json_columns'])
@@ -0,0 +1,106 @@
+"""
+JSON encoding for API responses
+Encodes with orjson when it is installed and the standard library otherwise;
+values already stored as JSON text are wrapped in RawJSON and spliced into
+the output verbatim instead of being decoded and encoded again
+
+Optional: pip install orjson (3.9 or newer, for orjson.Fragment)
+"""
+
+import json
+import re
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Splicing needs orjson.Fragment; older orjson releases use the stdlib path
+if orjson is not None and not hasattr(orjson, 'Fragment'):
+    orjson = None
+
+ENGINE = 'orjson' if orjson is not None else 'json'
+
+
+class RawJSON:
+    """Text that is already valid JSON, written into the output as it is"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _dumps_orjson(obj, default, sort_keys, indent):
+    def encode(value):
+        if isinstance(value, RawJSON):
+            return orjson.Fragment(value.text)
+        if isinstance(value, tuple):
+            # Named tuples; plain tuples never get here
+            return list(value)
+        if default is None:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        return default(value)
+
+    # Dates and dataclasses go through default so they come out as the stdlib path writes them
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    if sort_keys:
+        options |= orjson.OPT_SORT_KEYS
+    if indent:
+        options |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=encode, option=options)
+
+
+def _dumps_stdlib(obj, default, sort_keys, indent):
+    # RawJSON values are written as unique placeholder strings and swapped for their text afterwards
+    raw = []
+    token = uuid.uuid4().hex
+
+    def encode(value):
+        if isinstance(value, RawJSON):
+            raw.append(value.text)
+            return f'\0{token}{len(raw) - 1}\0'
+        if default is None:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        return default(value)
+
+    text = json.dumps(obj, default=encode, sort_keys=sort_keys,
+                      indent=2 if indent else None, separators=None if indent else (',', ':'))
+    if raw:
+        text = re.sub(rf'"\\u0000{token}(\d+)\\u0000"', lambda match: raw[int(match.group(1))], text)
+    return text.encode('utf-8')
+
+
+def dumps(obj, default=None, sort_keys=False, indent=False):
+    """Encode obj as UTF-8 JSON bytes, splicing RawJSON values in verbatim
+
+    default is called for values neither encoder handles natively. The
+    stdlib path also covers what orjson rejects, such as integers over 64 bits.
+    """
+    if orjson is not None:
+        try:
+            return _dumps_orjson(obj, default, sort_keys, indent)
+        except orjson.JSONEncodeError:
+            pass
+    return _dumps_stdlib(obj, default, sort_keys, indent)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding through dumps(), so jsonify accepts RawJSON"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, self.default, self.sort_keys, kwargs.get('indent')).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(dumps(obj, self.default, self.sort_keys, indent) + b'\n',
+                                        mimetype=self.mimetype)
@@ -0,0 +1,232 @@
+"""
+Food bank matching index
+Matches inventory items to open food bank needs locally, so the AI only has to
+write the explanation instead of doing the matching
+"""
+
+from datetime import datetime
+
+from item_resolver import normalize_name
+
+PRIORITY_LABELS = {4: "CRITICAL", 3: "HIGH", 2: "MEDIUM", 1: "LOW"}
+
+UNIT_ALIASES = {
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "kg": "kg", "kgs": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "gal": "gallon", "gallon": "gallon", "gallons": "gallon",
+    "loaf": "loaf", "loaves": "loaf",
+    "can": "can", "cans": "can",
+    "dozen": "dozen",
+    "container": "container", "containers": "container",
+    "piece": "piece", "pieces": "piece", "unit": "piece", "units": "piece",
+    "bottle": "bottle", "bottles": "bottle",
+    "box": "box", "boxes": "box",
+    "bunch": "bunch", "bunches": "bunch"
+}
+
+# Weights for combining the ranking signals into a single score
+PRIORITY_WEIGHT = 0.4
+URGENCY_WEIGHT = 0.35
+FILL_WEIGHT = 0.25
+
+MATCH_QUALITY = {"exact": 1.0, "partial": 0.6, "category": 0.3}
+
+# Descriptive words that shouldn't make two different foods a partial match
+MATCH_STOPWORDS = {"fresh", "canned", "frozen", "ground", "organic", "whole"}
+
+
+def normalize_tokens(name):
+    """The words of a name, normalized as item_resolver does for item lookups"""
+    return tuple(normalize_name(name).split())
+
+
+def normalize_unit(unit):
+    unit = (unit or "").strip().lower()
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def expiry_urgency(expiration_date, today=None):
+    """Score from 0.2 (no rush) to 1.0 (expires within a day)"""
+    if not expiration_date:
+        return 0.2
+    today = today or datetime.now().date()
+    try:
+        expires = datetime.strptime(str(expiration_date)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return 0.2
+    days_left = (expires - today).days
+    if days_left <= 1:
+        return 1.0
+    if days_left <= 3:
+        return 0.8
+    if days_left <= 7:
+        return 0.5
+    return 0.2
+
+
+class FoodBankMatcher:
+    """In-memory index of open food bank needs keyed by name, token and category"""
+
+    def __init__(self, needs):
+        self.needs = needs
+        self.by_name = {}
+        self.by_token = {}
+        self.by_category = {}
+        for need in needs:
+            tokens = normalize_tokens(need["food_type"])
+            self.by_name.setdefault(" ".join(tokens), []).append(need)
+            for token in set(tokens) - MATCH_STOPWORDS:
+                self.by_token.setdefault(token, []).append(need)
+            self.by_category.setdefault(normalize_name(need["food_category"]), []).append(need)
+
+    @classmethod
+    def load(cls, cursor):
+        """Build the index from the open needs in the database"""
+        cursor.execute('''
+            SELECT n.id, n.food_category, n.food_type,
+                   n.quantity_needed - COALESCE(n.quantity_fulfilled, 0) as remaining,
+                   n.unit, n.priority_level, n.notes, n.expires_at,
+                   b.id, b.name, b.city, b.state, b.phone, b.email
+            FROM food_bank_needs n
+            JOIN food_banks b ON n.food_bank_id = b.id
+            WHERE n.quantity_needed - COALESCE(n.quantity_fulfilled, 0) > 0
+            AND (n.expires_at IS NULL OR n.expires_at >= date('now'))
+        ''')
+        needs = [
+            {
+                "need_id": row[0],
+                "food_category": row[1],
+                "food_type": row[2],
+                "remaining": row[3],
+                "unit": row[4],
+                "priority_level": row[5] or 1,
+                "notes": row[6],
+                "expires_at": row[7],
+                "food_bank_id": row[8],
+                "food_bank": row[9],
+                "city": row[10],
+                "state": row[11],
+                "phone": row[12],
+                "email": row[13]
+            }
+            for row in cursor.fetchall()
+        ]
+        return cls(needs)
+
+    def _candidates(self, name, category):
+        """Collect candidate needs with the best match type found for each"""
+        tokens = normalize_tokens(name)
+        candidates = {}
+
+        for need in self.by_category.get(normalize_name(category), []):
+            candidates[need["need_id"]] = (need, "category")
+        for token in set(tokens) - MATCH_STOPWORDS:
+            for need in self.by_token.get(token, []):
+                candidates[need["need_id"]] = (need, "partial")
+        for need in self.by_name.get(" ".join(tokens), []):
+            candidates[need["need_id"]] = (need, "exact")
+        return candidates.values()
+
+    def match_item(self, item, limit=3, today=None):
+        """Rank food bank needs for one inventory item
+
+        item needs name, category, unit, current_quantity and expiration_date.
+        """
+        available = item.get("current_quantity") or 0
+        unit = normalize_unit(item.get("unit"))
+        urgency = expiry_urgency(item.get("expiration_date"), today)
+
+        matches = []
+        for need, match_type in self._candidates(item.get("name"), item.get("category")):
+            same_unit = normalize_unit(need["unit"]) == unit
+            if same_unit:
+                suggested_quantity = min(available, need["remaining"])
+                fill = suggested_quantity / need["remaining"]
+            else:
+                # Units can't be compared, so the need can't be sized exactly
+                suggested_quantity = available
+                fill = 0.5
+
+            score = MATCH_QUALITY[match_type] * (
+                PRIORITY_WEIGHT * need["priority_level"] / 4
+                + URGENCY_WEIGHT * urgency
+                + FILL_WEIGHT * fill
+            )
+            if not same_unit:
+                score *= 0.7
+
+            matches.append({
+                "item": item.get("name"),
+                "item_unit": item.get("unit"),
+                "suggested_quantity": round(suggested_quantity, 2),
+                "food_bank": need["food_bank"],
+                "food_bank_id": need["food_bank_id"],
+                "need_id": need["need_id"],
+                "need": need["food_type"],
+                "need_category": need["food_category"],
+                "remaining_need": need["remaining"],
+                "need_unit": need["unit"],
+                "priority_level": need["priority_level"],
+                "priority": PRIORITY_LABELS.get(need["priority_level"], "UNKNOWN"),
+                "contact_phone": need["phone"],
+                "contact_email": need["email"],
+                "match_type": match_type,
+                "score": round(score, 4)
+            })
+
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return matches[:limit]
+
+    def match_inventory(self, items, limit=20, per_item=3):
+        """Best matches across many inventory items, highest score first"""
+        today = datetime.now().date()
+        matches = []
+        for item in items:
+            matches.extend(self.match_item(item, limit=per_item, today=today))
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return matches[:limit]
+
+
+# Cached index, rebuilt only when the food bank tables change
+_matcher_cache = {"stamp": None, "matcher": None}
+
+
+def get_matcher(cursor):
+    """Get the matching index, rebuilding it if the food bank tables changed"""
+    cursor.execute('''
+        SELECT table_name, version FROM table_versions
+        WHERE table_name IN ('food_banks', 'food_bank_needs')
+        ORDER BY table_name
+    ''')
+    stamp = (tuple(cursor.fetchall()), datetime.now().date().isoformat())
+    if _matcher_cache["stamp"] != stamp:
+        _matcher_cache["matcher"] = FoodBankMatcher.load(cursor)
+        _matcher_cache["stamp"] = stamp
+    return _matcher_cache["matcher"]
+
+
+def find_donation_matches(cursor, limit=20, per_item=3):
+    """Best food bank matches for everything currently in stock"""
+    matcher = get_matcher(cursor)
+    cursor.execute('''
+        SELECT name, category, unit, current_quantity, expiration_date
+        FROM inventory
+        WHERE current_quantity > 0
+    ''')
+    items = [
+        {"name": row[0], "category": row[1], "unit": row[2],
+         "current_quantity": row[3], "expiration_date": row[4]}
+        for row in cursor.fetchall()
+    ]
+    return matcher.match_inventory(items, limit=limit, per_item=per_item)
+
+
+def format_match(match):
+    """One prompt line describing a match"""
+    return (
+        f"- {match['item']}: donate {match['suggested_quantity']} {match['item_unit'] or ''} to "
+        f"{match['food_bank']} for their {match['need_category']} need '{match['need']}' "
+        f"({match['remaining_need']} {match['need_unit']} remaining, Priority: {match['priority']}, "
+        f"{match['match_type']} match) | Contact: {match['contact_phone']} | Email: {match['contact_email']}"
+    )
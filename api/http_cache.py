@@ -0,0 +1,63 @@
+"""
+Conditional GETs and response compression for read routes
+A route's ETag comes from the table_versions counters of the tables it
+reads, so an unchanged resource is answered with 304 from one small lookup,
+and bodies over a size threshold are sent gzip or brotli compressed. No
+Last-Modified is sent: timestamps have one-second resolution, and two
+writes within the same second would let an If-Modified-Since client keep a
+stale copy
+
+Optional: brotli is offered when the brotli package is installed
+"""
+
+import gzip
+import os
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies are sent as they are; compressing them saves less than the headers cost
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+# Brotli's default quality (11) is meant for static assets and too slow per request
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html')
+# In order of preference when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _day_stamp():
+    # Routes differ on whether "today" is local or UTC; either rolling over changes the stamp
+    return '.'.join(sorted({datetime.now().date().isoformat(), datetime.utcnow().date().isoformat()}))
+
+
+def resource_version(cursor, name, tables, daily=False):
+    """ETag of a resource built from the given tables
+
+    The ETag changes with any of the tables' version counters and, for daily
+    resources whose content depends on today's date, at midnight.
+    """
+    cursor.execute(f'''
+        SELECT table_name, version FROM table_versions
+        WHERE table_name IN ({', '.join('?' * len(tables))})
+        ORDER BY table_name
+    ''', tuple(tables))
+    etag = '-'.join([name] + [str(version) for _, version in cursor.fetchall()])
+    if daily:
+        etag += f'-{_day_stamp()}'
+    return etag
+
+
+def compressible(mimetype, size):
+    return mimetype in COMPRESSIBLE_MIMETYPES and size >= COMPRESS_MIN_BYTES
+
+
+def compress(data, encoding):
+    """Encode a response body with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
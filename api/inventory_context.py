@@ -0,0 +1,152 @@
+"""
+Inventory context builder for AI prompts
+Ranks inventory rows and recent activity and truncates them under a token budget
+"""
+
+import os
+from datetime import datetime
+
+# Rough token estimate used for budgeting (OpenAI models average ~4 chars/token)
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.getenv('INVENTORY_CONTEXT_TOKEN_BUDGET', '1200'))
+# Share of the budget reserved for inventory lines; the rest goes to transactions
+INVENTORY_BUDGET_SHARE = 0.7
+EXPIRING_SOON_DAYS = 7
+
+# (token_budget, days) -> (version stamp, (inventory_context, transaction_context))
+_context_cache = {}
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a piece of text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def get_table_versions(cursor, tables=None):
+    """Get the change counters maintained by triggers for each tracked table, or only the given ones"""
+    if tables is None:
+        cursor.execute('SELECT table_name, version FROM table_versions ORDER BY table_name')
+    else:
+        cursor.execute(f'''
+            SELECT table_name, version FROM table_versions
+            WHERE table_name IN ({', '.join('?' * len(tables))})
+            ORDER BY table_name
+        ''', tuple(tables))
+    return tuple(cursor.fetchall())
+
+
+def _days_until(expiration_date, today):
+    """Days until an expiration date, or None if it is missing or malformed"""
+    if not expiration_date:
+        return None
+    try:
+        expires = datetime.strptime(str(expiration_date)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return (expires - today).days
+
+
+def _rank_inventory(rows, today):
+    """Order inventory rows so low-stock and expiring items come first"""
+    ranked = []
+    for row in rows:
+        name, quantity, min_quantity, unit, expiration_date, category = row
+        days_left = _days_until(expiration_date, today)
+        low_stock = min_quantity is not None and quantity <= min_quantity
+        expiring = days_left is not None and days_left <= EXPIRING_SOON_DAYS
+
+        if low_stock and expiring:
+            tier = 0
+        elif expiring:
+            tier = 1
+        elif low_stock:
+            tier = 2
+        else:
+            tier = 3
+
+        flags = []
+        if low_stock:
+            flags.append('LOW STOCK')
+        if days_left is not None and days_left < 0:
+            flags.append('EXPIRED')
+        elif expiring:
+            flags.append(f'expires in {days_left}d')
+
+        line = f"- {name}: {round(quantity, 2)} {unit or ''} (min: {min_quantity}, expires: {expiration_date or 'n/a'})"
+        if flags:
+            line += f" [{', '.join(flags)}]"
+
+        sort_days = days_left if days_left is not None else float('inf')
+        ranked.append(((tier, sort_days, name or ''), line))
+
+    ranked.sort(key=lambda entry: entry[0])
+    return [line for _, line in ranked]
+
+
+def _take_within_budget(lines, budget, noun):
+    """Take lines in order until the token budget runs out"""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+
+    omitted = len(lines) - len(kept)
+    if omitted:
+        kept.append(f"- ... {omitted} more {noun} not shown")
+    return kept, used
+
+
+def build_inventory_context(cursor, days=3, token_budget=None):
+    """Build the inventory and recent-activity blocks for a prompt
+
+    Returns (inventory_context, transaction_context). Results are cached until
+    the inventory or transaction tables change.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    today = datetime.now().date()
+    stamp = (get_table_versions(cursor, ('inventory', 'inventory_transactions')), today.isoformat())
+
+    cache_key = (token_budget, days)
+    cached = _context_cache.get(cache_key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    cursor.execute('''
+        SELECT name, current_quantity, min_quantity, unit, expiration_date, category
+        FROM inventory
+        WHERE current_quantity > 0
+    ''')
+    inventory_lines = _rank_inventory(cursor.fetchall(), today)
+
+    # One line per item and transaction type instead of one per transaction
+    cursor.execute('''
+        SELECT i.name, it.transaction_type, SUM(it.quantity) as total_quantity,
+               COUNT(*) as transaction_count, MAX(it.date) as last_date, i.unit
+        FROM inventory_transactions it
+        JOIN inventory i ON it.inventory_id = i.id
+        WHERE it.date >= date('now', ?)
+        GROUP BY it.inventory_id, it.transaction_type
+        ORDER BY CASE it.transaction_type WHEN 'waste' THEN 0 ELSE 1 END,
+                 total_quantity DESC
+    ''', (f'-{days} days',))
+    transaction_lines = [
+        f"- {name}: {transaction_type} {round(total, 2)} {unit or ''} "
+        f"across {count} transaction(s), last on {last_date}"
+        for name, transaction_type, total, count, last_date, unit in cursor.fetchall()
+    ]
+
+    inventory_budget = int(token_budget * INVENTORY_BUDGET_SHARE)
+    inventory_kept, inventory_used = _take_within_budget(inventory_lines, inventory_budget, 'items')
+    # Give any budget the inventory block didn't need to the transactions block
+    transaction_kept, _ = _take_within_budget(transaction_lines, token_budget - inventory_used, 'item activities')
+
+    inventory_context = "\n".join(["Current Inventory:"] + inventory_kept)
+    transaction_context = "\n".join([f"Recent Transactions (last {days} days):"] + transaction_kept)
+
+    result = (inventory_context, transaction_context)
+    _context_cache[cache_key] = (stamp, result)
+    return result
@@ -0,0 +1,216 @@
+"""
+Fuzzy item-name resolution for chat-driven actions
+Keeps an in-memory index of normalized item names, their character trigrams
+and user-defined aliases, caught up from the change feed on each lookup, so
+"chicken breasts" or "chx breast" resolve to "Chicken Breast" without a scan
+"""
+
+import math
+import re
+import threading
+import unicodedata
+
+from change_feed import current_sequence
+
+# Lowest trigram similarity (Dice coefficient) accepted as a match
+MIN_SCORE = 0.6
+# A fuzzy match this close to the runner-up is ambiguous and not resolved
+AMBIGUITY_MARGIN = 0.05
+# Lowest similarity listed as a candidate when a name does not resolve
+CANDIDATE_MIN_SCORE = 0.3
+# Kitchen shorthand expanded before matching; anything else belongs in item_aliases
+ABBREVIATIONS = {
+    'chx': 'chicken', 'chkn': 'chicken', 'bf': 'beef', 'grnd': 'ground', 'brst': 'breast',
+    'tom': 'tomato', 'pot': 'potato', 'oz': 'ounce', 'lb': 'pound', 'lbs': 'pound',
+    'evoo': 'extra virgin olive oil', 'veg': 'vegetable', 'frz': 'frozen', 'fz': 'frozen'
+}
+
+
+def _singular(token):
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith('ies'):
+        return token[:-3] + 'y'
+    if token.endswith(('oes', 'ses', 'xes', 'ches', 'shes')):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us')):
+        return token[:-1]
+    return token
+
+
+def normalize_name(name):
+    """Lower-case, accent- and punctuation-free, singular form of a name"""
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii').lower()
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', text):
+        tokens.extend(ABBREVIATIONS.get(token, token).split())
+    return ' '.join(_singular(token) for token in tokens)
+
+
+def trigrams(key):
+    padded = f' {key} '
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+class ItemNameIndex:
+    """Normalized names, trigram postings and aliases of every inventory item
+
+    Lookups first catch up on inventory rows changed since the last change
+    feed sequence seen, so the index follows writes from any process without
+    being rebuilt.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.item_keys = {}
+        self.item_trigrams = {}
+        self.exact = {}
+        self.postings = {}
+        self.aliases = {}
+        self.seq = None
+        self.alias_version = None
+        self._lock = threading.RLock()
+
+    def _add(self, item_id, name):
+        key = normalize_name(name)
+        self.names[item_id] = name
+        self.item_keys[item_id] = key
+        self.exact.setdefault(key, set()).add(item_id)
+        grams = trigrams(key)
+        self.item_trigrams[item_id] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(item_id)
+
+    def _remove(self, item_id):
+        if item_id not in self.names:
+            return
+        key = self.item_keys.pop(item_id)
+        del self.names[item_id]
+        self.exact[key].discard(item_id)
+        if not self.exact[key]:
+            del self.exact[key]
+        for gram in self.item_trigrams.pop(item_id):
+            self.postings[gram].discard(item_id)
+            if not self.postings[gram]:
+                del self.postings[gram]
+
+    def load(self, cursor):
+        """Rebuild from the inventory table"""
+        with self._lock:
+            self.names = {}
+            self.item_keys = {}
+            self.item_trigrams = {}
+            self.exact = {}
+            self.postings = {}
+            self.seq = current_sequence(cursor)
+            cursor.execute('SELECT id, name FROM inventory')
+            for item_id, name in cursor.fetchall():
+                self._add(item_id, name)
+
+    def _load_aliases(self, cursor, version):
+        cursor.execute('SELECT alias, inventory_id FROM item_aliases')
+        self.aliases = {normalize_name(alias): item_id for alias, item_id in cursor.fetchall()}
+        self.alias_version = version
+
+    def sync(self, cursor):
+        """Apply inventory changes made since the last sync"""
+        with self._lock:
+            cursor.execute("SELECT version FROM table_versions WHERE table_name = 'item_aliases'")
+            row = cursor.fetchone()
+            alias_version = row[0] if row else 0
+            if alias_version != self.alias_version:
+                self._load_aliases(cursor, alias_version)
+
+            if self.seq is None:
+                self.load(cursor)
+                return
+            seq = current_sequence(cursor)
+            if seq == self.seq:
+                return
+            cursor.execute("SELECT value FROM sync_state WHERE name = 'change_log_pruned_through'")
+            row = cursor.fetchone()
+            if row and row[0] > self.seq:
+                self.load(cursor)
+                return
+
+            cursor.execute('''
+                SELECT row_id, operation FROM change_log
+                WHERE seq > ? AND seq <= ? AND table_name = 'inventory'
+            ''', (self.seq, seq))
+            changes = cursor.fetchall()
+            for item_id, _ in changes:
+                self._remove(item_id)
+            upserts = [item_id for item_id, operation in changes if operation == 'upsert']
+            for offset in range(0, len(upserts), 900):
+                batch = upserts[offset:offset + 900]
+                cursor.execute(f"SELECT id, name FROM inventory WHERE id IN ({', '.join('?' * len(batch))})", batch)
+                for item_id, name in cursor.fetchall():
+                    self._add(item_id, name)
+            self.seq = seq
+
+    def _exact_match(self, key):
+        if key in self.aliases and self.aliases[key] in self.names:
+            return {'id': self.aliases[key], 'match': 'alias'}
+        if key in self.exact:
+            return {'id': min(self.exact[key]), 'match': 'exact'}
+        return None
+
+    def _scored(self, key, limit, min_score):
+        """Items scoring at least min_score as [(score, item_id)], best first
+
+        An item with Dice coefficient >= t shares at least t * n / (2 - t) of
+        the query's n trigrams, so it must hold one of the rarest trigrams
+        left after dropping that many minus one; only their postings are read.
+        """
+        grams = trigrams(key)
+        needed = max(1, math.ceil(min_score * len(grams) / (2 - min_score)))
+        rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:len(grams) - needed + 1]:
+            candidates.update(self.postings.get(gram, ()))
+
+        scored = []
+        for item_id in candidates:
+            item_grams = self.item_trigrams[item_id]
+            score = 2 * len(grams & item_grams) / (len(grams) + len(item_grams))
+            if score >= min_score:
+                scored.append((score, item_id))
+        scored.sort(key=lambda entry: (-entry[0], entry[1]))
+        return scored[:limit]
+
+    def candidates(self, cursor, name, limit=5):
+        """Closest items to a name as [{'id', 'name', 'score'}], best first"""
+        with self._lock:
+            self.sync(cursor)
+            return [{'id': item_id, 'name': self.names[item_id], 'score': round(score, 3)}
+                    for score, item_id in self._scored(normalize_name(name), limit, CANDIDATE_MIN_SCORE)]
+
+    def resolve(self, cursor, name, exact_only=False):
+        """The item a name refers to as {'id', 'name', 'match', 'score'}, or None
+
+        Exact and alias matches compare normalized names; otherwise the best
+        trigram match is taken if it scores at least MIN_SCORE and clearly
+        beats the runner-up. exact_only skips the fuzzy step.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        with self._lock:
+            self.sync(cursor)
+            match = self._exact_match(key)
+            if match:
+                match.update(name=self.names[match['id']], score=1.0)
+                return match
+            if exact_only:
+                return None
+            # The runner-up only matters if it is within the margin, so search down to there
+            scored = self._scored(key, 2, MIN_SCORE - AMBIGUITY_MARGIN)
+            if not scored or scored[0][0] < MIN_SCORE:
+                return None
+            if len(scored) > 1 and scored[0][0] - scored[1][0] < AMBIGUITY_MARGIN:
+                return None
+            score, item_id = scored[0]
+            return {'id': item_id, 'name': self.names[item_id], 'match': 'fuzzy', 'score': round(score, 3)}
+
+
+item_resolver = ItemNameIndex()
@@ -0,0 +1,320 @@
+"""
+Background job queue for slow AI analyses
+Jobs are persisted in SQLite and run by worker threads in separate priority
+lanes, so interactive work never waits behind bulk runs. A claimed job is
+leased to its worker, which heartbeats while it runs; only jobs whose
+heartbeat has gone stale are requeued, so a job is never run twice while its
+worker is alive.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import urllib.request
+import uuid
+from urllib.parse import urlparse
+
+DB_PATH = 'demand_history.db'
+
+# Worker threads per lane. Interactive requests get their own workers so a
+# burst of bulk recommendation runs can't delay them.
+LANES = {
+    'interactive': int(os.getenv('JOB_INTERACTIVE_WORKERS', '2')),
+    'bulk': int(os.getenv('JOB_BULK_WORKERS', '1'))
+}
+POLL_INTERVAL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 10
+# A running job whose worker has not heartbeated for this long is requeued
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '60'))
+CALLBACK_TIMEOUT_SECONDS = 5
+LOCAL_CALLBACK_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+# kind -> (handler, lane)
+_handlers = {}
+# kind -> (interval_seconds, payload) for jobs enqueued on a timer
+_schedules = {}
+_lane_events = {lane: threading.Event() for lane in LANES}
+_workers_started = False
+_workers_lock = threading.Lock()
+# Identifies this process's workers in jobs.worker_id
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Ids of the jobs this process is running, kept alive by the heartbeat thread
+_running = set()
+_running_lock = threading.Lock()
+
+
+def register_job(kind, lane='bulk'):
+    """Register a handler for a job kind
+
+    Handlers take the job payload and return (result_dict, http_status).
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown job lane: {lane}")
+
+    def decorator(handler):
+        _handlers[kind] = (handler, lane)
+        return handler
+    return decorator
+
+
+def schedule_job(kind, interval_seconds, payload=None):
+    """Enqueue a job every interval_seconds once the workers are started
+
+    A run is skipped while another job of the same kind is still queued or
+    running, so slow runs never pile up.
+    """
+    _schedules[kind] = (interval_seconds, payload or {})
+
+
+def is_local_callback(callback_url):
+    """Only allow callbacks to services on this machine"""
+    parsed = urlparse(callback_url)
+    return parsed.scheme in ('http', 'https') and parsed.hostname in LOCAL_CALLBACK_HOSTS
+
+
+def enqueue(kind, payload, callback_url=None, priority=0):
+    """Persist a job and wake a worker in its lane, returning the job id"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if callback_url and not is_local_callback(callback_url):
+        raise ValueError("callback_url must point to localhost")
+
+    lane = _handlers[kind][1]
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (kind, lane, priority, status, payload, callback_url)
+        VALUES (?, ?, ?, 'queued', ?, ?)
+    ''', (kind, lane, priority, json.dumps(payload), callback_url))
+    job_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+
+    _lane_events[lane].set()
+    return job_id
+
+
+def get_job(job_id):
+    """Get a job's status and, once finished, its result"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, kind, lane, status, result, result_status, error,
+               created_at, started_at, finished_at
+        FROM jobs WHERE id = ?
+    ''', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "kind": row[1],
+        "lane": row[2],
+        "status": row[3],
+        "result": json.loads(row[4]) if row[4] else None,
+        "result_status": row[5],
+        "error": row[6],
+        "created_at": row[7],
+        "started_at": row[8],
+        "finished_at": row[9]
+    }
+
+
+def _claim_next(lane, worker_id):
+    """Atomically lease the highest-priority queued job in a lane to a worker"""
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT id, kind, payload, callback_url FROM jobs
+            WHERE status = 'queued' AND lane = ?
+            ORDER BY priority DESC, id ASC
+            LIMIT 1
+        ''', (lane,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('''
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP,
+                    worker_id = ?, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (worker_id, row[0]))
+            with _running_lock:
+                _running.add(row[0])
+        conn.commit()
+        return row
+    finally:
+        conn.close()
+
+
+def _finish(job_id, worker_id, status, result=None, result_status=None, error=None):
+    """Record a job's outcome, unless its lease expired and it was handed to another worker"""
+    with _running_lock:
+        _running.discard(job_id)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET status = ?, result = ?, result_status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running' AND worker_id = ?
+    ''', (status, json.dumps(result) if result is not None else None, result_status, error, job_id, worker_id))
+    if not cursor.rowcount:
+        print(f"Job {job_id} lost its lease; its result was discarded")
+    conn.commit()
+    conn.close()
+
+
+def _send_callback(callback_url, job):
+    try:
+        request = urllib.request.Request(
+            callback_url,
+            data=json.dumps(job).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        urllib.request.urlopen(request, timeout=CALLBACK_TIMEOUT_SECONDS).close()
+    except Exception as e:
+        print(f"Job {job['id']} callback to {callback_url} failed: {e}")
+
+
+def _run_job(worker_id, job_id, kind, payload, callback_url):
+    handler = _handlers.get(kind, (None, None))[0]
+    if handler is None:
+        _finish(job_id, worker_id, 'failed', error=f"No handler registered for job kind: {kind}")
+    else:
+        try:
+            result, result_status = handler(json.loads(payload))
+            status = 'succeeded' if result_status < 400 else 'failed'
+            _finish(job_id, worker_id, status, result=result, result_status=result_status,
+                    error=result.get('error') if status == 'failed' else None)
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {e}\n{traceback.format_exc()}")
+            _finish(job_id, worker_id, 'failed', result_status=500, error=str(e))
+
+    if callback_url:
+        _send_callback(callback_url, get_job(job_id))
+
+
+def _worker_loop(lane, worker_id):
+    event = _lane_events[lane]
+    while True:
+        try:
+            job = _claim_next(lane, worker_id)
+        except sqlite3.Error as e:
+            print(f"Job worker ({lane}) could not claim a job: {e}")
+            job = None
+
+        if job:
+            _run_job(worker_id, *job)
+            continue
+
+        # Sleep until a job is enqueued in this process or the poll interval
+        # passes (jobs may also be enqueued by another process)
+        event.wait(POLL_INTERVAL_SECONDS)
+        event.clear()
+
+
+def requeue_stale_jobs(cursor, lease_seconds=LEASE_SECONDS):
+    """Requeue running jobs whose worker stopped heartbeating, returning how many"""
+    cursor.execute('''
+        UPDATE jobs SET status = 'queued', worker_id = NULL, heartbeat_at = NULL
+        WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))
+    ''', (f'-{lease_seconds} seconds',))
+    return cursor.rowcount
+
+
+def _heartbeat_loop():
+    """Renew the lease on this process's running jobs and reclaim abandoned ones"""
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _running_lock:
+            job_ids = list(_running)
+        try:
+            conn = sqlite3.connect(DB_PATH, timeout=30)
+            try:
+                cursor = conn.cursor()
+                if job_ids:
+                    cursor.execute(f'''
+                        UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                        WHERE status = 'running' AND id IN ({', '.join('?' * len(job_ids))})
+                    ''', job_ids)
+                requeued = requeue_stale_jobs(cursor)
+                conn.commit()
+            finally:
+                conn.close()
+            if requeued:
+                print(f"Requeued {requeued} job(s) whose worker stopped")
+        except sqlite3.Error as e:
+            print(f"Job heartbeat failed: {e}")
+
+
+def _has_pending(kind):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND status IN ('queued', 'running'))", (kind,))
+        return bool(cursor.fetchone()[0])
+    finally:
+        conn.close()
+
+
+def _scheduler_loop(kind, interval_seconds, payload):
+    while True:
+        try:
+            if not _has_pending(kind):
+                enqueue(kind, payload)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Scheduled job {kind} could not be enqueued: {e}")
+        time.sleep(interval_seconds)
+
+
+def start_workers():
+    """Start worker threads for every lane and scheduled job, requeueing jobs whose lease expired
+
+    Safe to call on every request; only the first call starts anything.
+    """
+    global _workers_started
+    if _workers_started:
+        return
+    with _workers_lock:
+        if _workers_started:
+            return
+        _workers_started = True
+
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    requeued = requeue_stale_jobs(conn.cursor())
+    if requeued:
+        print(f"Requeued {requeued} interrupted job(s)")
+    conn.commit()
+    conn.close()
+
+    for lane, worker_count in LANES.items():
+        for index in range(worker_count):
+            thread = threading.Thread(
+                target=_worker_loop, args=(lane, f"{PROCESS_ID}/{lane}-{index}"),
+                name=f"job-worker-{lane}-{index}", daemon=True
+            )
+            thread.start()
+    threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    for kind, (interval_seconds, payload) in _schedules.items():
+        threading.Thread(
+            target=_scheduler_loop, args=(kind, interval_seconds, payload), name=f"job-scheduler-{kind}", daemon=True
+        ).start()
+
+
+def wait_for_job(job_id, timeout):
+    """Poll until a job finishes or the timeout passes, returning the job"""
+    deadline = time.monotonic() + timeout
+    job = get_job(job_id)
+    while job and job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.25)
+        job = get_job(job_id)
+    return job
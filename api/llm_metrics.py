@@ -0,0 +1,237 @@
+"""
+LLM usage accounting and budget guards
+Records tokens, latency, retries and parse failures for every OpenAI call and
+enforces daily token caps per endpoint
+"""
+
+import os
+import sqlite3
+import time
+
+DB_PATH = 'demand_history.db'
+
+# USD per 1K tokens as (prompt, completion)
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01)
+}
+
+# 0 means no cap
+DAILY_TOKEN_CAP = int(os.getenv('LLM_DAILY_TOKEN_CAP', '0'))
+# 'degrade' answers from cached or deterministic data, 'fail' returns an error
+BUDGET_MODE = os.getenv('LLM_BUDGET_MODE', 'degrade')
+
+
+def _parse_endpoint_caps(value):
+    """Parse caps like 'chat=50000,ai_recommendations=100000'"""
+    caps = {}
+    for entry in (value or '').split(','):
+        if '=' in entry:
+            endpoint, cap = entry.split('=', 1)
+            caps[endpoint.strip()] = int(cap)
+    return caps
+
+
+ENDPOINT_TOKEN_CAPS = _parse_endpoint_caps(os.getenv('LLM_ENDPOINT_TOKEN_CAPS', ''))
+
+
+class BudgetExceeded(Exception):
+    """Raised before an OpenAI call when a daily token cap has been reached"""
+
+    def __init__(self, endpoint, used, cap):
+        self.endpoint = endpoint
+        self.used = used
+        self.cap = cap
+        super().__init__(f"Daily AI token budget reached for {endpoint} ({used}/{cap} tokens)")
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES['gpt-3.5-turbo'])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def usage_of(response):
+    """(prompt_tokens, completion_tokens) of an OpenAI response"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return 0, 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+def tokens_used_today(cursor, endpoint=None):
+    """Tokens used since midnight UTC, overall or for one endpoint"""
+    if endpoint:
+        cursor.execute('''
+            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM llm_metrics
+            WHERE endpoint = ? AND created_at >= date('now')
+        ''', (endpoint,))
+    else:
+        cursor.execute('''
+            SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM llm_metrics
+            WHERE created_at >= date('now')
+        ''')
+    return cursor.fetchone()[0]
+
+
+def check_budget(endpoint):
+    """Raise BudgetExceeded if the endpoint or the whole service is over its cap"""
+    endpoint_cap = ENDPOINT_TOKEN_CAPS.get(endpoint, 0)
+    if not DAILY_TOKEN_CAP and not endpoint_cap:
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        if endpoint_cap:
+            used = tokens_used_today(cursor, endpoint)
+            if used >= endpoint_cap:
+                raise BudgetExceeded(endpoint, used, endpoint_cap)
+        if DAILY_TOKEN_CAP:
+            used = tokens_used_today(cursor)
+            if used >= DAILY_TOKEN_CAP:
+                raise BudgetExceeded('all endpoints', used, DAILY_TOKEN_CAP)
+    finally:
+        conn.close()
+
+
+def record_call(endpoint, template, model, prompt_tokens, completion_tokens, latency_ms,
+                retries=0, parse_failures=0, success=True, error=None):
+    """Store one logical LLM call (including any retries) in the metrics table"""
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute('''
+            INSERT INTO llm_metrics
+            (endpoint, template, model, prompt_tokens, completion_tokens, latency_ms,
+             retries, parse_failures, success, error, estimated_cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            endpoint, template, model, prompt_tokens, completion_tokens, round(latency_ms, 1),
+            retries, parse_failures, success, error,
+            estimate_cost(model, prompt_tokens, completion_tokens)
+        ))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        # Accounting must never break the request it is measuring
+        print(f"Could not record LLM metrics for {endpoint}: {e}")
+
+
+class CallTracker:
+    """Accumulates usage across the upstream requests of one logical call"""
+
+    def __init__(self, endpoint, template, model):
+        self.endpoint = endpoint
+        self.template = template
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms = 0.0
+        self.requests = 0
+        self.parse_failures = 0
+
+    def create(self, client, **kwargs):
+        """Make one upstream request and add its usage and latency"""
+        started = time.perf_counter()
+        try:
+            response = client.chat.completions.create(**kwargs)
+        finally:
+            self.latency_ms += (time.perf_counter() - started) * 1000
+            self.requests += 1
+        prompt_tokens, completion_tokens = usage_of(response)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return response
+
+    def finish(self, success=True, error=None):
+        record_call(
+            self.endpoint, self.template, self.model,
+            self.prompt_tokens, self.completion_tokens, self.latency_ms,
+            retries=max(self.requests - 1, 0), parse_failures=self.parse_failures,
+            success=success, error=error
+        )
+
+
+def tracked_completion(client, endpoint, template, **kwargs):
+    """Create a chat completion with budget checks and usage accounting"""
+    check_budget(endpoint)
+    tracker = CallTracker(endpoint, template, kwargs.get('model'))
+    try:
+        response = tracker.create(client, **kwargs)
+    except Exception as e:
+        tracker.finish(success=False, error=str(e))
+        raise
+    tracker.finish()
+    return response
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get_metrics_summary(cursor, days=7):
+    """Latency percentiles, token totals and spend per endpoint/template and per day"""
+    window = f'-{int(days)} days'
+    cursor.execute('''
+        SELECT endpoint, template, latency_ms FROM llm_metrics
+        WHERE created_at >= date('now', ?)
+        ORDER BY endpoint, template, latency_ms
+    ''', (window,))
+    latencies = {}
+    for endpoint, template, latency_ms in cursor.fetchall():
+        latencies.setdefault((endpoint, template), []).append(latency_ms)
+
+    cursor.execute('''
+        SELECT endpoint, template, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),
+               SUM(retries), SUM(parse_failures), SUM(CASE WHEN success THEN 0 ELSE 1 END),
+               SUM(estimated_cost)
+        FROM llm_metrics
+        WHERE created_at >= date('now', ?)
+        GROUP BY endpoint, template
+        ORDER BY endpoint, template
+    ''', (window,))
+    endpoints = []
+    for row in cursor.fetchall():
+        values = latencies.get((row[0], row[1]), [])
+        endpoints.append({
+            'endpoint': row[0],
+            'template': row[1],
+            'calls': row[2],
+            'prompt_tokens': row[3],
+            'completion_tokens': row[4],
+            'retries': row[5],
+            'parse_failures': row[6],
+            'errors': row[7],
+            'estimated_cost': round(row[8] or 0, 4),
+            'latency_p50_ms': _percentile(values, 50),
+            'latency_p95_ms': _percentile(values, 95)
+        })
+
+    cursor.execute('''
+        SELECT date(created_at) as day, COUNT(*), SUM(prompt_tokens + completion_tokens),
+               SUM(estimated_cost)
+        FROM llm_metrics
+        WHERE created_at >= date('now', ?)
+        GROUP BY day
+        ORDER BY day ASC
+    ''', (window,))
+    daily = [
+        {'day': row[0], 'calls': row[1], 'tokens': row[2], 'estimated_cost': round(row[3] or 0, 4)}
+        for row in cursor.fetchall()
+    ]
+
+    return {
+        'days': days,
+        'endpoints': endpoints,
+        'daily': daily,
+        'budget': {
+            'mode': BUDGET_MODE,
+            'daily_token_cap': DAILY_TOKEN_CAP or None,
+            'endpoint_token_caps': ENDPOINT_TOKEN_CAPS,
+            'tokens_used_today': tokens_used_today(cursor)
+        }
+    }
@@ -0,0 +1,234 @@
+"""
+Structured-output parsing for OpenAI responses
+Extracts JSON objects from model output, validates them against per-endpoint
+schemas and makes one repair attempt when the output is unusable
+"""
+
+import json
+
+import openai
+
+from llm_metrics import CallTracker, check_budget
+
+# Minimal JSON-schema subset: type, required, properties, items, enum
+INGREDIENTS_SCHEMA = {
+    "type": "object",
+    "required": ["ingredients"],
+    "properties": {
+        "ingredients": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["name", "quantity", "unit"],
+                "properties": {
+                    "name": {"type": "string"},
+                    "quantity": {"type": "number"},
+                    "unit": {"type": "string"},
+                    "storage": {"type": "string"},
+                    "notes": {"type": "string"}
+                }
+            }
+        }
+    }
+}
+
+ACTION_SCHEMA = {
+    "type": "object",
+    "required": ["type", "data"],
+    "properties": {
+        "type": {"type": "string", "enum": ["add_item", "update_quantity", "record_transaction", "delete_item"]},
+        "data": {"type": "object", "required": ["name"]}
+    }
+}
+
+ACTIONS_SCHEMA = {
+    "type": "object",
+    "required": ["response"],
+    "properties": {
+        "response": {"type": "string"},
+        "actions": {"type": "array", "items": ACTION_SCHEMA},
+        "missing_info": {"type": "array", "items": {"type": "string"}},
+        "questions": {"type": "array", "items": {"type": "string"}},
+        "pending_action": ACTION_SCHEMA
+    }
+}
+
+RECOMMENDATIONS_SCHEMA = {
+    "type": "object",
+    "required": ["recommendations", "donation_opportunities", "alerts"],
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {"type": "object", "required": ["title", "description"]}
+        },
+        "donation_opportunities": {
+            "type": "array",
+            "items": {"type": "object", "required": ["item"]}
+        },
+        "alerts": {
+            "type": "array",
+            "items": {"type": "object", "required": ["item", "message"]}
+        }
+    }
+}
+
+SCHEMAS = {
+    "ingredients": INGREDIENTS_SCHEMA,
+    "actions": ACTIONS_SCHEMA,
+    "recommendations": RECOMMENDATIONS_SCHEMA
+}
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool)
+}
+
+# Models that rejected response_format, so we don't keep paying for the failed call
+_json_mode_unsupported = set()
+
+
+def extract_json_object(text):
+    """Find the first complete, decodable JSON object in text
+
+    Scans once with a brace counter that understands strings and escapes, so
+    prose or extra braces around the object don't break extraction.
+    """
+    if not text:
+        return None
+
+    start = text.find('{')
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        value = json.loads(text[start:index + 1])
+                    except json.JSONDecodeError:
+                        break
+                    if isinstance(value, dict):
+                        return value
+                    break
+        start = text.find('{', start + 1)
+    return None
+
+
+def validate(data, schema, path="$"):
+    """Validate data against a schema, returning a list of error messages"""
+    expected_type = schema.get("type")
+    if expected_type and not _TYPE_CHECKS[expected_type](data):
+        return [f"{path} should be of type {expected_type}"]
+
+    errors = []
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path} should be one of {schema['enum']}")
+
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key} is required")
+        for key, child_schema in schema.get("properties", {}).items():
+            if key in data and data[key] is not None:
+                errors.extend(validate(data[key], child_schema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for index, item in enumerate(data):
+            errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def parse_response(text, schema_name):
+    """Extract and validate a JSON object from model output
+
+    Returns (data, errors); data is None when nothing usable was found.
+    """
+    data = extract_json_object(text)
+    if data is None:
+        return None, ["No JSON object found in response"]
+    errors = validate(data, SCHEMAS[schema_name])
+    return (None if errors else data), errors
+
+
+def create_completion(tracker, client, json_mode=False, **kwargs):
+    """Create a chat completion, using JSON mode when the model supports it"""
+    model = kwargs.get("model")
+    if json_mode and model not in _json_mode_unsupported:
+        try:
+            return tracker.create(client, response_format={"type": "json_object"}, **kwargs)
+        except openai.BadRequestError as e:
+            if "response_format" not in str(e):
+                raise
+            print(f"JSON mode not supported for {model}, falling back to text parsing")
+            _json_mode_unsupported.add(model)
+    return tracker.create(client, **kwargs)
+
+
+def complete_json(client, schema_name, messages, json_mode=True, allow_plain_text=False,
+                  endpoint=None, template=None, **kwargs):
+    """Request a completion and parse it against an endpoint schema
+
+    Makes one repair attempt when the reply contains invalid JSON. With
+    allow_plain_text, a reply containing no JSON at all is accepted as prose.
+    Usage is recorded under endpoint/template and BudgetExceeded is raised
+    before any request once the endpoint's daily cap is reached.
+    Returns (data, raw_text, errors).
+    """
+    endpoint = endpoint or schema_name
+    check_budget(endpoint)
+    tracker = CallTracker(endpoint, template or schema_name, kwargs.get("model"))
+    try:
+        data, raw_text, errors = _complete_and_parse(
+            tracker, client, schema_name, messages, json_mode, allow_plain_text, **kwargs
+        )
+    except Exception as e:
+        tracker.finish(success=False, error=str(e))
+        raise
+    tracker.finish(success=data is not None or not errors, error="; ".join(errors[:3]) or None)
+    return data, raw_text, errors
+
+
+def _complete_and_parse(tracker, client, schema_name, messages, json_mode, allow_plain_text, **kwargs):
+    response = create_completion(tracker, client, json_mode=json_mode, messages=messages, **kwargs)
+    raw_text = response.choices[0].message.content or ""
+
+    data, errors = parse_response(raw_text, schema_name)
+    if data is not None:
+        return data, raw_text, []
+    if allow_plain_text and extract_json_object(raw_text) is None:
+        return None, raw_text, []
+
+    tracker.parse_failures += 1
+    print(f"Structured {schema_name} response invalid, attempting repair: {errors}")
+    repair_messages = list(messages) + [
+        {"role": "assistant", "content": raw_text},
+        {"role": "user", "content": (
+            "Your previous reply could not be used because of these problems: "
+            + "; ".join(errors[:10])
+            + ". Reply with ONLY the corrected JSON object and no other text."
+        )}
+    ]
+    response = create_completion(tracker, client, json_mode=json_mode, messages=repair_messages, **kwargs)
+    repaired_text = response.choices[0].message.content or ""
+
+    data, repair_errors = parse_response(repaired_text, schema_name)
+    if data is not None:
+        return data, repaired_text, []
+    tracker.parse_failures += 1
+    return None, raw_text, repair_errors
@@ -0,0 +1,199 @@
+"""
+Lot-level stock and expiry tracking
+Each purchase opens a lot with its own expiration date and usage, waste and
+donations consume the oldest lots first (FIFO), so the stock expiring in a
+date range is exact and found with a range scan on the expiry index
+"""
+
+from datetime import datetime, timedelta
+
+OUTFLOW_TYPES = ('usage', 'waste', 'donation')
+# Rows per IN (...) lookup, under SQLite's bound parameter limit
+LOOKUP_BATCH = 900
+_EPSILON = 1e-9
+
+
+def load_open_lots(cursor, item_ids):
+    """Item id -> open lots as [id, remaining, expiration_date], oldest first"""
+    item_ids = sorted(item_ids)
+    lots = {item_id: [] for item_id in item_ids}
+    for offset in range(0, len(item_ids), LOOKUP_BATCH):
+        batch = item_ids[offset:offset + LOOKUP_BATCH]
+        cursor.execute(f'''
+            SELECT id, inventory_id, quantity_remaining, expiration_date
+            FROM inventory_lots
+            WHERE inventory_id IN ({', '.join('?' * len(batch))}) AND quantity_remaining > 0
+            ORDER BY inventory_id, received_date, id
+        ''', batch)
+        for lot_id, item_id, remaining, expiration_date in cursor.fetchall():
+            lots[item_id].append([lot_id, remaining, expiration_date])
+    return lots
+
+
+def _item_expiries(cursor, item_ids):
+    """Item id -> its expiration_date, for the items that have one"""
+    item_ids = sorted(item_ids)
+    expiries = {}
+    for offset in range(0, len(item_ids), LOOKUP_BATCH):
+        batch = item_ids[offset:offset + LOOKUP_BATCH]
+        cursor.execute(f'''
+            SELECT id, expiration_date FROM inventory
+            WHERE id IN ({', '.join('?' * len(batch))}) AND expiration_date IS NOT NULL
+        ''', batch)
+        expiries.update(cursor.fetchall())
+    return expiries
+
+
+def apply_lot_movements(cursor, movements):
+    """Open and consume lots for a sequence of stock movements
+
+    movements are (inventory_id, transaction_type, quantity, day,
+    expiration_date, unit_cost, transaction_id) in the order they happened.
+    Purchases open a lot, expiring when the item does if no expiration_date
+    is given; outflows take from the oldest open lots first. An outflow
+    larger than the lots hold draws on untracked stock and is not recorded
+    against any lot. Each touched item's expiration_date is set to its
+    earliest open lot expiry.
+    """
+    movements = list(movements)
+    if not movements:
+        return
+    open_lots = load_open_lots(cursor, {movement[0] for movement in movements})
+    item_expiries = _item_expiries(cursor, {
+        movement[0] for movement in movements if movement[1] == 'purchase' and not movement[4]
+    })
+    new_lots = []
+    consumed = {}
+    for item_id, transaction_type, quantity, day, expiration_date, unit_cost, transaction_id in movements:
+        lots = open_lots[item_id]
+        if transaction_type == 'purchase':
+            expiration_date = expiration_date or item_expiries.get(item_id)
+            # New lots are [None, remaining, expiration_date, row to insert]
+            row = [item_id, quantity, quantity, str(day)[:10], expiration_date, unit_cost, transaction_id]
+            lots.append([None, quantity, expiration_date, row])
+            new_lots.append(row)
+        elif transaction_type in OUTFLOW_TYPES:
+            while quantity > _EPSILON and lots:
+                lot = lots[0]
+                taken = min(lot[1], quantity)
+                lot[1] -= taken
+                quantity -= taken
+                if lot[0] is None:
+                    lot[3][2] = lot[1]
+                else:
+                    consumed[lot[0]] = lot[1]
+                if lot[1] <= _EPSILON:
+                    lots.pop(0)
+
+    cursor.executemany('''
+        INSERT INTO inventory_lots
+        (inventory_id, quantity_received, quantity_remaining, received_date, expiration_date, unit_cost, transaction_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', new_lots)
+    cursor.executemany('UPDATE inventory_lots SET quantity_remaining = ? WHERE id = ?',
+                       [(max(remaining, 0), lot_id) for lot_id, remaining in consumed.items()])
+
+    earliest = {}
+    for item_id, lots in open_lots.items():
+        expiries = [lot[2] for lot in lots if lot[2]]
+        if expiries:
+            earliest[item_id] = min(expiries)
+    cursor.executemany('''
+        UPDATE inventory SET expiration_date = :expiration_date
+        WHERE id = :id AND expiration_date IS NOT :expiration_date
+    ''', [{'id': item_id, 'expiration_date': expiration_date} for item_id, expiration_date in earliest.items()])
+
+
+def reconcile_lots(cursor, item_id, quantity, expiration_date=None, day=None):
+    """Bring an item's lots in line with a quantity set directly
+
+    Extra stock opens a lot expiring on expiration_date; missing stock is
+    consumed FIFO. A changed expiration_date is applied to every open lot.
+    """
+    cursor.execute('''
+        SELECT COALESCE(SUM(quantity_remaining), 0) FROM inventory_lots
+        WHERE inventory_id = ? AND quantity_remaining > 0
+    ''', (item_id,))
+    tracked = cursor.fetchone()[0]
+    if expiration_date:
+        cursor.execute('''
+            UPDATE inventory_lots SET expiration_date = ?
+            WHERE inventory_id = ? AND quantity_remaining > 0 AND expiration_date IS NOT ?
+        ''', (expiration_date, item_id, expiration_date))
+    quantity = quantity or 0
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    if quantity > tracked + _EPSILON:
+        apply_lot_movements(cursor, [(item_id, 'purchase', quantity - tracked, day, expiration_date, None, None)])
+    elif quantity < tracked - _EPSILON:
+        apply_lot_movements(cursor, [(item_id, 'usage', tracked - quantity, day, None, None, None)])
+
+
+def seed_lots(cursor):
+    """Open one lot per stocked item from its current quantity and expiry, returning how many"""
+    cursor.execute('''
+        INSERT INTO inventory_lots
+        (inventory_id, quantity_received, quantity_remaining, received_date, expiration_date, unit_cost)
+        SELECT id, current_quantity, current_quantity,
+               COALESCE(date(updated_at), date(created_at), date('now')), expiration_date, cost_per_unit
+        FROM inventory
+        WHERE current_quantity > 0
+    ''')
+    return cursor.rowcount
+
+
+def _days_left(expiration_date, today):
+    try:
+        return (datetime.strptime(expiration_date[:10], '%Y-%m-%d').date() - today).days
+    except ValueError:
+        return None
+
+
+def expiring_lots(cursor, days=7, include_expired=False, today=None):
+    """Open lots expiring within `days` days, soonest first"""
+    if not 0 <= days <= 365:
+        raise ValueError("days must be between 0 and 365")
+    today = today or datetime.now().date()
+    # The expiry range plus quantity_remaining > 0 is what the partial index covers
+    cursor.execute('''
+        SELECT l.id, l.inventory_id, i.name, i.unit, i.category, l.quantity_remaining,
+               l.received_date, l.expiration_date
+        FROM inventory_lots l
+        JOIN inventory i ON l.inventory_id = i.id
+        WHERE l.quantity_remaining > 0 AND l.expiration_date >= ? AND l.expiration_date <= ?
+        ORDER BY l.expiration_date, l.id
+    ''', ('' if include_expired else today.isoformat(), (today + timedelta(days=days)).isoformat()))
+    return [
+        {
+            'lot_id': lot_id,
+            'inventory_id': item_id,
+            'name': name,
+            'unit': unit,
+            'category': category,
+            'quantity': remaining,
+            'received_date': received_date,
+            'expiration_date': expiration_date,
+            'days_left': _days_left(expiration_date, today)
+        }
+        for lot_id, item_id, name, unit, category, remaining, received_date, expiration_date in cursor.fetchall()
+    ]
+
+
+def expiring_quantities(cursor, days=5, today=None):
+    """Item id -> (quantity expiring within `days` days, earliest expiry), expired stock excluded"""
+    expiring = {}
+    for lot in expiring_lots(cursor, days, today=today):
+        quantity, earliest = expiring.get(lot['inventory_id'], (0, lot['expiration_date']))
+        expiring[lot['inventory_id']] = (quantity + lot['quantity'], earliest)
+    return expiring
+
+
+def item_lots(cursor, item_id):
+    """Open lots of one item, oldest first"""
+    cursor.execute('''
+        SELECT id, quantity_received, quantity_remaining, received_date, expiration_date, unit_cost
+        FROM inventory_lots
+        WHERE inventory_id = ? AND quantity_remaining > 0
+        ORDER BY received_date, id
+    ''', (item_id,))
+    columns = ['lot_id', 'quantity_received', 'quantity_remaining', 'received_date', 'expiration_date', 'unit_cost']
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,157 @@
+"""
+Keyset pagination for the inventory, transaction and demand history lists
+Pages continue from the last row's sort key instead of an OFFSET, so every
+page costs the same however deep it is, and fields= trims the columns sent
+"""
+
+import base64
+import json
+from datetime import timedelta
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# name -> table, source, extra computed columns, table columns left out, sort key
+# as (column, expression) pairs, sort direction, filters as parameter ->
+# expression, and the date expression
+LISTS = {
+    'inventory': {
+        'table': 'inventory',
+        'alias': None,
+        'source': 'inventory',
+        'extra_columns': {},
+        'hidden_columns': (),
+        'order': (('name', 'name'), ('id', 'id')),
+        'descending': False,
+        'filters': {'category': 'category', 'supplier': 'supplier'},
+        'date': None
+    },
+    'transactions': {
+        'table': 'inventory_transactions',
+        'alias': 't',
+        'source': 'inventory_transactions t JOIN inventory i ON t.inventory_id = i.id',
+        'extra_columns': {
+            'inventory_name': 'i.name',
+            'unit': 'i.unit',
+            'category': 'i.category',
+            'cost_per_unit': 'i.cost_per_unit',
+            'total_value': 't.quantity * COALESCE(t.unit_cost, i.cost_per_unit, 0)'
+        },
+        'hidden_columns': (),
+        'order': (('date', 't.date'), ('id', 't.id')),
+        'descending': True,
+        'filters': {'types': 't.transaction_type', 'category': 'i.category'},
+        'date': 't.date'
+    },
+    'demand-history': {
+        'table': 'demand_calculations',
+        'alias': 'd',
+        'source': 'demand_calculations d',
+        'extra_columns': {
+            'has_analysis': 'EXISTS (SELECT 1 FROM demand_analyses a WHERE a.calculation_id = d.id)'
+        },
+        # Superseded by demand_analyses and always NULL
+        'hidden_columns': ('ingredient_analysis',),
+        'order': (('created_at', 'd.created_at'), ('id', 'd.id')),
+        'descending': True,
+        'filters': {'dish': 'd.dish_name', 'category': 'd.category'},
+        'date': 'd.created_at'
+    }
+}
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor_value, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def list_columns(cursor, name):
+    """Column name -> select expression for a list"""
+    spec = LISTS[name]
+    cursor.execute(f"PRAGMA table_info({spec['table']})")
+    prefix = f"{spec['alias']}." if spec['alias'] else ''
+    columns = {row[1]: f'{prefix}{row[1]}' for row in cursor.fetchall() if row[1] not in spec['hidden_columns']}
+    columns.update(spec['extra_columns'])
+    return columns
+
+
+def fetch_page(cursor, name, limit=DEFAULT_PAGE_SIZE, after=None, fields=None, filters=None,
+               start=None, end=None):
+    """One page of a list as (rows, next_cursor)
+
+    filters maps filter names to lists of accepted values; start and end are
+    inclusive dates. next_cursor is None on the last page.
+    """
+    spec = LISTS[name]
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    columns = list_columns(cursor, name)
+    if fields:
+        unknown = [field for field in fields if field not in columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = list(columns)
+    # The sort key is always selected so the next cursor can be built
+    key_columns = [column for column, _ in spec['order']]
+    selected = list(dict.fromkeys(list(fields) + key_columns))
+
+    conditions = []
+    params = {}
+    for filter_name, values in (filters or {}).items():
+        if filter_name not in spec['filters']:
+            raise ValueError(f"Unknown filter: {filter_name}")
+        if not values:
+            continue
+        placeholders = []
+        for index, value in enumerate(values):
+            params[f'{filter_name}{index}'] = value
+            placeholders.append(f':{filter_name}{index}')
+        conditions.append(f"{spec['filters'][filter_name]} IN ({', '.join(placeholders)})")
+    if start or end:
+        if not spec['date']:
+            raise ValueError("This list has no date range filter")
+        if start:
+            conditions.append(f"{spec['date']} >= :start")
+            params['start'] = start.isoformat()
+        if end:
+            conditions.append(f"{spec['date']} < :end")
+            params['end'] = (end + timedelta(days=1)).isoformat()
+
+    key_expressions = ', '.join(expression for _, expression in spec['order'])
+    if after:
+        key_values = decode_cursor(after, len(spec['order']))
+        key_params = []
+        for index, value in enumerate(key_values):
+            params[f'after{index}'] = value
+            key_params.append(f':after{index}')
+        conditions.append(f"({key_expressions}) {'<' if spec['descending'] else '>'} ({', '.join(key_params)})")
+
+    direction = 'DESC' if spec['descending'] else 'ASC'
+    params['limit'] = limit + 1
+    cursor.execute(f'''
+        SELECT {', '.join(f'{columns[column]} AS {column}' for column in selected)}
+        FROM {spec['source']}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {', '.join(f'{expression} {direction}' for _, expression in spec['order'])}
+        LIMIT :limit
+    ''', params)
+    rows = [dict(zip(selected, row)) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column] for column in key_columns])
+    if len(selected) > len(fields):
+        rows = [{field: row[field] for field in fields} for row in rows]
+    return rows, next_cursor
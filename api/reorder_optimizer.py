@@ -0,0 +1,194 @@
+"""
+Reorder-point and par-level optimizer
+Derives safety stock, reorder point and order-up-to level for every item from
+the daily usage history and supplier lead times, in one vectorized pass
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+
+from inventory_context import get_table_versions
+
+# Days of history the usage mean and variance are taken over
+HISTORY_DAYS = int(os.getenv('REORDER_HISTORY_DAYS', '56'))
+# Used for suppliers without a row in supplier_lead_times
+DEFAULT_LEAD_TIME_DAYS = float(os.getenv('DEFAULT_LEAD_TIME_DAYS', '3'))
+DEFAULT_LEAD_TIME_STD_DAYS = float(os.getenv('DEFAULT_LEAD_TIME_STD_DAYS', '1'))
+DEFAULT_SERVICE_LEVEL = 0.95
+# Days between orders; stock is topped up to cover one period past the reorder point
+DEFAULT_REVIEW_DAYS = 7
+# Everything that takes stock off the shelf
+OUTFLOW_TYPES = ('usage', 'waste', 'donation')
+
+# Service levels are rounded to this many decimals, so near-identical values share a plan
+SERVICE_LEVEL_DECIMALS = 3
+# Plans kept per version stamp, least recently used dropped first
+PLAN_CACHE_SIZE = 8
+
+# (service_level, review_days) -> plan, all for the version stamp in _plan_stamp
+_plan_cache = {}
+_plan_stamp = None
+_plan_lock = threading.Lock()
+
+
+def _load_items(cursor):
+    cursor.execute('''
+        SELECT id, name, unit, supplier, current_quantity, cost_per_unit, min_quantity, max_quantity
+        FROM inventory
+        ORDER BY id
+    ''')
+    return cursor.fetchall()
+
+
+def _load_usage_moments(cursor, today):
+    """Per item sum and sum of squares of daily outflow over the history window"""
+    cursor.execute(f'''
+        SELECT inventory_id, SUM(quantity), SUM(quantity * quantity)
+        FROM (
+            SELECT inventory_id, day, SUM(quantity) AS quantity
+            FROM daily_item_rollup
+            WHERE day > ? AND day <= ?
+            AND transaction_type IN ({', '.join('?' * len(OUTFLOW_TYPES))})
+            GROUP BY inventory_id, day
+        )
+        GROUP BY inventory_id
+    ''', ((today - timedelta(days=HISTORY_DAYS)).isoformat(), today.isoformat(), *OUTFLOW_TYPES))
+    return cursor.fetchall()
+
+
+def _load_lead_times(cursor):
+    cursor.execute('SELECT supplier, lead_time_days, lead_time_std_days FROM supplier_lead_times')
+    return {supplier: (days, std_days) for supplier, days, std_days in cursor.fetchall()}
+
+
+def compute_reorder_plan(cursor, service_level=DEFAULT_SERVICE_LEVEL, review_days=DEFAULT_REVIEW_DAYS, today=None):
+    """Reorder parameters for every item
+
+    With daily outflow mean d and deviation s_d, and lead time mean L and
+    deviation s_L, safety stock is z * sqrt(L * s_d^2 + d^2 * s_L^2), the
+    reorder point is d * L plus safety stock, and the order-up-to level adds
+    review_days of usage. Items with no outflow in the window keep their
+    hand-entered min and max quantities.
+    """
+    if not 0.5 <= service_level < 1:
+        raise ValueError("service_level must be at least 0.5 and below 1")
+    if not 1 <= review_days <= 90:
+        raise ValueError("review_days must be between 1 and 90")
+
+    today = today or datetime.now().date()
+    items = _load_items(cursor)
+    if not items:
+        return []
+    ids = np.fromiter((row[0] for row in items), dtype=np.int64, count=len(items))
+
+    def numeric_column(index):
+        return np.fromiter((row[index] or 0 for row in items), dtype=np.float64, count=len(items))
+
+    on_hand = numeric_column(4)
+    cost_per_unit = numeric_column(5)
+    min_quantity = numeric_column(6)
+    max_quantity = numeric_column(7)
+
+    # Scatter the per-item moments into item order; items without history stay 0
+    total = np.zeros(len(items))
+    total_squares = np.zeros(len(items))
+    moments = _load_usage_moments(cursor, today)
+    if moments:
+        moment_ids = np.array([row[0] for row in moments], dtype=np.int64)
+        positions = np.searchsorted(ids, moment_ids)
+        found = (positions < len(ids)) & (ids[np.minimum(positions, len(ids) - 1)] == moment_ids)
+        total[positions[found]] = np.array([row[1] for row in moments], dtype=np.float64)[found]
+        total_squares[positions[found]] = np.array([row[2] for row in moments], dtype=np.float64)[found]
+
+    # Days without any outflow count as zero-usage days
+    daily_mean = total / HISTORY_DAYS
+    daily_variance = np.maximum(total_squares / HISTORY_DAYS - daily_mean ** 2, 0) * HISTORY_DAYS / (HISTORY_DAYS - 1)
+
+    lead_times = _load_lead_times(cursor)
+    supplier_lead_times = [lead_times.get(row[3], (DEFAULT_LEAD_TIME_DAYS, DEFAULT_LEAD_TIME_STD_DAYS)) for row in items]
+    lead_time = np.array([entry[0] for entry in supplier_lead_times], dtype=np.float64)
+    lead_time_std = np.array([entry[1] for entry in supplier_lead_times], dtype=np.float64)
+
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * np.sqrt(lead_time * daily_variance + daily_mean ** 2 * lead_time_std ** 2)
+    has_history = total > 0
+    reorder_point = np.where(has_history, daily_mean * lead_time + safety_stock, min_quantity)
+    order_up_to = np.where(has_history, reorder_point + daily_mean * review_days, np.maximum(max_quantity, min_quantity))
+    needs_order = on_hand <= reorder_point
+    order_quantity = np.where(needs_order, np.maximum(order_up_to - on_hand, 0), 0)
+
+    columns = {
+        'current_quantity': on_hand.round(2),
+        'daily_usage': daily_mean.round(3),
+        'daily_usage_std': np.sqrt(daily_variance).round(3),
+        'lead_time_days': lead_time,
+        'safety_stock': safety_stock.round(2),
+        'reorder_point': reorder_point.round(2),
+        'order_up_to': order_up_to.round(2),
+        'order_quantity': order_quantity.round(2),
+        'estimated_cost': (order_quantity * cost_per_unit).round(2)
+    }
+    # Convert whole columns at once; per-element float() is the slow part at 50k items
+    values = [column.tolist() for column in columns.values()]
+    plan = []
+    for row, computed, from_history in zip(items, zip(*values), has_history.tolist()):
+        item = {'id': row[0], 'name': row[1], 'unit': row[2], 'supplier': row[3]}
+        item.update(zip(columns, computed))
+        item['source'] = 'history' if from_history else 'manual'
+        plan.append(item)
+    return plan
+
+
+def get_reorder_plan(cursor, service_level=DEFAULT_SERVICE_LEVEL, review_days=DEFAULT_REVIEW_DAYS):
+    """Reorder plan, cached until inventory, transactions or lead times change
+
+    Only the current version stamp's plans are kept, at most PLAN_CACHE_SIZE
+    of them. The plan is computed outside the lock, so a slow computation
+    does not hold up requests for other plans.
+    """
+    global _plan_stamp
+    service_level = round(service_level, SERVICE_LEVEL_DECIMALS)
+    versions = get_table_versions(cursor, ('inventory', 'inventory_transactions', 'supplier_lead_times'))
+    stamp = (versions, datetime.now().date().isoformat())
+    cache_key = (service_level, review_days)
+    with _plan_lock:
+        if _plan_stamp == stamp and cache_key in _plan_cache:
+            # Move to the end, so it is dropped last
+            plan = _plan_cache.pop(cache_key)
+            _plan_cache[cache_key] = plan
+            return plan
+
+    plan = compute_reorder_plan(cursor, service_level, review_days)
+
+    with _plan_lock:
+        if _plan_stamp != stamp:
+            _plan_cache.clear()
+            _plan_stamp = stamp
+        _plan_cache[cache_key] = plan
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            del _plan_cache[next(iter(_plan_cache))]
+    return plan
+
+
+def purchase_suggestions(plan):
+    """Items at or below their reorder point, grouped by supplier"""
+    suppliers = {}
+    for item in plan:
+        if item['order_quantity'] <= 0:
+            continue
+        supplier = suppliers.setdefault(item['supplier'] or 'Unknown', {
+            'supplier': item['supplier'] or 'Unknown',
+            'items': [],
+            'estimated_cost': 0
+        })
+        supplier['items'].append(item)
+        supplier['estimated_cost'] += item['estimated_cost']
+
+    for supplier in suppliers.values():
+        supplier['estimated_cost'] = round(supplier['estimated_cost'], 2)
+        supplier['items'].sort(key=lambda item: item['current_quantity'] - item['reorder_point'])
+    return sorted(suppliers.values(), key=lambda supplier: -supplier['estimated_cost'])
@@ -0,0 +1,208 @@
+"""
+Waste forecasting and expiry-risk scoring
+Projects how much of each item's stock will be wasted over the next few days
+from stock levels, expiration dates, recent usage and waste rates and the
+ingredient demand of recent dish predictions, and stores one score row per item
+
+Usage: python waste_forecast.py [--horizon 7]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+DB_PATH = 'demand_history.db'
+
+HORIZON_DAYS = int(os.getenv('WASTE_FORECAST_HORIZON_DAYS', '7'))
+# How often the scheduled job rescores every item
+INTERVAL_SECONDS = int(os.getenv('WASTE_FORECAST_INTERVAL_SECONDS', '3600'))
+# Trailing window the usage and waste rates are averaged over
+RATE_WINDOW_DAYS = 28
+# Dish predictions are weekly order counts; only recent ones count as demand
+DEMAND_LOOKBACK_DAYS = 14
+DEMAND_PERIOD_DAYS = 7
+# Share of an item's stock expected to be wasted before it is offered for donation
+DONATION_RISK_THRESHOLD = 0.25
+
+SCORE_COLUMNS = [
+    'inventory_id', 'horizon_days', 'current_quantity', 'daily_usage', 'daily_demand',
+    'daily_waste', 'days_to_expiry', 'days_of_cover', 'expected_waste',
+    'expected_waste_value', 'risk_score'
+]
+
+
+def _load_items(cursor):
+    cursor.execute('SELECT id, name, unit, current_quantity, cost_per_unit, expiration_date FROM inventory')
+    items = pd.DataFrame.from_records(
+        cursor.fetchall(),
+        columns=['inventory_id', 'name', 'unit', 'quantity', 'cost_per_unit', 'expiration_date']
+    )
+    items['key'] = items['name'].fillna('').str.strip().str.lower()
+    items['unit_key'] = items['unit'].fillna('').str.strip().str.lower()
+    return items
+
+
+def _load_rates(cursor, today):
+    """Average daily usage and waste per item over the trailing window"""
+    cursor.execute('''
+        SELECT inventory_id, transaction_type, SUM(quantity)
+        FROM daily_item_rollup
+        WHERE day > ? AND day <= ? AND transaction_type IN ('usage', 'waste')
+        GROUP BY inventory_id, transaction_type
+    ''', ((today - timedelta(days=RATE_WINDOW_DAYS)).isoformat(), today.isoformat()))
+    rates = pd.DataFrame.from_records(cursor.fetchall(), columns=['inventory_id', 'transaction_type', 'quantity'])
+    rates = rates.pivot_table(index='inventory_id', columns='transaction_type', values='quantity', aggfunc='sum')
+    return rates.reindex(columns=['usage', 'waste']).fillna(0) / RATE_WINDOW_DAYS
+
+
+def _load_demand(cursor, today):
+    """Predicted daily ingredient demand keyed by (name, unit)
+
+    Uses the latest analysis of each dish from the lookback window; each one
+    covers DEMAND_PERIOD_DAYS of predicted orders.
+    """
+    cursor.execute('''
+        SELECT LOWER(COALESCE(d.dish_name, '')), LOWER(COALESCE(d.major_ingredients, '')), a.analysis
+        FROM demand_calculations d
+        JOIN demand_analyses a ON a.calculation_id = d.id
+        WHERE d.created_at >= ?
+        ORDER BY d.updated_at DESC
+    ''', ((today - timedelta(days=DEMAND_LOOKBACK_DAYS)).isoformat(),))
+
+    seen = set()
+    ingredients = []
+    for dish_name, major_ingredients, analysis in cursor.fetchall():
+        if (dish_name, major_ingredients) in seen:
+            continue
+        seen.add((dish_name, major_ingredients))
+        try:
+            analysis = json.loads(analysis)
+        except json.JSONDecodeError:
+            continue
+        for ingredient in analysis.get('ingredients', []) if isinstance(analysis, dict) else []:
+            quantity = ingredient.get('quantity')
+            if ingredient.get('name') and isinstance(quantity, (int, float)) and quantity > 0:
+                ingredients.append((
+                    str(ingredient['name']).strip().lower(),
+                    str(ingredient.get('unit') or '').strip().lower(),
+                    quantity
+                ))
+
+    demand = pd.DataFrame.from_records(ingredients, columns=['key', 'unit_key', 'quantity'])
+    return demand.groupby(['key', 'unit_key'], as_index=False)['quantity'].sum().assign(
+        quantity=lambda frame: frame['quantity'] / DEMAND_PERIOD_DAYS
+    )
+
+
+def _match_demand(items, demand):
+    """Daily demand per item, matched on name and on unit when both name one"""
+    if demand.empty:
+        return np.zeros(len(items))
+    matched = items[['key', 'unit_key']].reset_index().merge(demand, on='key', how='inner')
+    same_unit = (matched['unit_key_x'] == matched['unit_key_y']) | (matched['unit_key_x'] == '') | (matched['unit_key_y'] == '')
+    per_item = matched[same_unit].groupby('index')['quantity'].sum()
+    return per_item.reindex(items.index, fill_value=0).to_numpy(dtype=float)
+
+
+def compute_waste_scores(cursor, horizon_days=HORIZON_DAYS, today=None):
+    """Expected waste over the next horizon_days for every item, in one vectorized pass
+
+    Stock is drawn down at the larger of the recent usage rate and predicted
+    demand, and loses the recent waste rate on top. Whatever is left when an
+    item expires inside the horizon counts as waste. risk_score is the share
+    of current stock expected to be wasted.
+    """
+    today = today or datetime.now().date()
+    items = _load_items(cursor)
+    rates = _load_rates(cursor, today).reindex(items['inventory_id']).fillna(0)
+
+    quantity = np.clip(items['quantity'].fillna(0).to_numpy(dtype=float), 0, None)
+    usage_rate = rates['usage'].to_numpy(dtype=float)
+    waste_rate = rates['waste'].to_numpy(dtype=float)
+    demand_rate = _match_demand(items, _load_demand(cursor, today))
+    consumption_rate = np.maximum(usage_rate, demand_rate)
+
+    expires = pd.to_datetime(items['expiration_date'].astype(str).str[:10], format='%Y-%m-%d', errors='coerce')
+    days_to_expiry = ((expires - pd.Timestamp(today)).dt.days).to_numpy(dtype=float)
+    expires_in_horizon = days_to_expiry <= horizon_days
+    # Days the stock is usable within the horizon
+    usable_days = np.where(np.isnan(days_to_expiry), horizon_days, np.clip(days_to_expiry, 0, horizon_days))
+
+    routine_waste = np.minimum(waste_rate * usable_days, quantity)
+    consumed = np.minimum(consumption_rate * usable_days, quantity - routine_waste)
+    expired_waste = np.where(expires_in_horizon, quantity - routine_waste - consumed, 0)
+    expected_waste = routine_waste + expired_waste
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_score = np.where(quantity > 0, expected_waste / quantity, 0)
+        days_of_cover = np.where(consumption_rate > 0, quantity / consumption_rate, np.nan)
+
+    scores = pd.DataFrame({
+        'inventory_id': items['inventory_id'],
+        'horizon_days': horizon_days,
+        'current_quantity': quantity,
+        'daily_usage': usage_rate.round(3),
+        'daily_demand': demand_rate.round(3),
+        'daily_waste': waste_rate.round(3),
+        'days_to_expiry': days_to_expiry,
+        'days_of_cover': days_of_cover.round(1),
+        'expected_waste': expected_waste.round(2),
+        'expected_waste_value': (expected_waste * items['cost_per_unit'].fillna(0).to_numpy(dtype=float)).round(2),
+        'risk_score': risk_score.round(4)
+    }, columns=SCORE_COLUMNS)
+    return scores.astype(object).where(scores.notna(), None)
+
+
+def write_waste_scores(conn, scores):
+    """Replace the stored scores in one transaction"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM waste_risk_scores')
+    cursor.executemany(f'''
+        INSERT INTO waste_risk_scores ({', '.join(SCORE_COLUMNS)})
+        VALUES ({', '.join('?' * len(SCORE_COLUMNS))})
+    ''', scores.itertuples(index=False, name=None))
+    conn.commit()
+
+
+def run_waste_forecast(conn, horizon_days=HORIZON_DAYS):
+    """Score every item and store the results, returning the number scored"""
+    scores = compute_waste_scores(conn.cursor(), horizon_days)
+    write_waste_scores(conn, scores)
+    return len(scores)
+
+
+def get_waste_risk(cursor, limit=20, min_score=0):
+    """Highest-risk items from the last scoring run, read through the risk index"""
+    cursor.execute('''
+        SELECT w.inventory_id, i.name, i.unit, i.category, w.current_quantity, w.days_to_expiry,
+               w.days_of_cover, w.daily_usage, w.daily_demand, w.expected_waste,
+               w.expected_waste_value, w.risk_score, w.horizon_days, w.computed_at
+        FROM waste_risk_scores w
+        JOIN inventory i ON w.inventory_id = i.id
+        WHERE w.risk_score > ?
+        ORDER BY w.risk_score DESC
+        LIMIT ?
+    ''', (min_score, limit))
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every inventory item for expected waste")
+    parser.add_argument('--horizon', type=int, default=HORIZON_DAYS, help="Days to project ahead")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database path")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    scored = run_waste_forecast(conn, args.horizon)
+    conn.close()
+    print(f"Scored {scored} items over the next {args.horizon} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Sliding-window top-K of wasted items
+Keeps per-day waste totals in memory, updated as waste transactions are
+recorded, so the most-wasted list is served without querying the database
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+DB_PATH = 'demand_history.db'
+
+# Longest window a request may ask for; older days are dropped
+MAX_WINDOW_DAYS = int(os.getenv('WASTE_TRACKER_MAX_DAYS', '90'))
+# How often reads check table_versions for writes made outside this process
+RESYNC_SECONDS = int(os.getenv('WASTE_TRACKER_RESYNC_SECONDS', '30'))
+RANKINGS = ('quantity', 'cost')
+_EPSILON = 1e-9
+
+
+class WindowTotals:
+    """Per-item waste totals for one window length, kept sorted for each ranking"""
+
+    def __init__(self, days):
+        self.days = days
+        self.totals = {}
+        # Sorted lists of (-value, item_id), so the first K entries are the top K
+        self.orders = {ranking: [] for ranking in RANKINGS}
+
+    def add(self, item_id, quantity, cost):
+        old = self.totals.get(item_id)
+        if old:
+            for ranking, value in zip(RANKINGS, old):
+                order = self.orders[ranking]
+                del order[bisect_left(order, (-value, item_id))]
+            quantity += old[0]
+            cost += old[1]
+
+        if abs(quantity) < _EPSILON and abs(cost) < _EPSILON:
+            self.totals.pop(item_id, None)
+            return
+        self.totals[item_id] = (quantity, cost)
+        for ranking, value in zip(RANKINGS, (quantity, cost)):
+            insort(self.orders[ranking], (-value, item_id))
+
+    def top(self, limit, ranking):
+        """The top entries as (item_id, quantity, cost), O(limit)"""
+        return [(item_id, *self.totals[item_id]) for _, item_id in self.orders[ranking][:limit]]
+
+
+class WasteTracker:
+    """Waste per day and item for the last MAX_WINDOW_DAYS days
+
+    Windows are relative to today (UTC): a 7-day window is today and the six
+    days before it. Each requested window length keeps its own sorted totals,
+    which are adjusted as transactions arrive and as days enter and expire.
+    Waste dated after today is held until its day enters the windows.
+    """
+
+    def __init__(self, max_days=MAX_WINDOW_DAYS):
+        self.max_days = max_days
+        self.days = {}
+        self.items = {}
+        self.windows = {}
+        self.today = None
+        self.loaded = False
+        self.expected_version = None
+        self.checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def load(self, cursor):
+        """Rebuild from the daily rollup"""
+        with self._lock:
+            today = datetime.utcnow().date()
+            cursor.execute('''
+                SELECT r.day, r.inventory_id, i.name, i.unit,
+                       SUM(r.quantity), SUM(r.value)
+                FROM daily_item_rollup r
+                JOIN inventory i ON r.inventory_id = i.id
+                WHERE r.transaction_type = 'waste'
+                AND r.day >= ?
+                GROUP BY r.day, r.inventory_id
+            ''', ((today - timedelta(days=self.max_days - 1)).isoformat(),))
+
+            self.days = {}
+            self.items = {}
+            self.windows = {}
+            self.today = today
+            for day, item_id, name, unit, quantity, cost in cursor.fetchall():
+                self.items[item_id] = (name, unit)
+                self.days.setdefault(day, {})[item_id] = (quantity, cost)
+
+            cursor.execute("SELECT version FROM table_versions WHERE table_name = 'inventory_transactions'")
+            row = cursor.fetchone()
+            self.expected_version = row[0] if row else 0
+            self.checked_at = time.monotonic()
+            self.loaded = True
+
+    def invalidate(self):
+        """Force a reload before the next read, e.g. after transactions are deleted"""
+        with self._lock:
+            self.loaded = False
+
+    def _window(self, days):
+        window = self.windows.get(days)
+        if window is None:
+            window = WindowTotals(days)
+            first_day = (self.today - timedelta(days=days - 1)).isoformat()
+            today = self.today.isoformat()
+            for day, items in self.days.items():
+                if first_day <= day <= today:
+                    for item_id, (quantity, cost) in items.items():
+                        window.add(item_id, quantity, cost)
+            self.windows[days] = window
+        return window
+
+    def _advance(self, today):
+        """Move each window forward: add the days that entered it and expire those that left"""
+        if today <= self.today:
+            return
+        for window in self.windows.values():
+            day = self.today + timedelta(days=1)
+            while day <= today:
+                for item_id, (quantity, cost) in self.days.get(day.isoformat(), {}).items():
+                    window.add(item_id, quantity, cost)
+                day += timedelta(days=1)
+            old_first = self.today - timedelta(days=window.days - 1)
+            new_first = today - timedelta(days=window.days - 1)
+            day = old_first
+            while day < new_first:
+                for item_id, (quantity, cost) in self.days.get(day.isoformat(), {}).items():
+                    window.add(item_id, -quantity, -cost)
+                day += timedelta(days=1)
+        cutoff = (today - timedelta(days=self.max_days - 1)).isoformat()
+        self.days = {day: items for day, items in self.days.items() if day >= cutoff}
+        self.today = today
+
+    def record(self, item_id, name, unit, day, quantity, cost):
+        """Add one waste transaction"""
+        with self._lock:
+            self.expected_version = (self.expected_version or 0) + 1
+            if not self.loaded:
+                return
+            self._advance(datetime.utcnow().date())
+            day = str(day)[:10]
+            if day < (self.today - timedelta(days=self.max_days - 1)).isoformat():
+                return
+
+            self.items[item_id] = (name, unit)
+            items = self.days.setdefault(day, {})
+            old_quantity, old_cost = items.get(item_id, (0, 0))
+            items[item_id] = (old_quantity + quantity, old_cost + cost)
+
+            if day > self.today.isoformat():
+                # Added to the windows by _advance once its day arrives
+                return
+            for window in self.windows.values():
+                if day >= (self.today - timedelta(days=window.days - 1)).isoformat():
+                    window.add(item_id, quantity, cost)
+
+    def note_write(self):
+        """Account for a non-waste transaction insert made by this process"""
+        with self._lock:
+            self.expected_version = (self.expected_version or 0) + 1
+
+    def apply(self, change):
+        """Account for a committed transaction insert
+
+        change is record()'s arguments for a waste transaction and None for
+        any other, as returned by record_transaction.
+        """
+        if change is None:
+            self.note_write()
+        else:
+            self.record(*change)
+
+    def _ensure_fresh(self):
+        """Reload if never loaded, invalidated, or written to by another process"""
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < RESYNC_SECONDS:
+            return
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            cursor = conn.cursor()
+            if self.loaded:
+                self.checked_at = now
+                cursor.execute("SELECT version FROM table_versions WHERE table_name = 'inventory_transactions'")
+                row = cursor.fetchone()
+                if row and row[0] == self.expected_version:
+                    return
+            self.load(cursor)
+        finally:
+            conn.close()
+
+    def most_wasted(self, days=7, limit=10, ranking='quantity'):
+        """Top wasted items over the last `days` days"""
+        if ranking not in RANKINGS:
+            raise ValueError(f"by must be one of {', '.join(RANKINGS)}")
+        if not 1 <= days <= self.max_days:
+            raise ValueError(f"days must be between 1 and {self.max_days}")
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        with self._lock:
+            self._ensure_fresh()
+            self._advance(datetime.utcnow().date())
+            most_wasted = []
+            for item_id, quantity, cost in self._window(days).top(limit, ranking):
+                name, unit = self.items.get(item_id, (None, None))
+                most_wasted.append({
+                    'name': name,
+                    'unit': unit,
+                    'quantity': round(quantity, 2),
+                    'cost_per_unit': round(cost / quantity, 2) if quantity else 0,
+                    'total_cost': round(cost, 2)
+                })
+            return most_wasted
+
+
+waste_tracker = WasteTracker()
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import Header from './Header';
 import PieChart from './charts/PieChart';
 import BarChart from './charts/BarChart';
@@ -7,10 +7,56 @@ import RawData from './RawData';
 import './AnalyticsDashboard.css';
 
 const AnalyticsDashboard = ({ currentPage, onPageChange }) => {
+  const [snapshot, setSnapshot] = useState(null);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState(null);
+
+  // One request for every chart; the browser revalidates it with the ETag,
+  // so polls that find nothing new come back as an empty 304
+  const fetchSnapshot = async () => {
+    try {
+      const response = await fetch('http://127.0.0.1:5000/api/analytics/snapshot');
+      if (response.ok) {
+        setSnapshot(await response.json());
+        setError(null);
+      } else {
+        throw new Error('Failed to fetch analytics data');
+      }
+    } catch (err) {
+      console.error('Error fetching analytics snapshot:', err);
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  useEffect(() => {
+    fetchSnapshot();
+
+    // Auto-refresh every 30 seconds to catch new transactions
+    const interval = setInterval(fetchSnapshot, 30000);
+
+    // Refresh when other tabs or components update inventory
+    const handleStorageChange = (e) => {
+      if (e.key === 'inventory_updated') {
+        fetchSnapshot();
+      }
+    };
+
+    window.addEventListener('storage', handleStorageChange);
+    window.addEventListener('inventoryUpdated', fetchSnapshot);
+
+    return () => {
+      clearInterval(interval);
+      window.removeEventListener('storage', handleStorageChange);
+      window.removeEventListener('inventoryUpdated', fetchSnapshot);
+    };
+  }, []);
+
   return (
     <div className="analytics-dashboard">
       <Header currentPage={currentPage} onPageChange={onPageChange} />
-      
+
       <main className="main-content">
         <div className="container">
           <div className="page-header">
@@ -20,18 +66,23 @@ const AnalyticsDashboard = ({ currentPage, onPageChange }) => {
           <div className="charts-section">
             <div className="charts-grid">
               <div className="chart-item">
-                <PieChart />
+                <PieChart data={snapshot?.this_week} loading={loading} error={error} />
               </div>
               <div className="chart-item">
-                <BarChart />
+                <BarChart data={snapshot?.weekly_trends} loading={loading} error={error} />
               </div>
               <div className="chart-item">
-                <LineChart />
+                <LineChart data={snapshot?.financial_optimization} loading={loading} error={error} />
               </div>
             </div>
           </div>
 
-          <RawData />
+          <RawData
+            weeks={snapshot?.raw_data}
+            mostWasted={snapshot?.most_wasted}
+            loading={loading}
+            error={error}
+          />
         </div>
       </main>
     </div>
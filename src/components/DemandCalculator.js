@@ -4,6 +4,7 @@ import DishInfo from './DishInfo';
 import RestaurantInfo from './RestaurantInfo';
 import FormInput from './FormInput';
 import PastDemandChart from './PastDemandChart';
+import { resolveJob } from '../jobs';
 import './DemandCalculator.css';
 
 
@@ -92,7 +93,7 @@ const DemandCalculator = ({ currentPage, onPageChange }) => {
         throw new Error("Failed to analyze ingredients");
       }
       
-      const result = await response.json();
+      const result = await resolveJob(response);
       console.log("Ingredient analysis:", result);
       setIngredientAnalysis(result);
     }
@@ -3,6 +3,7 @@ import Header from './Header';
 import ChatMessage from './chatbot/ChatMessage';
 import ChatInput from './chatbot/ChatInput';
 import InventoryTable from './inventory/InventoryTable';
+import { resolveJob } from '../jobs';
 import './InventoryBot.css';
 
 const InventoryBot = ({ currentPage, onPageChange }) => {
@@ -92,7 +93,7 @@ const InventoryBot = ({ currentPage, onPageChange }) => {
         });
 
         if (response.ok) {
-          const result = await response.json();
+          const result = await resolveJob(response);
           setAiRecommendations(result);
           
           // Format recommendations for display
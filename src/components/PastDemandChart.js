@@ -6,6 +6,8 @@ const PastDemandChart = () => {
   const [loading, setLoading] = useState(true);
   const [recalculating, setRecalculating] = useState({});
   const [deleting, setDeleting] = useState({});
+  // Ingredient analyses by calculation id, loaded when a row asks for them
+  const [analyses, setAnalyses] = useState({});
 
   useEffect(() => {
     fetchDemandHistory();
@@ -13,11 +15,19 @@ const PastDemandChart = () => {
 
   const fetchDemandHistory = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/api/demand-history');
-      if (response.ok) {
-        const data = await response.json();
-        setDemandHistory(data);
-      }
+      // The summary listing leaves out the analyses, so pages stay small
+      const history = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ view: 'summary', limit: '1000' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`http://127.0.0.1:5000/api/demand-history?${params}`);
+        if (!response.ok) return;
+        const page = await response.json();
+        history.push(...page.items);
+        cursor = page.next_cursor;
+      } while (cursor);
+      setDemandHistory(history);
     } catch (error) {
       console.error('Error fetching demand history:', error);
     } finally {
@@ -91,6 +101,53 @@ const PastDemandChart = () => {
     }
   };
 
+  const loadAnalysis = async (calculationId) => {
+    setAnalyses(prev => ({ ...prev, [calculationId]: 'loading' }));
+    
+    try {
+      const response = await fetch(`http://127.0.0.1:5000/api/demand-history/${calculationId}`);
+      const data = response.ok ? await response.json() : null;
+      setAnalyses(prev => ({ ...prev, [calculationId]: data?.ingredient_analysis || null }));
+    } catch (error) {
+      console.error('Error fetching ingredient analysis:', error);
+      setAnalyses(prev => ({ ...prev, [calculationId]: null }));
+    }
+  };
+
+  const renderIngredients = (item) => {
+    const analysis = analyses[item.id];
+    if (item.has_analysis && analysis === undefined) {
+      return (
+        <button className="show-ingredients-btn" onClick={() => loadAnalysis(item.id)}>
+          Show ingredients
+        </button>
+      );
+    }
+    if (analysis === 'loading') {
+      return <span className="no-analysis">Loading...</span>;
+    }
+    if (!analysis || !analysis.ingredients) {
+      return <span className="no-analysis">No analysis available</span>;
+    }
+    return (
+      <div className="ingredients-list">
+        {analysis.ingredients.slice(0, 3).map((ingredient, index) => (
+          <div key={index} className="ingredient-item">
+            <span className="ingredient-name">{ingredient.name}</span>
+            <span className="ingredient-quantity">
+              {ingredient.quantity} {ingredient.unit}
+            </span>
+          </div>
+        ))}
+        {analysis.ingredients.length > 3 && (
+          <div className="more-ingredients">
+            +{analysis.ingredients.length - 3} more
+          </div>
+        )}
+      </div>
+    );
+  };
+
   const formatDate = (dateString) => {
     return new Date(dateString).toLocaleDateString('en-US', {
       year: 'numeric',
@@ -176,25 +233,7 @@ const PastDemandChart = () => {
                     </div>
                   </td>
                   <td className="ingredients-analysis">
-                    {item.ingredient_analysis && item.ingredient_analysis.ingredients ? (
-                      <div className="ingredients-list">
-                        {item.ingredient_analysis.ingredients.slice(0, 3).map((ingredient, index) => (
-                          <div key={index} className="ingredient-item">
-                            <span className="ingredient-name">{ingredient.name}</span>
-                            <span className="ingredient-quantity">
-                              {ingredient.quantity} {ingredient.unit}
-                            </span>
-                          </div>
-                        ))}
-                        {item.ingredient_analysis.ingredients.length > 3 && (
-                          <div className="more-ingredients">
-                            +{item.ingredient_analysis.ingredients.length - 3} more
-                          </div>
-                        )}
-                      </div>
-                    ) : (
-                      <span className="no-analysis">No analysis available</span>
-                    )}
+                    {renderIngredients(item)}
                   </td>
                   <td className="created-date">
                     <div className="date-info">
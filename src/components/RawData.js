@@ -1,12 +1,9 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import './RawData.css';
 
-const RawData = () => {
+const RawData = ({ weeks = [], mostWasted = [], loading = false, error = null }) => {
   const [selectedWeek, setSelectedWeek] = useState(1);
-  const [weekData, setWeekData] = useState(null);
-  const [mostWasted, setMostWasted] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState(null);
+  const weekData = weeks.find(week => week.week_number === selectedWeek);
 
   const weekOptions = [
     { value: 1, label: 'Current Week' },
@@ -16,79 +13,6 @@ const RawData = () => {
     { value: 5, label: 'Week -4' }
   ];
 
-  const fetchData = async () => {
-    try {
-      setLoading(true);
-      
-      // Fetch week data
-      const weekResponse = await fetch(`http://127.0.0.1:5000/api/analytics/raw-data/${selectedWeek}`);
-      if (weekResponse.ok) {
-        const weekDataResult = await weekResponse.json();
-        setWeekData(weekDataResult);
-      } else {
-        throw new Error('Failed to fetch week data');
-      }
-
-      // Fetch most wasted food (always for current week)
-      const wastedResponse = await fetch('http://127.0.0.1:5000/api/analytics/most-wasted');
-      if (wastedResponse.ok) {
-        const wastedData = await wastedResponse.json();
-        setMostWasted(wastedData);
-      } else {
-        throw new Error('Failed to fetch most wasted data');
-      }
-    } catch (err) {
-      console.error('Error fetching data:', err);
-      setError(err.message);
-      // Set fallback data
-      setWeekData({
-        food_used_pct: 0,
-        food_wasted_pct: 0,
-        food_donated_pct: 0,
-        money_wasted: 0
-      });
-      setMostWasted([]);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchData();
-  }, [selectedWeek]);
-
-  // Auto-refresh every 30 seconds to catch new transactions
-  useEffect(() => {
-    const interval = setInterval(() => {
-      fetchData();
-    }, 30000); // 30 seconds
-
-    return () => clearInterval(interval);
-  }, [selectedWeek]);
-
-  // Listen for storage events (when other tabs/components update data)
-  useEffect(() => {
-    const handleStorageChange = (e) => {
-      if (e.key === 'inventory_updated') {
-        fetchData();
-      }
-    };
-
-    window.addEventListener('storage', handleStorageChange);
-    
-    // Also listen for custom events
-    const handleInventoryUpdate = () => {
-      fetchData();
-    };
-
-    window.addEventListener('inventoryUpdated', handleInventoryUpdate);
-
-    return () => {
-      window.removeEventListener('storage', handleStorageChange);
-      window.removeEventListener('inventoryUpdated', handleInventoryUpdate);
-    };
-  }, [selectedWeek]);
-
   if (loading) {
     return (
       <div className="raw-data-container">
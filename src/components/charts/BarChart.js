@@ -1,59 +1,22 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { BarChart as RechartsBarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Legend } from 'recharts';
 import './BarChart.css';
 
-const BarChart = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState(null);
-
-  const fetchWeeklyTrends = async () => {
-    try {
-      const response = await fetch('http://127.0.0.1:5000/api/analytics/weekly-trends');
-      if (response.ok) {
-        const chartData = await response.json();
-        setData(chartData);
-      } else {
-        throw new Error('Failed to fetch weekly trends data');
-      }
-    } catch (err) {
-      console.error('Error fetching weekly trends:', err);
-      setError(err.message);
-      // Fallback to sample data if API fails (reversed order: oldest to newest)
-      setData([
-        { week: 'Week -9', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -8', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -7', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -6', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -5', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -4', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -3', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -2', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Week -1', used: 0, wasted: 0, donated: 0, total: 0 },
-        { week: 'Current Week', used: 0, wasted: 0, donated: 0, total: 0 }
-      ]);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchWeeklyTrends();
-  }, []);
-
-  // Listen for inventory updates
-  useEffect(() => {
-    const handleInventoryUpdate = () => {
-      fetchWeeklyTrends();
-    };
-
-    window.addEventListener('inventoryUpdated', handleInventoryUpdate);
-
-    return () => {
-      window.removeEventListener('inventoryUpdated', handleInventoryUpdate);
-    };
-  }, []);
+// Shown until the dashboard snapshot has loaded
+const EMPTY_DATA = [
+  { week: 'Week -9', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -8', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -7', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -6', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -5', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -4', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -3', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -2', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Week -1', used: 0, wasted: 0, donated: 0, total: 0 },
+  { week: 'Current Week', used: 0, wasted: 0, donated: 0, total: 0 }
+];
 
+const BarChart = ({ data = EMPTY_DATA, loading = false, error = null }) => {
   if (loading) {
     return (
       <div className="bar-chart-container">
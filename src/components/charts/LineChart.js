@@ -1,59 +1,22 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { LineChart as RechartsLineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
 import './LineChart.css';
 
-const LineChart = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState(null);
-
-  const fetchFinancialData = async () => {
-    try {
-      const response = await fetch('http://127.0.0.1:5000/api/analytics/financial-optimization');
-      if (response.ok) {
-        const chartData = await response.json();
-        setData(chartData);
-      } else {
-        throw new Error('Failed to fetch financial optimization data');
-      }
-    } catch (err) {
-      console.error('Error fetching financial data:', err);
-      setError(err.message);
-      // Fallback to sample data if API fails (reversed order: oldest to newest)
-      setData([
-        { week: 'Week -9', moneyWasted: 0 },
-        { week: 'Week -8', moneyWasted: 0 },
-        { week: 'Week -7', moneyWasted: 0 },
-        { week: 'Week -6', moneyWasted: 0 },
-        { week: 'Week -5', moneyWasted: 0 },
-        { week: 'Week -4', moneyWasted: 0 },
-        { week: 'Week -3', moneyWasted: 0 },
-        { week: 'Week -2', moneyWasted: 0 },
-        { week: 'Week -1', moneyWasted: 0 },
-        { week: 'Current Week', moneyWasted: 0 }
-      ]);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchFinancialData();
-  }, []);
-
-  // Listen for inventory updates
-  useEffect(() => {
-    const handleInventoryUpdate = () => {
-      fetchFinancialData();
-    };
-
-    window.addEventListener('inventoryUpdated', handleInventoryUpdate);
-
-    return () => {
-      window.removeEventListener('inventoryUpdated', handleInventoryUpdate);
-    };
-  }, []);
+// Shown until the dashboard snapshot has loaded
+const EMPTY_DATA = [
+  { week: 'Week -9', moneyWasted: 0 },
+  { week: 'Week -8', moneyWasted: 0 },
+  { week: 'Week -7', moneyWasted: 0 },
+  { week: 'Week -6', moneyWasted: 0 },
+  { week: 'Week -5', moneyWasted: 0 },
+  { week: 'Week -4', moneyWasted: 0 },
+  { week: 'Week -3', moneyWasted: 0 },
+  { week: 'Week -2', moneyWasted: 0 },
+  { week: 'Week -1', moneyWasted: 0 },
+  { week: 'Current Week', moneyWasted: 0 }
+];
 
+const LineChart = ({ data = EMPTY_DATA, loading = false, error = null }) => {
   if (loading) {
     return (
       <div className="line-chart-container">
@@ -1,52 +1,15 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { PieChart as RechartsPieChart, Pie, Cell, ResponsiveContainer, Legend, Tooltip } from 'recharts';
 import './PieChart.css';
 
-const PieChart = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState(null);
-
-  const fetchThisWeekData = async () => {
-    try {
-      const response = await fetch('http://127.0.0.1:5000/api/analytics/this-week');
-      if (response.ok) {
-        const chartData = await response.json();
-        setData(chartData);
-      } else {
-        throw new Error('Failed to fetch this week\'s data');
-      }
-    } catch (err) {
-      console.error('Error fetching this week\'s data:', err);
-      setError(err.message);
-      // Fallback to sample data if API fails
-      setData([
-        { name: 'Food Used', value: 0, color: '#10B981' },
-        { name: 'Food Wasted', value: 0, color: '#EF4444' },
-        { name: 'Food Donated', value: 0, color: '#3B82F6' }
-      ]);
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchThisWeekData();
-  }, []);
-
-  // Listen for inventory updates
-  useEffect(() => {
-    const handleInventoryUpdate = () => {
-      fetchThisWeekData();
-    };
-
-    window.addEventListener('inventoryUpdated', handleInventoryUpdate);
-
-    return () => {
-      window.removeEventListener('inventoryUpdated', handleInventoryUpdate);
-    };
-  }, []);
+// Shown until the dashboard snapshot has loaded
+const EMPTY_DATA = [
+  { name: 'Food Used', value: 0, color: '#10B981' },
+  { name: 'Food Wasted', value: 0, color: '#EF4444' },
+  { name: 'Food Donated', value: 0, color: '#3B82F6' }
+];
 
+const PieChart = ({ data = EMPTY_DATA, loading = false, error = null }) => {
   const renderCustomizedLabel = ({ cx, cy, midAngle, innerRadius, outerRadius, percent }) => {
     if (percent < 0.05) return null; // Don't show labels for small slices
     
@@ -0,0 +1,27 @@
+const API_BASE = 'http://127.0.0.1:5000';
+
+// Slow AI endpoints answer 202 with a job id; wait for the job and return its result
+export const resolveJob = async (response) => {
+  if (response.status !== 202) {
+    const result = await response.json();
+    if (!response.ok) {
+      throw new Error(result.error || 'Request failed');
+    }
+    return result;
+  }
+
+  const { job_id: jobId } = await response.json();
+  while (true) {
+    const jobResponse = await fetch(`${API_BASE}/api/jobs/${jobId}?wait=25`);
+    const job = await jobResponse.json();
+    if (!jobResponse.ok) {
+      throw new Error(job.error || 'Failed to get job status');
+    }
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Job failed');
+    }
+  }
+};